@@ -1,5 +1,10 @@
 const NATIVE_HOST_NAME = "com.my_ai_app.native_host";
+// Messages larger than this travel as compressed chunks (see host.py).
+const NATIVE_INLINE_BYTES = 64 * 1024;
+const NATIVE_CHUNK_BYTES = 512 * 1024;
 let port;
+let nextChunkedId = 1;
+const incomingChunks = new Map();
 
 /**
  * Connects to the native messaging host and sets up listeners.
@@ -8,11 +13,18 @@ function connect() {
     console.log(`Attempting to connect to native host: ${NATIVE_HOST_NAME}`);
     port = chrome.runtime.connectNative(NATIVE_HOST_NAME);
 
-    port.onMessage.addListener((message) => {
+    port.onMessage.addListener(async (message) => {
+        if (message.chunk) {
+            message = await receiveChunk(message.chunk);
+            if (!message) return; // more chunks to come
+        }
         console.log("Received message from host:", message);
         if (message.command === 'execute_action_plan' && message.plan) {
             console.log("✅ Received Action Plan. Executing now.", message.plan);
             executeActionPlan(message.plan);
+        } else if (message.command === 'scan_page') {
+            // The host matches the result to the orchestrator request by this ID.
+            triggerScan(message.request_id, message.known);
         }
     });
 
@@ -22,6 +34,69 @@ function connect() {
     });
 }
 
+// --- Chunked native messages ---
+// Large messages are deflate-compressed (zlib format, what Python's zlib reads and
+// writes) and sent as base64 chunks, keeping every message far below Chrome's 1 MB
+// host -> extension cap. Incoming chunks are inflated as they arrive.
+
+function bytesToBase64(bytes) {
+    let binary = "";
+    for (let i = 0; i < bytes.length; i += 0x8000) {
+        binary += String.fromCharCode.apply(null, bytes.subarray(i, i + 0x8000));
+    }
+    return btoa(binary);
+}
+
+function base64ToBytes(text) {
+    const binary = atob(text);
+    const bytes = new Uint8Array(binary.length);
+    for (let i = 0; i < binary.length; i++) bytes[i] = binary.charCodeAt(i);
+    return bytes;
+}
+
+/**
+ * Sends a message to the native host, in compressed chunks if it is large.
+ * @param {Object} message
+ */
+async function postToHost(message) {
+    const body = new TextEncoder().encode(JSON.stringify(message));
+    if (body.length <= NATIVE_INLINE_BYTES) {
+        port.postMessage(message);
+        return;
+    }
+    const compressed = new Uint8Array(
+        await new Response(new Blob([body]).stream().pipeThrough(new CompressionStream("deflate"))).arrayBuffer()
+    );
+    const id = nextChunkedId++;
+    for (let seq = 0, start = 0; start < compressed.length; seq++, start += NATIVE_CHUNK_BYTES) {
+        port.postMessage({
+            chunk: {
+                id, seq, last: start + NATIVE_CHUNK_BYTES >= compressed.length, encoding: "deflate",
+                data: bytesToBase64(compressed.subarray(start, start + NATIVE_CHUNK_BYTES)),
+            },
+        });
+    }
+}
+
+/**
+ * Feeds one chunk from the host into its message's decompressor.
+ * @param {Object} chunk
+ * @returns {Promise<Object|null>} The whole message after its last chunk, else null.
+ */
+async function receiveChunk(chunk) {
+    let entry = incomingChunks.get(chunk.id);
+    if (!entry) {
+        const stream = chunk.encoding === "deflate" ? new DecompressionStream("deflate") : new TransformStream();
+        entry = { writer: stream.writable.getWriter(), text: new Response(stream.readable).text() };
+        incomingChunks.set(chunk.id, entry);
+    }
+    entry.writer.write(base64ToBytes(chunk.data));
+    if (!chunk.last) return null;
+    incomingChunks.delete(chunk.id);
+    await entry.writer.close();
+    return JSON.parse(await entry.text);
+}
+
 /**
  * Executes the action plan by injecting the domFiller script into the active tab.
  * @param {Array<Object>} plan The list of actions from the native host.
@@ -43,17 +118,20 @@ function executeActionPlan(plan) {
 /**
  * THIS FUNCTION IS INJECTED INTO THE WEBPAGE TO MANIPULATE THE DOM.
  * It is robust and will not stop if one action fails.
+ * Actions name their field by the handle contextualHtmlScanner tagged it with. The
+ * filler runs in every frame and only acts on the handles present in its own.
  * @param {Array<Object>} plan The action plan.
  */
 function domFiller(plan) {
     console.log("SecureFill DOM Filler activated with plan:", plan);
+    const fields = new Map();
+    document.querySelectorAll("[data-securefill-handle]").forEach(el => fields.set(el.dataset.securefillHandle, el));
 
     plan.forEach(action => {
         try {
-            const element = document.querySelector(action.selector);
+            const element = fields.get(action.handle);
             if (!element) {
-                console.warn(`SecureFill: Could not find element with selector: "${action.selector}"`);
-                return; // Use 'return' to skip this action and continue the loop
+                return; // The field is in another frame, or no longer on the page.
             }
 
             switch (action.action_type) {
@@ -67,7 +145,7 @@ function domFiller(plan) {
                     if (optionExists) {
                         element.value = action.value;
                     } else {
-                        console.warn(`SecureFill: Option "${action.value}" not found for selector "${action.selector}".`);
+                        console.warn(`SecureFill: Option "${action.value}" not found for field "${action.handle}".`);
                         return; // Skip if AI hallucinated an option
                     }
                     break;
@@ -77,7 +155,7 @@ function domFiller(plan) {
                     break;
                 
                 case "SELECT_RADIO":
-                    // The selector should be specific enough to target one radio button
+                    // Every radio button has its own handle
                     element.checked = true;
                     break;
 
@@ -89,21 +167,70 @@ function domFiller(plan) {
             // Dispatch events after changing the value to ensure frameworks like React/Angular detect the change.
             element.dispatchEvent(new Event('input', { bubbles: true }));
             element.dispatchEvent(new Event('change', { bubbles: true }));
-            console.log(`SecureFill: Successfully performed ${action.action_type} on "${action.selector}"`);
+            console.log(`SecureFill: Successfully performed ${action.action_type} on field "${action.handle}"`);
 
         } catch (error) {
             // This catch block ensures that if one action throws an unexpected error, the loop continues.
-            console.error(`SecureFill: Error performing action on selector "${action.selector}":`, error);
+            console.error(`SecureFill: Error performing action on field "${action.handle}":`, error);
         }
     });
     console.log("SecureFill: DOM Filler has completed its run.");
 }
 
 
+// --- Incremental scans ---
+// Each form control is identified by a fingerprint: the first 16 hex digits of the
+// SHA-256 of its handle and its field HTML (whitespace runs collapsed). The field HTML
+// leaves out what changes while the user works on the page (inline styles, the hidden
+// attribute, typed values), so a control only gets a new fingerprint if the control
+// itself changes. A scan sends every fingerprint on the page, but HTML only for those
+// the orchestrator does not already know, so each step of a multi-page form only
+// carries its new fields.
+
+/**
+ * @param {string} handle
+ * @param {string} html
+ * @returns {Promise<string>}
+ */
+async function fieldFingerprint(handle, html) {
+    const normalized = `${handle}\n${html.replace(/\s+/g, " ").trim()}`;
+    const digest = new Uint8Array(await crypto.subtle.digest("SHA-256", new TextEncoder().encode(normalized)));
+    return Array.from(digest.subarray(0, 8), b => b.toString(16).padStart(2, "0")).join("");
+}
+
+/**
+ * Fingerprints the scanned controls, keeping page order and dropping duplicates.
+ * @param {Array<Object>} controls [{handle, html}]
+ * @param {Set<string>} known Fingerprints whose HTML the orchestrator already has.
+ * @returns {Promise<Array<Object>>} [{fp, handle, html?}]
+ */
+async function scanDelta(controls, known) {
+    const fields = [];
+    const seen = new Set();
+    for (const { handle, html } of controls) {
+        const fp = await fieldFingerprint(handle, html);
+        if (seen.has(fp)) continue;
+        seen.add(fp);
+        fields.push(known.has(fp) ? { fp, handle } : { fp, handle, html });
+    }
+    return fields;
+}
+
+/**
+ * Tells the host a scan failed, so the waiting request fails now instead of timing out.
+ * @param {number} [requestId]
+ * @param {string} error
+ */
+function postScanError(requestId, error) {
+    if (requestId !== undefined) postToHost({ action: "contextual_scan_result", request_id: requestId, error });
+}
+
 /**
  * Scans the current page for form elements and sends them to the native host.
+ * @param {number} [requestId] The host's ID for the scan, echoed back with the result.
+ * @param {Array<string>} [known] Fingerprints the orchestrator already has the HTML of.
  */
-function triggerScan() {
+function triggerScan(requestId, known = []) {
     if (!port) {
         console.warn("Not connected to host, attempting to reconnect...");
         connect();
@@ -114,52 +241,79 @@ function triggerScan() {
             chrome.scripting.executeScript({
                 target: { tabId: tabs[0].id, allFrames: true },
                 function: contextualHtmlScanner,
-            }, (results) => {
+            }, async (results) => {
                 if (chrome.runtime.lastError) {
                     console.error("Scripting Error:", chrome.runtime.lastError.message);
+                    postScanError(requestId, chrome.runtime.lastError.message);
                     return;
                 }
-                const allSnippets = new Set();
+                const controls = [];
                 if (results) {
-                    results.forEach(res => res && res.result && res.result.forEach(snippet => allSnippets.add(snippet)));
+                    results.forEach(res => res && res.result && controls.push(...res.result));
                 }
-                console.log(`Scan complete, sending ${allSnippets.size} snippets to Python.`);
-                port.postMessage({ action: "contextual_scan_result", data: Array.from(allSnippets) });
+                const fields = await scanDelta(controls, new Set(known));
+                const changed = fields.filter(field => field.html !== undefined).length;
+                console.log(`Scan complete, sending ${fields.length} fields (${changed} new or changed) to Python.`);
+                postToHost({ action: "contextual_scan_result", request_id: requestId, data: fields });
             });
+        } else {
+            console.error("No active tab found to scan.");
+            postScanError(requestId, "No active tab found to scan.");
         }
     });
 }
 
+/**
+ * THIS FUNCTION IS INJECTED INTO EVERY FRAME to collect the form fields' context.
+ * Each field is first tagged with a short handle ("f17"; "f" plus a frame tag, such as
+ * "fk3-17", inside iframes) that it keeps across scans. A field's HTML is the control
+ * itself, without inline styles or a typed value, inside a <label> holding the text of
+ * its labels (and of its fieldset's legend).
+ * @returns {Array<Object>} [{handle, html}] in page order.
+ */
 function contextualHtmlScanner() {
     const selector = "input:not([type=hidden]), textarea, select";
     const elements = document.querySelectorAll(selector);
-    const contextualSnippets = new Set();
-    elements.forEach(el => {
-        const container = el.closest("fieldset, form, div");
-        if (container) {
-            const innerInputs = container.querySelectorAll(selector);
-            if (innerInputs.length > 2 && el.parentElement !== container) {
-                contextualSnippets.add(el.parentElement.outerHTML);
-            } else {
-                contextualSnippets.add(container.outerHTML);
-            }
-        } else if (el.parentElement) {
-            contextualSnippets.add(el.parentElement.outerHTML);
+    if (window.__secureFillPrefix === undefined) {
+        window.__secureFillPrefix = window === window.top ? "f" : `f${Math.random().toString(36).slice(2, 5)}-`;
+        window.__secureFillNextHandle = 1;
+    }
+    const escapeText = text => text.replace(/&/g, "&amp;").replace(/</g, "&lt;").replace(/>/g, "&gt;");
+    const labelText = el => {
+        const parts = [];
+        const legend = el.closest("fieldset")?.querySelector("legend");
+        if (legend) parts.push(legend.textContent);
+        Array.from(el.labels || []).forEach(label => parts.push(label.textContent));
+        (el.getAttribute("aria-labelledby") || "").split(/\s+/).forEach(id => {
+            const ref = id && document.getElementById(id);
+            if (ref) parts.push(ref.textContent);
+        });
+        return parts.map(text => text.replace(/\s+/g, " ").trim()).filter(Boolean).join(" ");
+    };
+    return Array.from(elements, el => {
+        if (!el.dataset.securefillHandle) {
+            el.dataset.securefillHandle = `${window.__secureFillPrefix}${window.__secureFillNextHandle++}`;
+        }
+        const clone = el.cloneNode(true);
+        clone.removeAttribute("style");
+        clone.removeAttribute("hidden");
+        if (el.tagName === "TEXTAREA") {
+            clone.textContent = "";
+        } else if (el.tagName === "INPUT" && !["checkbox", "radio"].includes(el.type)) {
+            clone.removeAttribute("value");
         }
+        return {
+            handle: el.dataset.securefillHandle,
+            html: `<label>${escapeText(labelText(el))}${clone.outerHTML}</label>`,
+        };
     });
-    return Array.from(contextualSnippets);
 }
 
 // --- Initial Setup and Triggers ---
+// Commands from the native host (scan_page, execute_action_plan) are handled by the
+// listener registered in connect(), so they keep working after a reconnect.
 connect();
 
-// Listen for a command from the native host (e.g., triggered by a hotkey via main.py)
-port.onMessage.addListener((message) => {
-    if (message.command === 'scan_page') {
-        triggerScan();
-    }
-});
-
 // A simple way to trigger the scan for testing: click the extension icon.
 chrome.action.onClicked.addListener((tab) => {
     console.log("Extension icon clicked, triggering scan.");
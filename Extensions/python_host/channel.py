@@ -0,0 +1,259 @@
+# channel.py - The one connection between the orchestrator (main.py) and this host.
+
+import asyncio
+import itertools
+import json
+import socket
+import struct
+import threading
+import time
+import zlib
+
+# --- Orchestrator <-> Host Channel ---
+# main.py keeps a single TCP connection to the host open for its whole run instead of
+# connecting (and binding a reply port) for every message. Each message is a UTF-8
+# JSON object:
+#
+#   {"type": "request", "id": 7, "command": "scan", "payload": null}
+#   {"type": "response", "id": 7, "ok": true, "payload": [...]}
+#   {"type": "ping"} / {"type": "pong"}
+#
+# A response repeats the ID of its request, so several commands can be in flight on
+# the connection at once. The orchestrator pings after HEARTBEAT_INTERVAL seconds and
+# either side drops the connection after HEARTBEAT_TIMEOUT seconds without a frame.
+# Only the standard library is used, so host.py can import this next to itself.
+#
+# On the wire a message is sent as one or more frames of at most CHUNK_BYTES, each
+# with a header of body length, flags and stream ID (one per message). Bodies from
+# COMPRESS_MIN_BYTES up are zlib-compressed. Frames of different messages may
+# interleave, so a large scan never holds up a ping, and the receiver decompresses
+# each chunk as it arrives instead of waiting for the whole payload.
+
+HOST_IP = '127.0.0.1'
+HOST_PORT = 6000
+HEADER = struct.Struct('>IBI')  # body length, flags, stream ID
+FLAG_DEFLATE = 1  # the message is zlib-compressed
+FLAG_MORE = 2  # more frames of this message follow
+CHUNK_BYTES = 256 * 1024
+COMPRESS_MIN_BYTES = 8 * 1024
+MAX_FRAME_BYTES = CHUNK_BYTES
+MAX_MESSAGE_BYTES = 256 * 1024 * 1024
+HEARTBEAT_INTERVAL = 5
+HEARTBEAT_TIMEOUT = 15
+
+
+class ChannelError(ConnectionError):
+    """The connection failed, or the host answered a request with an error."""
+
+
+def encode_frames(message: dict, stream_id: int, compress: bool = True):
+    """Yields the frames of one message."""
+    body = json.dumps(message).encode('utf-8')
+    flags = 0
+    if compress and len(body) >= COMPRESS_MIN_BYTES:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_DEFLATE
+    for start in range(0, max(len(body), 1), CHUNK_BYTES):
+        piece = body[start:start + CHUNK_BYTES]
+        more = FLAG_MORE if start + CHUNK_BYTES < len(body) else 0
+        yield HEADER.pack(len(piece), flags | more, stream_id) + piece
+
+
+def decode_body(body: bytes) -> dict:
+    return json.loads(body.decode('utf-8'))
+
+
+class MessageAssembler:
+    """Puts messages back together from their frames, one stream at a time."""
+
+    def __init__(self):
+        self._streams = {}  # stream ID -> [decompressor or None, parts, size]
+
+    def feed(self, flags: int, stream_id: int, piece: bytes):
+        """Returns the message once its last frame is in, else None."""
+        state = self._streams.get(stream_id)
+        if state is None:
+            decompressor = zlib.decompressobj() if flags & FLAG_DEFLATE else None
+            state = self._streams[stream_id] = [decompressor, [], 0]
+        decompressor, parts, size = state
+        if decompressor:
+            # Inflating stops one byte past the limit, so a small frame can never expand
+            # into an unbounded buffer; input left over means the limit was passed.
+            data = decompressor.decompress(piece, MAX_MESSAGE_BYTES - size + 1)
+            if not decompressor.unconsumed_tail and not flags & FLAG_MORE:
+                data += decompressor.flush()
+        else:
+            data = piece
+        state[2] = size + len(data)
+        if state[2] > MAX_MESSAGE_BYTES or (decompressor and decompressor.unconsumed_tail):
+            del self._streams[stream_id]
+            raise ChannelError(f"Message exceeds the {MAX_MESSAGE_BYTES}-byte limit.")
+        parts.append(data)
+        if flags & FLAG_MORE:
+            return None
+        del self._streams[stream_id]
+        return decode_body(b''.join(parts))
+
+
+def _recv_exactly(sock, size: int):
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(min(remaining, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def _check_length(length: int):
+    if length > MAX_FRAME_BYTES:
+        raise ChannelError(f"Frame of {length} bytes exceeds the {MAX_FRAME_BYTES}-byte limit.")
+
+
+def read_message(sock, assembler: MessageAssembler):
+    """Blocks for the next complete message; returns None once the peer closed the connection."""
+    while True:
+        header = _recv_exactly(sock, HEADER.size)
+        if header is None:
+            return None
+        length, flags, stream_id = HEADER.unpack(header)
+        _check_length(length)
+        piece = _recv_exactly(sock, length)
+        if piece is None:
+            return None
+        message = assembler.feed(flags, stream_id, piece)
+        if message is not None:
+            return message
+
+
+async def read_message_async(reader, assembler: MessageAssembler):
+    """read_message for an asyncio StreamReader."""
+    try:
+        while True:
+            length, flags, stream_id = HEADER.unpack(await reader.readexactly(HEADER.size))
+            _check_length(length)
+            message = assembler.feed(flags, stream_id, await reader.readexactly(length))
+            if message is not None:
+                return message
+    except asyncio.IncompleteReadError:
+        return None
+
+
+class _Waiter:
+    def __init__(self, sock):
+        self.sock = sock  # the connection the request was sent on
+        self.event = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class HostChannel:
+    """Orchestrator side of the channel. Thread-safe; connects on first use and again
+    after the connection was lost."""
+
+    def __init__(self, address: tuple = (HOST_IP, HOST_PORT), connect_timeout: float = 5):
+        self.address = address
+        self.connect_timeout = connect_timeout
+        self._sock = None
+        self._last_received = 0.0
+        self._ids = itertools.count(1)
+        self._stream_ids = itertools.count(1)
+        self._pending = {}
+        self._state_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+
+    def request(self, command: str, payload=None, timeout: float = 30):
+        """Sends a command and returns the payload of its response."""
+        sock = self._connected()
+        request_id = next(self._ids)
+        waiter = self._pending[request_id] = _Waiter(sock)
+        try:
+            self._send(sock, {"type": "request", "id": request_id, "command": command, "payload": payload})
+            if not waiter.event.wait(timeout):
+                raise TimeoutError(f"The host did not answer '{command}' within {timeout}s.")
+        finally:
+            self._pending.pop(request_id, None)
+        if waiter.error:
+            raise ChannelError(waiter.error)
+        if not waiter.response.get("ok", True):
+            raise ChannelError(f"The host rejected '{command}': {waiter.response.get('error')}")
+        return waiter.response.get("payload")
+
+    def close(self):
+        self._drop(self._sock, "channel closed")
+
+    def _connected(self):
+        with self._state_lock:
+            if self._sock is not None:
+                return self._sock
+            try:
+                sock = socket.create_connection(self.address, timeout=self.connect_timeout)
+            except OSError as e:
+                raise ChannelError(f"Could not connect to the host on {self.address[0]}:{self.address[1]} "
+                                   f"(was the browser started?): {e}") from e
+            sock.settimeout(None)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sock = sock
+            self._last_received = time.monotonic()
+        threading.Thread(target=self._read_loop, args=(sock,), daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, args=(sock,), daemon=True).start()
+        return sock
+
+    def _send(self, sock, message: dict):
+        try:
+            # The lock is taken per frame, so other threads' messages can go out in between.
+            for frame in encode_frames(message, next(self._stream_ids)):
+                with self._send_lock:
+                    sock.sendall(frame)
+        except OSError as e:
+            self._drop(sock, e)
+            raise ChannelError(f"Could not send to the host: {e}") from e
+
+    def _read_loop(self, sock):
+        assembler = MessageAssembler()
+        try:
+            while True:
+                message = read_message(sock, assembler)
+                if message is None:
+                    raise ChannelError("the host closed the connection")
+                self._last_received = time.monotonic()
+                if message.get("type") == "ping":
+                    self._send(sock, {"type": "pong"})
+                elif message.get("type") == "response":
+                    waiter = self._pending.get(message.get("id"))
+                    if waiter is not None:
+                        waiter.response = message
+                        waiter.event.set()
+        except (OSError, ValueError, zlib.error) as e:
+            self._drop(sock, e)
+
+    def _heartbeat_loop(self, sock):
+        while self._sock is sock:
+            time.sleep(HEARTBEAT_INTERVAL)
+            if self._sock is not sock:
+                return
+            if time.monotonic() - self._last_received > HEARTBEAT_TIMEOUT:
+                self._drop(sock, f"no heartbeat from the host for {HEARTBEAT_TIMEOUT}s")
+                return
+            try:
+                self._send(sock, {"type": "ping"})
+            except ChannelError:
+                return
+
+    def _drop(self, sock, reason):
+        with self._state_lock:
+            if sock is None or self._sock is not sock:
+                return
+            self._sock = None
+        try:
+            sock.close()
+        except OSError:
+            pass
+        # Requests waiting on this connection fail now instead of at their timeout.
+        # Requests already sent on a newer connection keep waiting for their answer.
+        for waiter in list(self._pending.values()):
+            if waiter.sock is not sock:
+                continue
+            waiter.error = f"Connection to the host lost: {reason}"
+            waiter.event.set()
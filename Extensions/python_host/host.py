@@ -1,36 +1,113 @@
 import sys
 import json
+import zlib
+import base64
 import struct
 import logging
-import socket
-import threading
+import asyncio
+import itertools
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from channel import (HOST_IP, HOST_PORT, HEARTBEAT_TIMEOUT, MAX_MESSAGE_BYTES, MessageAssembler,
+                     encode_frames, read_message_async)
 
 # --- Configuration ---
-ORCHESTRATOR_IP = '127.0.0.1'
-ORCHESTRATOR_PORT = 6001 
-HOST_PORT = 6000
+# Messages waiting for stdout; producers wait (backpressure) once it is full.
+STDOUT_QUEUE_SIZE = 64
+# Responses waiting for one orchestrator; a peer that lets this fill up is dropped.
+SESSION_QUEUE_SIZE = 256
+# How long one orchestrator may take to accept a frame before it is dropped.
+SEND_TIMEOUT = 10
+# Chrome refuses host -> extension messages over 1 MB. Larger ones are compressed and
+# sent in chunks whose base64 data (4/3 of this) stays well under the cap.
+NATIVE_INLINE_BYTES = 64 * 1024
+NATIVE_CHUNK_BYTES = 512 * 1024
+# A scan the extension has not answered after this long is failed and forgotten.
+SCAN_TIMEOUT = 30
 
 # --- Setup Logging ---
 log_file_path = 'host_log.log'
 logging.basicConfig(
-    filename=log_file_path, 
-    level=logging.INFO, 
+    filename=log_file_path,
+    level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# --- Event Loop Layout ---
+# Everything runs on one asyncio loop:
+# - Each orchestrator connection is its own task, and each of its requests another,
+#   so a slow or stalled orchestrator only ever waits on its own socket.
+# - stdin is read by one executor thread (pipes cannot be awaited portably), one
+#   native-messaging frame at a time.
+# - stdout has a single writer task fed by a bounded queue, so frames to the browser
+#   are never interleaved and a browser that stops reading holds up the producers
+#   instead of growing memory.
+#
+# Large native messages travel in chunks both ways:
+#   {"chunk": {"id": 3, "seq": 0, "last": false, "encoding": "deflate", "data": "<base64>"}}
+# The data of all chunks of one ID, joined and inflated, is the JSON of the message.
+# The extension compresses with CompressionStream('deflate'), which is zlib format.
+
+
 # --- Native Messaging (Browser Communication) ---
-def send_message_to_extension(message_content):
-    """Encodes and sends a message TO the browser extension via stdout."""
+def write_message_to_extension(message_content):
+    """Encodes and writes one message TO the browser extension on stdout. Blocking; only
+    the stdout writer calls it."""
     try:
         encoded_content = json.dumps(message_content).encode('utf-8')
         encoded_length = struct.pack('@I', len(encoded_content))
-        logging.info(f"To Extension >> Relaying command: {message_content.get('command')}")
+        logging.info(f"To Extension >> Relaying command: {message_content.get('command', 'chunk')}")
         sys.stdout.buffer.write(encoded_length)
         sys.stdout.buffer.write(encoded_content)
         sys.stdout.buffer.flush()
     except (IOError, BrokenPipeError) as e:
         logging.warning(f"Pipe to browser broken: {e}")
 
+def native_messages(message_content, message_id):
+    """The message itself if it is small, else the chunks that carry it."""
+    body = json.dumps(message_content).encode('utf-8')
+    if len(body) <= NATIVE_INLINE_BYTES:
+        return [message_content]
+    body = zlib.compress(body, 6)
+    return [
+        {"chunk": {
+            "id": message_id, "seq": seq, "last": start + NATIVE_CHUNK_BYTES >= len(body),
+            "encoding": "deflate", "data": base64.b64encode(body[start:start + NATIVE_CHUNK_BYTES]).decode('ascii'),
+        }}
+        for seq, start in enumerate(range(0, len(body), NATIVE_CHUNK_BYTES))
+    ]
+
+class NativeChunkAssembler:
+    """Rebuilds chunked messages from the extension, inflating each chunk as it arrives."""
+
+    def __init__(self):
+        self.messages = {}  # message ID -> [decompressor or None, parts, size]
+
+    def feed(self, chunk):
+        """Returns the whole message once its last chunk is in, else None."""
+        message_id = chunk.get("id")
+        state = self.messages.get(message_id)
+        if state is None:
+            decompressor = zlib.decompressobj() if chunk.get("encoding") == "deflate" else None
+            state = self.messages[message_id] = [decompressor, [], 0]
+        decompressor, parts, size = state
+        data = base64.b64decode(chunk.get("data", ""))
+        if decompressor:
+            # Bounded like channel.MessageAssembler: stop one byte past the limit.
+            data = decompressor.decompress(data, MAX_MESSAGE_BYTES - size + 1)
+            if not decompressor.unconsumed_tail and chunk.get("last"):
+                data += decompressor.flush()
+        state[2] = size + len(data)
+        if state[2] > MAX_MESSAGE_BYTES or (decompressor and decompressor.unconsumed_tail):
+            del self.messages[message_id]
+            raise ValueError(f"Chunked message {message_id} exceeds {MAX_MESSAGE_BYTES} bytes.")
+        parts.append(data)
+        if not chunk.get("last"):
+            return None
+        del self.messages[message_id]
+        return json.loads(b''.join(parts).decode('utf-8'))
+
 def read_message_from_extension():
     """Reads and decodes a message FROM the browser extension via stdin."""
     try:
@@ -43,75 +120,213 @@ def read_message_from_extension():
         logging.warning(f"Could not read from browser: {e}")
         return None
 
+
+# --- Incremental Scans ---
+# Every scanned field is identified by a fingerprint of its handle and field HTML
+# (see background.js). A scan request lists the fingerprints the orchestrator already
+# holds, and the reply is every field on the page in order, with HTML only for the
+# ones it does not know. The extension already leaves known fields out; the host
+# checks again and drops entries without a fingerprint.
+def scan_delta(data, known):
+    """[{"fp", "handle", "html"}] in page order, without the HTML of fingerprints in `known`."""
+    fields, seen = [], set()
+    for entry in data:
+        fp = entry.get("fp") if isinstance(entry, dict) else None
+        if not fp or fp in seen:
+            continue
+        seen.add(fp)
+        field = {"fp": fp, "handle": entry.get("handle")}
+        if fp not in known and "html" in entry:
+            field["html"] = entry["html"]
+        fields.append(field)
+    return fields
+
+
 # --- Orchestrator Communication ---
-def send_data_to_orchestrator(data):
-    """Connects to the main.py orchestrator and sends it the scanned HTML data."""
-    logging.info(f"To Orchestrator >> Sending {len(data)} HTML fields...")
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+# Orchestrators keep one connection open each (see channel.py) and send framed
+# requests over it. A scan is answered once the extension returns its result, which
+# carries the scan ID the host forwarded with the scan_page command.
+class OrchestratorSession:
+    """One orchestrator connection with its own outbound queue and writer task."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.peer = writer.get_extra_info('peername')
+        self.outbox = asyncio.Queue(maxsize=SESSION_QUEUE_SIZE)
+        self.stream_ids = itertools.count(1)
+
+    def send(self, message):
+        """Queues a frame without waiting, so no other session is held up by this one."""
         try:
-            s.connect((ORCHESTRATOR_IP, ORCHESTRATOR_PORT))
-            s.sendall(json.dumps(data).encode('utf-8'))
-            logging.info("To Orchestrator >> Data sent successfully.")
-        except ConnectionRefusedError:
-            logging.error(f"Could not connect to Orchestrator on port {ORCHESTRATOR_PORT}. Is main.py running?")
-
-def start_command_listener():
-    """
-    Listens for commands from the main.py orchestrator. Handles both 'scan' and 'execute_plan'.
-    """
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        s.bind(('127.0.0.1', HOST_PORT))
-        s.listen()
-        logging.info(f"Listening for commands from Orchestrator on port {HOST_PORT}")
+            self.outbox.put_nowait(message)
+        except asyncio.QueueFull:
+            logging.warning(f"Orchestrator {self.peer} is not reading; closing its connection.")
+            self.writer.close()
+
+    def respond(self, request_id, payload=None, error=None):
+        response = {"type": "response", "id": request_id, "ok": error is None, "payload": payload}
+        if error is not None:
+            response["error"] = error
+        self.send(response)
+
+    async def write_loop(self):
+        try:
+            while True:
+                message = await self.outbox.get()
+                # Drained chunk by chunk, so a large scan never sits in memory twice.
+                for frame in encode_frames(message, next(self.stream_ids)):
+                    self.writer.write(frame)
+                    await asyncio.wait_for(self.writer.drain(), SEND_TIMEOUT)
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.warning(f"To Orchestrator >> Could not send to {self.peer}: {e!r}")
+            self.writer.close()
+
+
+class NativeHost:
+    def __init__(self):
+        self.scan_ids = itertools.count(1)
+        self.pending_scans = OrderedDict()  # scan ID -> (session, request ID, known fingerprints, expiry timer)
+        self.stdout_queue = None
+        self.native_ids = itertools.count(1)
+        self.extension_chunks = NativeChunkAssembler()
+        self.stdin_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stdin')
+        self.stdout_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='stdout')
+
+    async def send_message_to_extension(self, message_content):
+        """Queues a message for the browser; waits while the stdout queue is full."""
+        await self.stdout_queue.put(message_content)
+
+    async def stdout_writer(self):
+        loop = asyncio.get_running_loop()
         while True:
-            conn, addr = s.accept()
-            with conn:
-                data_chunks = []
-                while True:
-                    chunk = conn.recv(4096)
-                    if not chunk: break
-                    data_chunks.append(chunk)
-                
-                raw_data = b''.join(data_chunks).decode('utf-8')
-                if not raw_data: continue
+            message = await self.stdout_queue.get()
+            for part in native_messages(message, next(self.native_ids)):
+                await loop.run_in_executor(self.stdout_executor, write_message_to_extension, part)
 
+    # --- Orchestrator side ---
+    async def serve_orchestrator(self, reader, writer):
+        session = OrchestratorSession(reader, writer)
+        logging.info(f"Orchestrator connected from {session.peer}")
+        write_task = asyncio.create_task(session.write_loop())
+        request_tasks = set()
+        assembler = MessageAssembler()
+        try:
+            while True:
+                # The orchestrator pings every few seconds; silence this long means it is gone.
+                message = await asyncio.wait_for(read_message_async(reader, assembler), HEARTBEAT_TIMEOUT)
+                if message is None:
+                    break
+                if message.get("type") == "ping":
+                    session.send({"type": "pong"})
+                elif message.get("type") == "request":
+                    # Each request runs on its own, so a plan waiting for stdout does not
+                    # hold up the pings and scans behind it.
+                    task = asyncio.create_task(self.handle_request(session, message))
+                    request_tasks.add(task)
+                    task.add_done_callback(request_tasks.discard)
+        except (OSError, ValueError, zlib.error, asyncio.TimeoutError) as e:
+            logging.warning(f"Orchestrator connection {session.peer} dropped: {e!r}")
+        except asyncio.CancelledError:
+            # The loop is shutting down because the browser went away.
+            pass
+        finally:
+            for scan_id in [i for i, (owner, *_) in self.pending_scans.items() if owner is session]:
+                self.pending_scans.pop(scan_id)[3].cancel()
+            for task in request_tasks:
+                task.cancel()
+            write_task.cancel()
+            writer.close()
+            logging.info(f"Orchestrator {session.peer} disconnected")
+
+    async def handle_request(self, session, message):
+        request_id, command = message.get("id"), message.get("command")
+        logging.info(f"From Orchestrator << Received command: '{command}' (request {request_id})")
+
+        if command == 'scan':
+            scan_id = next(self.scan_ids)
+            known = list((message.get("payload") or {}).get("known", []))
+            timer = asyncio.get_running_loop().call_later(SCAN_TIMEOUT, self.expire_scan, scan_id)
+            self.pending_scans[scan_id] = (session, request_id, set(known), timer)
+            await self.send_message_to_extension({"command": "scan_page", "request_id": scan_id, "known": known})
+
+        elif command == 'execute_plan':
+            plan = message.get("payload") or []
+            await self.send_message_to_extension({"command": "execute_action_plan", "plan": plan})
+            session.respond(request_id, {"actions": len(plan)})
+
+        else:
+            session.respond(request_id, error=f"Unknown command: {command}")
+
+    def expire_scan(self, scan_id):
+        """Fails a scan the extension never answered, so it does not wait forever."""
+        if scan_id in self.pending_scans:
+            session, request_id, _, _ = self.pending_scans.pop(scan_id)
+            logging.warning(f"Scan {scan_id} got no result within {SCAN_TIMEOUT}s; failing request {request_id}.")
+            session.respond(request_id, error=f"The browser did not answer the scan within {SCAN_TIMEOUT}s.")
+
+    def complete_scan(self, scan_id, html_data, error=None):
+        """Answers the scan request the extension's result belongs to. Results without an
+        ID (a scan started from the extension icon) or for an expired scan are dropped."""
+        if scan_id not in self.pending_scans:
+            logging.warning(f"From Extension << Scan result {scan_id} has no waiting request; dropped.")
+            return
+        session, request_id, known, timer = self.pending_scans.pop(scan_id)
+        timer.cancel()
+        if error is not None:
+            logging.warning(f"From Extension << Scan {scan_id} failed: {error}")
+            session.respond(request_id, error=f"The browser could not scan the page: {error}")
+            return
+        fields = scan_delta(html_data, known)
+        changed = sum(1 for field in fields if "html" in field)
+        logging.info(f"To Orchestrator >> Sending {len(fields)} fields ({changed} new or changed) for request {request_id}.")
+        session.respond(request_id, {"fields": fields})
+
+    # --- Browser side ---
+    async def read_extension_messages(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(self.stdin_executor, read_message_from_extension)
+            if not message:
+                logging.warning("Browser closed the connection. Exiting host script.")
+                return
+            if "chunk" in message:
                 try:
-                    request = json.loads(raw_data)
-                    command = request.get("command")
-                    logging.info(f"From Orchestrator << Received command: '{command}'")
+                    message = self.extension_chunks.feed(message["chunk"])
+                except (ValueError, zlib.error) as e:
+                    logging.warning(f"From Extension << Dropped a chunked message: {e}")
+                    continue
+                if message is None:
+                    continue
+            action = message.get("action")
+            logging.info(f"From Extension << Received action: '{action}'")
+
+            if action == "contextual_scan_result":
+                self.complete_scan(message.get("request_id"), message.get("data", []), message.get("error"))
 
-                    if command == 'scan':
-                        send_message_to_extension({"command": "scan_page"})
-                    
-                    elif command == 'execute_plan':
-                        plan = request.get("payload", [])
-                        send_message_to_extension({"command": "execute_action_plan", "plan": plan})
-                
-                except json.JSONDecodeError:
-                    logging.error(f"Received non-JSON command from orchestrator: {raw_data}")
+    async def run(self):
+        self.stdout_queue = asyncio.Queue(maxsize=STDOUT_QUEUE_SIZE)
+        writer_task = asyncio.create_task(self.stdout_writer())
+        server = await asyncio.start_server(self.serve_orchestrator, HOST_IP, HOST_PORT)
+        logging.info(f"Listening for commands from Orchestrator on port {HOST_PORT}")
+        try:
+            # The host lives as long as the browser keeps stdin open.
+            await self.read_extension_messages()
+        finally:
+            server.close()
+            writer_task.cancel()
 
 
 # --- Main Host Logic ---
 def main():
     logging.info("--- Host Messenger Service Started by Browser ---")
-    
-    command_thread = threading.Thread(target=start_command_listener)
-    command_thread.daemon = True
-    command_thread.start()
-    
-    while True:
-        message = read_message_from_extension()
-        if message:
-            action = message.get("action")
-            logging.info(f"From Extension << Received action: '{action}'")
-            
-            if action == "contextual_scan_result":
-                html_data = message.get("data", [])
-                send_data_to_orchestrator(html_data)
-        else:
-            logging.warning("Browser closed the connection. Exiting host script.")
-            break
+    host = NativeHost()
+    try:
+        asyncio.run(host.run())
+    finally:
+        # The stdin thread may still be blocked in read(); do not wait for it.
+        host.stdin_executor.shutdown(wait=False)
+        host.stdout_executor.shutdown(wait=False)
 
 if __name__ == "__main__":
     main()
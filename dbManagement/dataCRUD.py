@@ -1,25 +1,133 @@
-from langchain_community.vectorstores import FAISS
+import os
+import sys
+
 from langchain_huggingface import HuggingFaceEmbeddings
 
+# Make the project root importable when this folder is run directly (python dbManagement/ui.py).
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modelEngine.parser import load_config
+from modelEngine.vaultStore import VaultStore
+
 # --- Setup LangChain Components ---
 DB_PATH = "./DataStore/faiss_index"
-embedding_function = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+EMBED_BATCH_SIZE = 64
+# The same model the engine embeds with (see embedding_model in config.yaml), which
+# is the one that wrote the vault.
+config = load_config() or {}
+embedding_function = HuggingFaceEmbeddings(model_name=config.get("embedding_model", "all-MiniLM-L6-v2"))
+
+# Open or create the vault (an interrupted write is recovered here)
+vault = VaultStore(DB_PATH, embedding_function, batch_size=EMBED_BATCH_SIZE)
+if vault.loaded:
+    print(f"✅ Loaded existing vault from: {DB_PATH}")
+else:
+    print(f"✅ No vault yet, it will be created at {DB_PATH} on the first insert.")
+
+
+def format_document(attribute: str, value: str, metadata: str) -> str:
+    return f"Field: {attribute} | Value: {value} | Description: {metadata}"
+
+
+def document_fields(attribute: str, value: str, metadata: str, category: str = "", label: str = "") -> dict:
+    """Structured fields stored with a record; they feed the vault's exact attribute index."""
+    fields = {"attribute": attribute, "value": value, "description": metadata}
+    if category:
+        fields["category"] = category
+    if label:
+        fields["label"] = label
+    return fields
 
-# Load or create FAISS index
-try:
-    vectorstore = FAISS.load_local(DB_PATH, embedding_function, allow_dangerous_deserialization=True)
-    print(f"✅ Loaded existing FAISS index from: {DB_PATH}")
-except Exception:
-    vectorstore = FAISS.from_texts(["dummy"], embedding_function)
-    vectorstore.save_local(DB_PATH)
-    print(f"✅ Created new FAISS index at: {DB_PATH}")
 
+def to_record(doc_id: str, doc) -> dict:
+    """Shapes a stored Document for the management UI."""
+    fields = dict(doc.metadata)
+    if "value" not in fields:
+        # Records added before structured metadata was stored only have the flat text.
+        for part in doc.page_content.split(" | "):
+            key, _, text = part.partition(": ")
+            fields.setdefault({"Field": "attribute", "Value": "value", "Description": "description"}.get(key, key), text)
+    return {
+        "id": doc_id,
+        "attribute": fields.get("attribute", ""),
+        "value": fields.get("value", doc.page_content),
+        "metadata": fields.get("description", ""),
+        "category": fields.get("category", ""),
+        "label": fields.get("label", ""),
+        "content": doc.page_content,
+    }
 
-# --- Add Document Function Only ---
-def add_document(attribute: str, value: str, metadata: str) -> None:
-    """Add a plain text document to the FAISS index with rich context."""
-    plain_text = f"Field: {attribute} | Value: {value} | Description: {metadata}"
-    vectorstore.add_texts([plain_text])
-    vectorstore.save_local(DB_PATH)
+
+# --- Create ---
+def add_document(attribute: str, value: str, metadata: str, category: str = "", label: str = "") -> str:
+    """Add a plain text document to the vault with rich context."""
+    plain_text = format_document(attribute, value, metadata)
+    fields = document_fields(attribute, value, metadata, category, label)
+    # A single insert appends one vector row and one record; nothing else is rewritten.
+    doc_id = vault.add_texts([plain_text], metadatas=[fields])[0]
 
     print(f"✓ Document added: {plain_text}")
+    return doc_id
+
+
+def bulk_add_documents(records: list, batch_size: int = EMBED_BATCH_SIZE) -> list:
+    """Add many (attribute, value, metadata[, category, label]) records, embedding them in
+    batches and writing them in one transaction."""
+    vault.batch_size = batch_size
+    texts = [format_document(*record[:3]) for record in records]
+    metadatas = [document_fields(*record) for record in records]
+    doc_ids = vault.add_texts(texts, metadatas=metadatas)
+
+    print(f"✓ {len(doc_ids)} document(s) added.")
+    return doc_ids
+
+
+# --- Read ---
+def view_document(doc_id: str):
+    """Returns one record by ID, or None if it does not exist."""
+    doc = vault.get(doc_id)
+    return to_record(doc_id, doc) if doc else None
+
+
+def view_page(page: int = 0, page_size: int = 50) -> dict:
+    """Returns one page of records plus the paging totals."""
+    total = vault.count()
+    records = [to_record(i, doc) for i, doc in vault.list_documents(page * page_size, page_size)]
+    return {"records": records, "page": page, "page_size": page_size, "total": total,
+            "pages": max(1, -(-total // page_size))}
+
+
+def view_all() -> list:
+    return [to_record(i, doc) for i, doc in vault.list_documents()]
+
+
+def count_documents() -> int:
+    return vault.count()
+
+
+def similarity_search(query: str, k: int = 4) -> list:
+    """Returns the k records closest to the query, with their L2 distance."""
+    results = vault.search_with_ids_batch([query], k)[0]
+    return [{**to_record(doc_id, doc), "score": score} for doc_id, doc, score in results]
+
+
+# --- Update / Delete ---
+def update_document(doc_id: str, attribute: str, value: str, metadata: str, category: str = "", label: str = "") -> None:
+    """Re-embeds only this record and overwrites it in place."""
+    plain_text = format_document(attribute, value, metadata)
+    fields = document_fields(attribute, value, metadata, category, label)
+    if not vault.update(doc_id, plain_text, fields):
+        raise KeyError(f"No document found with ID: {doc_id}")
+    print(f"✓ Document {doc_id} updated: {plain_text}")
+
+
+def add_alias(alias: str, attribute: str) -> None:
+    """Lets searches for `alias` find the records stored under `attribute`."""
+    vault.add_alias(alias, attribute)
+    print(f"✓ Alias added: {alias} → {attribute}")
+
+
+def delete_document(doc_id: str) -> None:
+    """Removes the record from searches at once; the index is compacted in the background."""
+    if not vault.delete([doc_id]):
+        raise KeyError(f"No document found with ID: {doc_id}")
+    print(f"✓ Document {doc_id} deleted.")
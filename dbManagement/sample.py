@@ -1,30 +1,28 @@
-from dataCRUD import add_document
-add_document(
-    "Aadhar Number",
-    "1234-5678-9012",
-    "This is the unique identification number issued by the UIDAI for Indian citizens."
-)
-
-add_document(
-    "Email Address",
-    "john.doe@example.com",
-    "The personal email address of the user used for official and personal communication."
-)
-
-add_document(
-    "Mobile Number",
-    "+91-9876543210",
-    "This is the primary contact number of the user registered for SMS alerts."
-)
-
-add_document(
-    "Passport Number",
-    "A1234567",
-    "Official passport number issued by the Government of India for international travel."
-)
-
-add_document(
-    "Home Address",
-    "221B Baker Street, London",
-    "Permanent residential address of the user."
-)
+from dataCRUD import bulk_add_documents
+bulk_add_documents([
+    (
+        "Aadhar Number",
+        "1234-5678-9012",
+        "This is the unique identification number issued by the UIDAI for Indian citizens."
+    ),
+    (
+        "Email Address",
+        "john.doe@example.com",
+        "The personal email address of the user used for official and personal communication."
+    ),
+    (
+        "Mobile Number",
+        "+91-9876543210",
+        "This is the primary contact number of the user registered for SMS alerts."
+    ),
+    (
+        "Passport Number",
+        "A1234567",
+        "Official passport number issued by the Government of India for international travel."
+    ),
+    (
+        "Home Address",
+        "221B Baker Street, London",
+        "Permanent residential address of the user."
+    ),
+])
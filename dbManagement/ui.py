@@ -4,11 +4,13 @@ from dataCRUD import (
     add_document,
     delete_document,
     update_document,
-    view_all,
+    view_page,
     view_document,
     similarity_search
 )
 
+PAGE_SIZE = 50
+
 class SecureFillUI:
     def __init__(self, root):
         self.root = root
@@ -79,8 +81,15 @@ class SecureFillUI:
         ttk.Button(button_frame, text="View Document", command=self.handle_view_document).pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Delete Document", command=self.handle_delete_document).pack(side=tk.LEFT, padx=5)
         
-        # View all documents
-        ttk.Button(self.view_tab, text="View All Documents", command=self.handle_view_all).pack(pady=5)
+        # View all documents, one page at a time
+        self.current_page = 0
+        page_frame = ttk.Frame(self.view_tab)
+        page_frame.pack(pady=5)
+        ttk.Button(page_frame, text="View All Documents", command=self.handle_view_all).pack(side=tk.LEFT, padx=5)
+        ttk.Button(page_frame, text="< Prev", command=lambda: self.show_page(self.current_page - 1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(page_frame, text="Next >", command=lambda: self.show_page(self.current_page + 1)).pack(side=tk.LEFT, padx=5)
+        self.page_label = ttk.Label(page_frame, text="")
+        self.page_label.pack(side=tk.LEFT, padx=5)
         
         # Results area
         self.view_results = scrolledtext.ScrolledText(self.view_tab, width=70, height=20)
@@ -172,8 +181,18 @@ class SecureFillUI:
                 messagebox.showerror("Error", f"Error deleting document: {str(e)}")
 
     def handle_view_all(self):
+        self.show_page(0)
+
+    def show_page(self, page):
         try:
-            docs = view_all()
+            if page < 0:
+                return
+            result = view_page(page, PAGE_SIZE)
+            if page >= result["pages"]:
+                return
+            self.current_page = page
+            self.page_label.config(text=f"Page {page + 1} of {result['pages']} ({result['total']} documents)")
+            docs = result["records"]
             self.view_results.delete("1.0", tk.END)
             if docs:
                 for doc in docs:
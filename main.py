@@ -1,22 +1,32 @@
-import socket
 import threading
-import json
 import time
 import sys
+import queue
 from pynput import keyboard # For global hotkeys
 import customtkinter as ctk # For the UI
 
 # Import the form-filling engine we built
-from modelEngine import parser as form_filler_engine
+from modelEngine.engine import FormFillerEngine
+from modelEngine.scanDelta import ScanSession
+from Extensions.python_host.channel import HOST_IP, HOST_PORT, ChannelError, HostChannel
 
 # --- Configuration ---
-HOST_IP = '127.0.0.1'
-ORCHESTRATOR_PORT = 6001 
-HOST_PORT = 6000
+ENGINE_READY_TIMEOUT = 120
+SCAN_TIMEOUT = 30
+# Most actions sent to the host in one execute_plan request.
+ACTION_BATCH_SIZE = 16
 # Define your hotkey. This is for Ctrl + Alt + F
 HOTKEY = {keyboard.Key.ctrl, keyboard.Key.shift, keyboard.KeyCode.from_char('f')}
 current_keys = set()
 
+# Loaded once at startup and kept warm for every hotkey press.
+engine = FormFillerEngine()
+# One connection to the browser host, shared by every scan and action plan.
+host_channel = HostChannel((HOST_IP, HOST_PORT))
+# Fields already scanned and analysed, so each step of a multi-page form sends and
+# analyses only what changed.
+scan_session = ScanSession()
+
 
 # --- UI Application Class ---
 # We wrap the UI in a class to easily manage its state and components.
@@ -79,6 +89,13 @@ def start_ui_thread(callback_func):
 def run_fill_process():
     """This is the main function triggered by the hotkey."""
     global ui_instance, user_prompt_from_ui
+
+    # Only open the UI once the AI engine is warm, so the fill itself starts instantly.
+    if not engine.is_ready():
+        print("Waiting for the AI engine to warm up...")
+        if not engine.wait_until_ready(timeout=ENGINE_READY_TIMEOUT):
+            print(f"AI engine is not ready: {engine.health()}")
+            return
     
     # Define the callback function for the UI
     def on_prompt_submit(prompt):
@@ -98,40 +115,20 @@ def run_fill_process():
         # --- The AI Pipeline Begins ---
         # 1. Update UI and trigger scan
         ui_instance.update_status("Scanning page...")
-        html_fields = trigger_and_wait_for_scan()
-        if not html_fields:
+        scanned_fields = trigger_and_wait_for_scan()
+        if not scanned_fields:
             raise Exception("Failed to get HTML from extension.")
 
-        # 2. Initialize engine
-        ui_instance.update_status("Waking up AI...")
-        config = form_filler_engine.load_config()
-        llm = form_filler_engine.initialize_llm(config)
-        vectorstore = form_filler_engine.initialize_vectorstore()
-        if not all([config, llm, vectorstore]):
-            raise Exception("Failed to initialize AI engine.")
-
-        analyze_chain = form_filler_engine.analysis_prompt | llm | form_filler_engine.StrOutputParser()
-        action_plan_chain = form_filler_engine.action_plan_prompt | llm | form_filler_engine.StrOutputParser()
-
-        # 3. Run analysis
-        ui_instance.update_status("Analyzing form fields...")
-        analysis_plan = form_filler_engine.analyze_form_and_create_search_plan(analyze_chain, html_fields, user_prompt_from_ui)
-        if not analysis_plan:
-            raise Exception("AI failed to create an analysis plan.")
-
-        # 4. Run search
-        ui_instance.update_status("Searching for your data...")
-        search_results = form_filler_engine.search_vector_db(vectorstore, analysis_plan, top_k=2)
-
-        # 5. Generate final plan
-        ui_instance.update_status("Creating final action plan...")
-        raw_action_plan = form_filler_engine.generate_action_plan(action_plan_chain, search_results, user_prompt_from_ui)
-        final_action_plan = cleanup_action_plan(raw_action_plan)
-
-        # 6. Execute plan
-        ui_instance.update_status("Filling form...")
-        if final_action_plan:
-            send_action_plan_to_host(final_action_plan)
+        # 2. Analyze, search and plan on the already-warm engine.
+        # Each action is queued for the host as soon as it is ready, so fields start
+        # filling while the rest of the plan is still being generated.
+        def on_action(action):
+            ui_instance.update_status("Filling form...")
+            action_sender.put(action)
+
+        engine.fill_incremental(scanned_fields, user_prompt_from_ui, scan_session,
+                                on_status=ui_instance.update_status, on_action=on_action)
+        action_sender.flush()
         
         ui_instance.update_status("Done!")
         time.sleep(1.5) # Give user time to see "Done!"
@@ -150,56 +147,54 @@ def run_fill_process():
 
 # --- Communication & Helper Functions (modified for the new flow) ---
 def trigger_and_wait_for_scan():
-    """Triggers the scan and waits for the data to be returned via a socket."""
-    data_received = None
-    data_event = threading.Event()
-
-    def listener():
-        nonlocal data_received
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            s.bind((HOST_IP, ORCHESTRATOR_PORT))
-            s.listen()
-            conn, _ = s.accept()
-            with conn:
-                data_chunks = []
-                while True:
-                    chunk = conn.recv(4096)
-                    if not chunk: break
-                    data_chunks.append(chunk)
-                raw_data = b''.join(data_chunks).decode('utf-8')
-                data_received = json.loads(raw_data)
-                data_event.set()
-
-    listener_thread = threading.Thread(target=listener)
-    listener_thread.daemon = True
-    listener_thread.start()
-
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST_IP, HOST_PORT))
-        s.sendall(json.dumps({"command": "scan"}).encode('utf-8'))
-    
-    success = data_event.wait(timeout=30)
-    return data_received if success else None
+    """Asks the host to scan the page and waits for the fields on the shared channel.
+    Fields the session already holds come back without their HTML."""
+    try:
+        return host_channel.request("scan", {"known": scan_session.known()}, timeout=SCAN_TIMEOUT)["fields"]
+    except (ChannelError, TimeoutError) as e:
+        print(f"Scan failed: {e}")
+        return None
 
 def send_action_plan_to_host(plan: list):
     """Sends the final plan to the host for execution."""
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        s.connect((HOST_IP, HOST_PORT))
-        command = {"command": "execute_plan", "payload": plan}
-        s.sendall(json.dumps(command).encode('utf-8'))
-
-def cleanup_action_plan(plan: list):
-    """Removes duplicates and bad values from the AI's plan."""
-    if not isinstance(plan, list): return []
-    cleaned_plan, seen_selectors = [], set()
-    for action in plan:
-        if not (isinstance(action, dict) and all(k in action for k in ["selector", "action_type", "value"])): continue
-        if action["selector"] in seen_selectors: continue
-        if action["action_type"] == "FILL_TEXT" and isinstance(action["value"], bool): continue
-        cleaned_plan.append(action)
-        seen_selectors.add(action["selector"])
-    return cleaned_plan
+    host_channel.request("execute_plan", plan)
+
+class ActionSender:
+    """Sends streamed actions to the host from one background thread. The fill loop only
+    queues them, so it never waits on a host round trip while holding the fill lock;
+    actions that queue up during a send go out together in the next request."""
+
+    def __init__(self, send, max_batch: int = ACTION_BATCH_SIZE):
+        self._send = send
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        threading.Thread(target=self._run, name="action-sender", daemon=True).start()
+
+    def put(self, action: dict):
+        self._queue.put(action)
+
+    def flush(self):
+        """Waits until every queued action has been sent (or failed)."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._send(batch)
+            except (ChannelError, TimeoutError) as e:
+                print(f"Could not send {len(batch)} action(s) to the host: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+# Keeps the actions of every fill in order on a single thread.
+action_sender = ActionSender(send_action_plan_to_host)
 
 # --- Hotkey Listener Setup ---
 def on_press(key):
@@ -223,6 +218,7 @@ def on_release(key):
 #     print("--- SecureFill Orchestrator Engine ---")
 #     print(f"Press {' + '.join([str(k).split('.')[-1] for k in HOTKEY])} to activate.")
 #     print("This window must remain open. You can minimize it.")
+#     engine.start()
     
 #     # Start listening for the hotkey
 #     with keyboard.Listener(on_press=on_press, on_release=on_release) as listener:
@@ -231,6 +227,7 @@ def on_release(key):
 if __name__ == "__main__":
     print("--- SecureFill Orchestrator Engine ---")
     print("Starting the application directly (no hotkey).")
+    engine.start()
     
     # Directly call the main function to start the UI and the fill process.
     # This runs the whole process once.
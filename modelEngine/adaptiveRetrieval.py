@@ -0,0 +1,93 @@
+import numpy as np
+
+# --- Adaptive Top-k ---
+# A fixed top_k gives easy fields neighbours that do not matter and can still miss the
+# right record for ambiguous ones (work vs personal email). The search fetches up to
+# `max_k` candidates per field and this keeps only those the distances justify:
+#
+# 1. threshold: candidates further than `score_threshold` (squared L2) are dropped.
+# 2. gap: the list is cut at the first jump in distance of at least `gap`.
+# 3. mmr (optional): the survivors are chosen by maximal marginal relevance among all
+#    candidates under the threshold, so a near-duplicate makes room for a different
+#    record.
+# `min_k` documents are always kept so a field is never left without context.
+
+DEFAULTS = {
+    "max_k": 4,
+    "min_k": 1,
+    "score_threshold": 1.2,
+    "gap": 0.2,
+    "mmr": True,
+    "mmr_lambda": 0.7,
+}
+
+
+def options_from_config(config: dict) -> dict:
+    return {
+        "max_k": config.get("retrieval_max_k", DEFAULTS["max_k"]),
+        "min_k": config.get("retrieval_min_k", DEFAULTS["min_k"]),
+        "score_threshold": config.get("retrieval_score_threshold", DEFAULTS["score_threshold"]),
+        "gap": config.get("retrieval_gap", DEFAULTS["gap"]),
+        "mmr": config.get("retrieval_mmr", DEFAULTS["mmr"]),
+        "mmr_lambda": config.get("retrieval_mmr_lambda", DEFAULTS["mmr_lambda"]),
+    }
+
+
+def elbow_cut(distances: list, gap: float | None) -> int:
+    """Number of leading items before the first jump of at least `gap`."""
+    if not gap:
+        return len(distances)
+    ordered = sorted(distances)
+    for i in range(1, len(ordered)):
+        if ordered[i] - ordered[i - 1] >= gap:
+            return i
+    return len(ordered)
+
+
+def mmr_select(candidates: list, vectors: dict, count: int, mmr_lambda: float = 0.7) -> list:
+    """Picks `count` of the (doc_id, doc, distance) candidates by maximal marginal relevance."""
+    def unit(vector):
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    units = {doc_id: unit(np.asarray(vectors[doc_id], dtype=np.float32)) for doc_id, _, _ in candidates if doc_id in vectors}
+    selected, remaining = [], list(candidates)
+    while remaining and len(selected) < count:
+        def score(candidate):
+            doc_id, _, distance = candidate
+            # For unit vectors, squared L2 distance d corresponds to cosine 1 - d / 2.
+            relevance = 1.0 - distance / 2.0
+            redundancy = max(
+                (float(units[doc_id] @ units[chosen[0]]) for chosen in selected
+                 if doc_id in units and chosen[0] in units),
+                default=0.0
+            )
+            return mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        best = max(remaining, key=score)
+        selected.append(best)
+        remaining.remove(best)
+    return selected
+
+
+def select_documents(hits: list, vector_lookup=None, max_k: int = 4, min_k: int = 1,
+                     score_threshold: float | None = 1.2, gap: float | None = 0.2,
+                     mmr: bool = True, mmr_lambda: float = 0.7) -> list:
+    """Trims one query's (doc_id, doc, distance) hits, in their retrieval order.
+
+    `vector_lookup(doc_ids)` returns {doc_id: vector}; MMR is skipped without it.
+    """
+    hits = hits[:max_k]
+    if not hits:
+        return []
+    passing = [hit for hit in hits if score_threshold is None or hit[2] <= score_threshold]
+    if len(passing) < min_k:
+        passing = hits[:min_k]
+    count = max(min_k, elbow_cut([distance for _, _, distance in passing], gap))
+
+    if mmr and vector_lookup is not None and count < len(passing):
+        chosen = {hit[0] for hit in mmr_select(passing, vector_lookup([hit[0] for hit in passing]), count, mmr_lambda)}
+        return [hit for hit in passing if hit[0] in chosen]
+    # Keep the retrieval order (hybrid modes rank by fused score, not distance) but
+    # drop the furthest hits.
+    kept = {hit[0] for hit in sorted(passing, key=lambda hit: hit[2])[:count]}
+    return [hit for hit in passing if hit[0] in kept]
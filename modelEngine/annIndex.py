@@ -0,0 +1,240 @@
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+from .vectorSearch import flat_search, merge_top_k, rerank_exact
+
+# --- Approximate Nearest-Neighbour Index ---
+# Small vaults are searched exactly by scanning the mapped vectors (vectorSearch.py).
+# Past a few thousand records that scan dominates query latency, so the vault can
+# carry a FAISS index over its rows, picked by record count:
+#
+#   flat   < 20k records    exact scan, no extra file
+#   hnsw   < 300k           graph index, best latency at high recall
+#   ivf    < 1M             inverted lists, memory-mapped from disk
+#   ivfpq  >= 1M            inverted lists of product-quantized codes, re-ranked
+#                           exactly from the mapped float32 vectors
+#
+# Any of these can keep its vectors compressed (vault_vector_storage: float16 or pq)
+# to cut the memory every process spends on the index. Candidates from a compressed
+# index are re-ranked with exact distances from the mapped float32 vector file, which
+# is only read for those rows.
+#
+# The index covers the rows that existed when it was built. Rows added later (new
+# records and updates) are scanned exactly and merged in, and deleted rows are
+# filtered out by their alive flag. Once that tail grows, the index is rebuilt.
+
+INDEX_TYPES = ("flat", "hnsw", "ivf", "ivfpq")
+STORAGE_TYPES = ("float32", "float16", "pq")
+FLAT_MAX_RECORDS = 20_000
+HNSW_MAX_RECORDS = 300_000
+IVF_MAX_RECORDS = 1_000_000
+
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_TRAIN_PER_LIST = 40
+IVF_NPROBE_FRACTION = 1 / 32
+# Candidates fetched per result, to make up for deleted rows and for the re-rank.
+OVERFETCH = 4
+PQ_MIN_ROWS = 10_000
+ADD_CHUNK = 65536
+
+
+def choose_index_type(record_count: int) -> str:
+    if record_count < FLAT_MAX_RECORDS:
+        return "flat"
+    if record_count < HNSW_MAX_RECORDS:
+        return "hnsw"
+    if record_count < IVF_MAX_RECORDS:
+        return "ivf"
+    return "ivfpq"
+
+
+def _pq_subquantizers(dim: int) -> int:
+    # About eight dimensions per one-byte code keeps recall high after the re-rank.
+    for m in (64, 48, 32, 24, 16, 12, 8, 4, 2):
+        if dim % m == 0 and dim // m >= 4:
+            return m
+    return 1
+
+
+def _train_sample(vectors, size: int) -> np.ndarray:
+    rows = len(vectors)
+    sample = np.sort(np.random.default_rng(0).choice(rows, size=min(rows, size), replace=False))
+    return np.ascontiguousarray(vectors[sample], dtype=np.float32)
+
+
+def build_index(vectors, index_type: str, storage: str = "float32"):
+    """Builds a FAISS index over all rows of `vectors` (which may be memory-mapped).
+
+    `storage` is how the index keeps vectors in memory: "float32", "float16" (half
+    the size) or "pq" (product-quantized codes, about 1/32). Compressed indexes are
+    re-ranked exactly from the float32 vectors at search time.
+    """
+    rows, dim = vectors.shape
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Unknown vector storage: {storage}")
+    pq_m = _pq_subquantizers(dim)
+    if index_type == "flat":
+        if storage == "float32":
+            raise ValueError("A float32 flat index is the vault's own vector file; no index is built.")
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16) if storage == "float16" \
+            else faiss.IndexPQ(dim, pq_m, 8)
+    elif index_type == "hnsw":
+        if storage == "float32":
+            index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        elif storage == "float16":
+            index = faiss.IndexHNSWSQ(dim, faiss.ScalarQuantizer.QT_fp16, HNSW_M)
+        else:
+            index = faiss.IndexHNSWPQ(dim, pq_m, HNSW_M)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = int(min(65536, max(16, 4 * math.sqrt(rows))))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivfpq" or storage == "pq":
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, 8)
+        elif storage == "float16":
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_fp16)
+        else:
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        index.train(_train_sample(vectors, max(nlist * IVF_TRAIN_PER_LIST, 50_000)))
+    else:
+        raise ValueError(f"Unknown index type: {index_type}")
+
+    if not index.is_trained:
+        index.train(_train_sample(vectors, 50_000))
+    for start in range(0, rows, ADD_CHUNK):
+        index.add(np.ascontiguousarray(vectors[start:start + ADD_CHUNK], dtype=np.float32))
+    return index
+
+
+def effective_storage(index_type: str, storage: str, rows: int) -> str:
+    """IVF-PQ always stores codes; PQ needs enough rows to train, so small vaults fall
+    back to float16."""
+    if index_type == "ivfpq":
+        return "pq"
+    if storage == "pq" and rows < PQ_MIN_ROWS:
+        return "float16"
+    return storage
+
+
+class AnnIndex:
+    """A FAISS index over the first `rows` rows of the vault."""
+
+    def __init__(self, index, index_type: str, rows: int, storage: str = "float32"):
+        self.index = index
+        self.index_type = index_type
+        self.rows = rows
+        self.storage = storage
+        self._memory_bytes = None
+        if index_type == "hnsw":
+            index.hnsw.efSearch = HNSW_EF_SEARCH
+        elif index_type in ("ivf", "ivfpq"):
+            index.nprobe = max(8, int(index.nlist * IVF_NPROBE_FRACTION))
+
+    @classmethod
+    def load(cls, path: str, index_type: str, rows: int, storage: str = "float32"):
+        # Inverted lists are memory-mapped; the HNSW graph has to be resident.
+        flags = faiss.IO_FLAG_MMAP if index_type in ("ivf", "ivfpq") else 0
+        return cls(faiss.read_index(path, flags), index_type, rows, storage)
+
+    def save(self, path: str):
+        tmp_path = path + ".tmp"
+        faiss.write_index(self.index, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _search_params(self, bits: np.ndarray):
+        # Parameters passed with a search replace the index's own, so they are copied over.
+        selector = faiss.IDSelectorBitmap(self.rows, faiss.swig_ptr(bits))
+        if self.index_type == "hnsw":
+            params = faiss.SearchParametersHNSW(sel=selector, efSearch=self.index.hnsw.efSearch)
+        elif self.index_type in ("ivf", "ivfpq"):
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=self.index.nprobe)
+        else:
+            params = faiss.SearchParameters(sel=selector)
+        # FAISS only holds pointers to these; keep them referenced for the search, as
+        # faiss's own wrappers do.
+        params.referenced_objects = [selector, bits]
+        return params
+
+    def memory_bytes(self) -> int:
+        """Size of the serialized index, a close proxy for what it keeps in memory."""
+        if self._memory_bytes is None:
+            # The index is never modified after it is built, so the size is computed once.
+            self._memory_bytes = int(faiss.serialize_index(self.index).size)
+        return self._memory_bytes
+
+    def search(self, queries: np.ndarray, k: int, vectors, alive, restrict: bool = False):
+        """Top-k (scores, rows) over the whole vault: the index for the rows it covers,
+        an exact scan for rows added since. Rows whose `alive` flag is 0 are skipped.
+
+        With `restrict`, `alive` is a filter mask and FAISS only visits the rows it
+        keeps, instead of spending the candidate list on rows that are dropped after.
+        """
+        fetch = min(self.rows, k * OVERFETCH)
+        if self.index_type == "hnsw":
+            self.index.hnsw.efSearch = max(HNSW_EF_SEARCH, fetch)
+        if restrict:
+            bits = np.packbits(np.asarray(alive[:self.rows]) != 0, bitorder="little")
+            scores, rows = self.index.search(queries, fetch, params=self._search_params(bits))
+        else:
+            scores, rows = self.index.search(queries, fetch)
+
+        valid = rows >= 0
+        dead = np.zeros_like(valid)
+        dead[valid] = np.asarray(alive)[rows[valid]] == 0
+        scores[~valid | dead] = np.inf
+        rows[~valid | dead] = -1
+        if self.storage != "float32":
+            # Compressed distances are approximate; recompute them from the full vectors.
+            scores = rerank_exact(scores, rows, queries, vectors)
+
+        tail = len(vectors) - self.rows
+        if tail > 0:
+            tail_scores, tail_rows = flat_search(vectors[self.rows:], alive[self.rows:], queries, k)
+            tail_rows[tail_rows >= 0] += self.rows
+            return merge_top_k(scores, rows, tail_scores, tail_rows, k)
+        return merge_top_k(scores, rows, None, None, k)
+
+
+def needs_rebuild(ann: AnnIndex | None, live_records: int, total_rows: int, configured: str = "auto",
+                  storage: str = "float32") -> bool:
+    """True when the configured (or auto-chosen) type or storage changed, or the
+    unindexed tail grew."""
+    wanted = choose_index_type(live_records) if configured == "auto" else configured
+    if wanted == "flat" and storage == "float32":
+        return ann is not None
+    if ann is None or ann.index_type != wanted or ann.storage != effective_storage(wanted, storage, total_rows):
+        return True
+    return total_rows - ann.rows > max(1000, ann.rows // 10)
+
+
+def main():
+    """Rebuilds the vault's ANN index:
+    python -m modelEngine.annIndex [--type auto|flat|hnsw|ivf|ivfpq] [--storage float32|float16|pq]"""
+    import argparse
+    from .parser import initialize_embeddings, load_config
+    from .vaultStore import VaultStore
+
+    parser = argparse.ArgumentParser(description="Rebuild the SecureFill vault's ANN index.")
+    parser.add_argument("--type", default="auto", choices=("auto",) + INDEX_TYPES)
+    parser.add_argument("--storage", default=None, choices=STORAGE_TYPES,
+                        help="vector storage (default: vault_vector_storage from config.yaml)")
+    parser.add_argument("--vault", default="./DataStore/faiss_index", help="vault folder")
+    args = parser.parse_args()
+
+    config = load_config() or {}
+    storage = args.storage or config.get("vault_vector_storage", "float32")
+    vault = VaultStore(args.vault, initialize_embeddings(config), index_type=args.type, vector_storage=storage)
+    start = time.perf_counter()
+    built = vault.rebuild_index(args.type)
+    print(f"Vault index is now '{built}' over {vault.count()} record(s) ({time.perf_counter() - start:.1f}s).")
+    vault.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import re
+
+# --- Exact Attribute Index ---
+# Most search queries name a vault attribute outright ("email address", "passport
+# number"). The vault keeps every record's attribute under a normalized key, with its
+# label ("work", "personal") and category, so those queries are answered by a keyed
+# lookup. Only queries that match no key or alias go through embedding search.
+
+# Canonical attribute key -> other names for it. Canonical keys follow the search
+# queries the field classifier produces. More aliases can be stored in the vault
+# itself with VaultStore.add_alias. Words with several meanings ("name", "pin",
+# "uid", "title") are not aliases: a query of just that word goes to vector search.
+ATTRIBUTE_ALIASES = {
+    "email address": ["email", "e mail", "email id", "mail", "mail id", "e mail address"],
+    "mobile number": ["phone", "phone number", "mobile", "mobile no", "phone no", "contact number",
+                      "telephone", "telephone number", "cell phone", "cell number"],
+    "full name": ["your name", "applicant name"],
+    "first name": ["given name", "fname"],
+    "last name": ["surname", "family name", "lname"],
+    "date of birth": ["dob", "birth date", "birthdate", "birthday"],
+    "home address": ["address", "street address", "residential address", "permanent address"],
+    "postal code": ["postcode", "zip", "zip code", "pin code", "pincode"],
+    "aadhar number": ["aadhaar", "aadhar", "aadhaar number", "aadhaar no", "aadhar no"],
+    "pan card number": ["pan", "pan number", "pan no", "pan card"],
+    "passport number": ["passport", "passport no"],
+    "bank account number": ["account number", "account no", "bank account"],
+    "ifsc code": ["ifsc"],
+    "upi id": ["upi", "vpa"],
+    "company name": ["company", "organization", "organisation", "employer"],
+    "job title": ["designation", "position"],
+}
+
+
+def normalize_attribute(text: str) -> str:
+    """Lowercases and strips punctuation, so "E-mail Address:" and "email address" meet."""
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).split())
+
+
+def builtin_aliases() -> list:
+    """(alias, canonical key) pairs, including each canonical key for itself."""
+    pairs = []
+    for key, aliases in ATTRIBUTE_ALIASES.items():
+        pairs.append((key, key))
+        pairs.extend((normalize_attribute(alias), key) for alias in aliases)
+    return pairs
+
+
+def attribute_entry(text: str, metadata: dict) -> tuple:
+    """Returns the (key, label, category) a record is indexed under. Records added
+    before structured metadata was stored are read from their "Field: ..." text."""
+    attribute = metadata.get("attribute")
+    if attribute is None and text.startswith("Field: "):
+        attribute = text[len("Field: "):].split(" | ", 1)[0]
+    return (
+        normalize_attribute(attribute),
+        normalize_attribute(metadata.get("label")),
+        normalize_attribute(metadata.get("category")),
+    )
@@ -0,0 +1,54 @@
+from .promptEncoding import estimate_tokens
+
+# --- Action-Plan Context Assembly ---
+# Fields that share a record ("email" and "confirm email") used to repeat it in the
+# prompt once per field. Documents are now merged across fields, ranked by their best
+# retrieval score and cut off at a token budget.
+
+def collect_documents(search_results: list) -> list:
+    """Deduplicates matched documents across fields, keeping each one's best score.
+
+    Scores are FAISS L2 distances, so lower is better. Documents without a score
+    (exact lookups) rank first.
+    """
+    documents = {}
+    for order, item in enumerate(search_results):
+        for doc in item.get('matched_documents', []):
+            content = doc['content']
+            score = doc.get('score')
+            entry = documents.get(content)
+            if entry is None:
+                documents[content] = {"content": content, "score": score, "fields": 1, "first_seen": order}
+                continue
+            entry["fields"] += 1
+            if score is None or (entry["score"] is not None and score < entry["score"]):
+                entry["score"] = score
+
+    return sorted(
+        documents.values(),
+        key=lambda d: (d["score"] is not None, d["score"] or 0.0, -d["fields"], d["first_seen"])
+    )
+
+
+def build_context(search_results: list, token_budget: int | None = 1500):
+    """Returns (context, stats) with the most relevant unique documents that fit the budget."""
+    ranked = collect_documents(search_results)
+    total_matches = sum(len(item.get('matched_documents', [])) for item in search_results)
+
+    lines, used_tokens = [], 0
+    for doc in ranked:
+        line = f"- {doc['content']}\n"
+        tokens = estimate_tokens(line)
+        # Always keep the best document, even if it alone is over budget.
+        if token_budget and lines and used_tokens + tokens > token_budget:
+            break
+        lines.append(line)
+        used_tokens += tokens
+
+    stats = {
+        "matches": total_matches,
+        "unique_documents": len(ranked),
+        "included_documents": len(lines),
+        "tokens": used_tokens,
+    }
+    return "".join(lines), stats
@@ -0,0 +1,168 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# --- Query Embedding Cache ---
+# The analysis chain keeps producing the same search queries ("email address",
+# "mobile number", ...). This wrapper sits in front of the real embedding model with
+# an in-memory LRU and an optional SQLite store that survives restarts. Only queries
+# are cached: documents are embedded once on ingestion, and caching them would only
+# push the queries out of the LRU.
+#
+# The model always embeds the text as given. The cache key collapses whitespace, and
+# for models with an uncased tokenizer also lower-cases, so "Email  Address" and
+# "email address" share an entry only where the model cannot tell them apart.
+
+UNCASED_MODELS = ("all-MiniLM-L6-v2", "all-MiniLM-L12-v2", "paraphrase-MiniLM-L6-v2", "multi-qa-MiniLM-L6-cos-v1")
+
+
+def is_uncased(model_name: str) -> bool:
+    return model_name.rsplit("/", 1)[-1] in UNCASED_MODELS
+
+
+def normalize_text(text: str, uncased: bool = False) -> str:
+    """The text a cache key is made from: whitespace runs collapsed, and lower-cased
+    for uncased models."""
+    text = " ".join(text.split())
+    return text.lower() if uncased else text
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper with a two-tier (memory LRU + disk) query cache keyed by model and text."""
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_entries: int = 2048, disk_path: str | None = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.uncased = is_uncased(model_name)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.embed_seconds = 0.0
+        if disk_path:
+            self._open_disk(disk_path)
+
+    # --- Disk tier ---
+    def _open_disk(self, disk_path: str):
+        self._db = sqlite3.connect(disk_path, check_same_thread=False)
+        self._db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+        row = self._db.execute("SELECT value FROM meta WHERE key = 'model_name'").fetchone()
+        if row is None or row[0] != self.model_name:
+            # Vectors from a different model are useless; start the store over.
+            if row is not None:
+                print(f"Embedding model changed ({row[0]} -> {self.model_name}), clearing embedding cache.")
+            self._db.execute("DELETE FROM embeddings")
+            self._db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('model_name', ?)", (self.model_name,))
+        self._db.commit()
+
+    def _disk_get(self, key: str):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+        return np.frombuffer(row[0], dtype=np.float32).tolist() if row else None
+
+    def _disk_put_many(self, items: list):
+        if self._db is None or not items:
+            return
+        self._db.executemany(
+            "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+            [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items],
+        )
+        self._db.commit()
+
+    # --- Memory tier ---
+    def _memory_put(self, key: str, vector: list):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _key(self, text: str) -> str:
+        normalized = normalize_text(text, self.uncased)
+        return hashlib.sha256(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    # --- Embeddings interface ---
+    def embed_documents(self, texts: list) -> list:
+        """Embeds documents for ingestion, bypassing the cache."""
+        return self.embeddings.embed_documents(texts)
+
+    def embed_queries(self, texts: list) -> list:
+        """Embeds a batch of search queries through the cache."""
+        keys = [self._key(t) for t in texts]
+        vectors = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    vectors[i] = self._memory[key]
+                    self.hits_memory += 1
+                    continue
+                vector = self._disk_get(key)
+                if vector is not None:
+                    self._memory_put(key, vector)
+                    vectors[i] = vector
+                    self.hits_disk += 1
+                    continue
+                missing.setdefault(key, []).append(i)
+
+        if missing:
+            missing_keys = list(missing)
+            missing_texts = [texts[missing[key][0]] for key in missing_keys]
+            start = time.time()
+            computed = self.embeddings.embed_documents(missing_texts)
+            elapsed = time.time() - start
+            with self._lock:
+                self.misses += len(missing_texts)
+                self.embed_seconds += elapsed
+                for key, vector in zip(missing_keys, computed):
+                    self._memory_put(key, vector)
+                    for i in missing[key]:
+                        vectors[i] = vector
+                self._disk_put_many(list(zip(missing_keys, computed)))
+
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_queries([text])[0]
+
+    # --- Reporting ---
+    def stats(self) -> dict:
+        """Hit/miss counters and an estimate of the embedding time the cache saved."""
+        with self._lock:
+            hits = self.hits_memory + self.hits_disk
+            per_text = self.embed_seconds / self.misses if self.misses else 0.0
+            return {
+                "model_name": self.model_name,
+                "memory_entries": len(self._memory),
+                "hits_memory": self.hits_memory,
+                "hits_disk": self.hits_disk,
+                "misses": self.misses,
+                "hit_rate": hits / (hits + self.misses) if hits + self.misses else 0.0,
+                "embed_seconds": self.embed_seconds,
+                "estimated_seconds_saved": hits * per_text,
+            }
+
+    def close(self):
+        """Closes the disk tier; the memory tier keeps working."""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM embeddings")
+                self._db.commit()
@@ -0,0 +1,279 @@
+import threading
+import time
+
+from . import parser
+from .adaptiveRetrieval import options_from_config
+from .planCache import PlanCache, form_handles, remap_handles, vault_version
+from .scanDelta import ScanSession
+
+# --- Resident Engine ---
+# Loading the embedding model and the FAISS index takes seconds, so the engine
+# loads everything once and keeps it warm for every fill that follows.
+
+class FormFillerEngine:
+    """Long-lived holder for the config, LLM client, embeddings and vector store."""
+
+    def __init__(self):
+        self.config = None
+        self.llm = None
+        self.vectorstore = None
+        self.analyze_chain = None
+        self.action_plan_chain = None
+        self.plan_cache = None
+        self._vault_version = None
+        self.error = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._load_lock = threading.Lock()
+        self._fill_lock = threading.Lock()
+
+    def start(self):
+        """Warms the engine up in a background thread and returns immediately."""
+        thread = threading.Thread(target=self.warm_up, daemon=True)
+        thread.start()
+        return thread
+
+    def warm_up(self):
+        """Loads every component once. Safe to call again; later calls are no-ops."""
+        with self._load_lock:
+            if self._ready.is_set():
+                return True
+            start = time.time()
+            self.error = None
+            try:
+                self.config = parser.load_config()
+                self.llm = parser.initialize_llm(self.config)
+                self.vectorstore = parser.initialize_vectorstore(self.config)
+                self._vault_version = vault_version()
+                if not all([self.config, self.llm, self.vectorstore]):
+                    raise Exception("Failed to initialize AI engine.")
+
+                self.analyze_chain = parser.analysis_prompt | self.llm | parser.StrOutputParser()
+                self.action_plan_chain = parser.action_plan_prompt | self.llm | parser.StrOutputParser()
+                if self.config.get("plan_cache_enabled", True):
+                    self.plan_cache = PlanCache(
+                        self.config.get("plan_cache_path", "./DataStore/plan_cache.json"),
+                        ttl_seconds=self.config.get("plan_cache_ttl_seconds", 7 * 24 * 3600),
+                        max_entries=self.config.get("plan_cache_max_entries", 200)
+                    )
+
+                # The first forward pass of a sentence-transformers model is much slower
+                # than the rest, so pay for it here instead of on the first fill.
+                self.vectorstore.embedding_function.embed_query("warm up")
+            except Exception as e:
+                self.error = str(e)
+                print(f"⚠️ Engine warm-up failed: {e}")
+                return False
+
+            self.load_seconds = time.time() - start
+            self._ready.set()
+            print(f"✓ Engine warm in {self.load_seconds:.2f} seconds.")
+            return True
+
+    def reload(self):
+        """Drops the loaded components and warms up again (e.g. after config changes).
+        Waits for a fill in progress to finish first."""
+        with self._fill_lock:
+            with self._load_lock:
+                self._ready.clear()
+                self._unload()
+            return self.warm_up()
+
+    def _unload(self):
+        """Closes the vault, the embedding cache and the model server connections, and
+        writes out the plan cache."""
+        if self.vectorstore is not None:
+            embedding_fn = self.vectorstore.embedding_function
+            self.vectorstore.join_background()
+            self.vectorstore.close()
+            if hasattr(embedding_fn, "close"):
+                embedding_fn.close()
+        if self.llm is not None:
+            self.llm.close()
+        if self.plan_cache is not None:
+            self.plan_cache.flush()
+        self.config = self.llm = self.vectorstore = None
+        self.analyze_chain = self.action_plan_chain = self.plan_cache = None
+        self._vault_version = None
+
+    # --- Readiness ---
+    def is_ready(self) -> bool:
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout: float | None = None) -> bool:
+        """Blocks until the engine is warm, or until the timeout expires."""
+        return self._ready.wait(timeout)
+
+    def _require_ready(self):
+        if not self.is_ready():
+            raise Exception("AI engine is not ready yet.")
+
+    def health(self) -> dict:
+        """Reports readiness and which components are loaded."""
+        embedding_fn = getattr(self.vectorstore, "embedding_function", None)
+        return {
+            "ready": self.is_ready(),
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "components": {
+                "config": self.config is not None,
+                "llm": self.llm is not None,
+                "vectorstore": self.vectorstore is not None,
+            },
+            "vault": self.vectorstore.manifest() if self.vectorstore else None,
+            "vault_index": self.vectorstore.index_info() if self.vectorstore else None,
+            "embedding_cache": embedding_fn.stats() if hasattr(embedding_fn, "stats") else None,
+            "plan_cache": self.plan_cache.stats() if self.plan_cache else None,
+            "model_server_latency": self.llm.latency_stats() if self.llm else None,
+        }
+
+    # --- Fill API ---
+    def fill(self, html_fields: list, user_prompt: str, on_status=None, on_action=None, top_k: int | None = None, bypass_cache: bool = False) -> list:
+        """Runs analysis, search and action-plan generation on the warm components.
+
+        Forms seen before with the same prompt and an unchanged vault are replayed from
+        the plan cache without calling the LLM; `bypass_cache` forces a fresh run.
+        If `on_action` is given, every action of the final plan is passed to it; with
+        `stream: true` in the config this happens while the plan is still generating.
+        Passing `top_k` fixes the number of documents per field; by default it adapts
+        to the retrieval distances (see adaptiveRetrieval.py).
+        """
+        self._require_ready()
+        with self._fill_lock:
+            # Checked again: a reload may have run (and failed) while this fill waited.
+            self._require_ready()
+            self._refresh_vault()
+            return self._fill(html_fields, user_prompt, on_status, on_action, top_k, bypass_cache)[0]
+
+    def fill_incremental(self, scanned_fields: list, user_prompt: str, session: ScanSession, on_status=None, on_action=None) -> list:
+        """fill() for one step of a multi-page form, given the host's [{"fp", "handle", "html"?}] scan.
+
+        Only fields `session` holds no search results for (for this prompt, vault and
+        field HTML) go through analysis and search; the plan covers those. If the page
+        has nothing new, the plan is regenerated from the stored results of its fields.
+        """
+        self._require_ready()
+        status = on_status or (lambda text: None)
+        scanned = session.apply_scan(scanned_fields)
+        if not scanned:
+            raise Exception("The scan returned no fields.")
+
+        with self._fill_lock:
+            self._require_ready()
+            self._refresh_vault()
+            analysed = session.begin(user_prompt, self._vault_version)
+            new = [field for field in scanned if field[0] not in analysed]
+            if new:
+                print(f"🧩 Scan delta: {len(new)} new or changed of {len(scanned)} field(s).")
+                plan, search_results = self._fill([html for _, _, html in new], user_prompt, on_status, on_action)
+                if search_results is not None:
+                    # A plan replayed from the cache has no results; its fields stay new.
+                    session.record(new, search_results)
+                return plan
+
+            search_results = session.results_for(scanned)
+            if search_results is None:
+                return self._fill([html for _, _, html in scanned], user_prompt, on_status, on_action)[0]
+            print(f"🧩 Scan delta: no new fields; reusing the search results of {len(scanned)} field(s).")
+            status("Creating final action plan...")
+            return self._generate_plan(search_results, user_prompt, on_action)
+
+    def _fill(self, html_fields: list, user_prompt: str, on_status=None, on_action=None, top_k: int | None = None,
+              bypass_cache: bool = False) -> tuple:
+        """The fill pipeline; returns (plan, search results), with no search results for a
+        plan replayed from the cache. The caller holds the fill lock and has refreshed the
+        vault, so `_vault_version` is current."""
+        status = on_status or (lambda text: None)
+        use_cache = self.plan_cache is not None and not bypass_cache
+        if use_cache:
+            cache_key = PlanCache.make_key(html_fields, user_prompt)
+            current_vault = self._vault_version
+            cached = self.plan_cache.get(cache_key, current_vault)
+            if cached:
+                # Handles are numbered per page load; the cached plan's are mapped onto
+                # the fields at the same positions in this scan.
+                action_plan = remap_handles(cached["action_plan"], cached.get("handles", []), form_handles(html_fields))
+                status("Replaying saved plan for this form...")
+                print(f"✓ Plan cache hit. Replaying {len(action_plan)} step(s).")
+                return self._deliver(action_plan, on_action), None
+
+        field_token_budget = self.config.get("prompt_field_token_budget", 3000)
+
+        # 1. Run analysis
+        status("Analyzing form fields...")
+        analysis_plan = parser.analyze_form_and_create_search_plan(
+            self.analyze_chain, html_fields, user_prompt,
+            use_heuristics=self.config.get("heuristic_classifier", True),
+            field_token_budget=field_token_budget
+        )
+        if not analysis_plan:
+            raise Exception("AI failed to create an analysis plan.")
+        saved_analysis = [dict(item) for item in analysis_plan]
+
+        # 2. Run search
+        status("Searching for your data...")
+        search_results = parser.search_vector_db(
+            self.vectorstore, analysis_plan, top_k=top_k or self.config.get("retrieval_max_k", 4),
+            exact_lookup=self.config.get("exact_attribute_lookup", True),
+            mode=self.config.get("retrieval_mode", "rrf"),
+            adaptive=None if top_k or not self.config.get("adaptive_top_k", True) else options_from_config(self.config),
+            user_prompt=user_prompt,
+            metadata_filters=self.config.get("metadata_filters", True)
+        )
+
+        # 3. Generate final plan
+        status("Creating final action plan...")
+        final_action_plan = self._generate_plan(search_results, user_prompt, on_action)
+
+        if use_cache and final_action_plan:
+            self.plan_cache.put(cache_key, current_vault, saved_analysis, final_action_plan, form_handles(html_fields))
+        return final_action_plan, search_results
+
+    def _generate_plan(self, search_results: list, user_prompt: str, on_action=None) -> list:
+        """Turns search results into the action plan, sharded or streamed as configured."""
+        input_options = {
+            "field_token_budget": self.config.get("prompt_field_token_budget", 3000),
+            "context_token_budget": self.config.get("context_token_budget", 1500),
+        }
+        shard_size = self.config.get("action_plan_shard_size", 8)
+        if self.config.get("sharded_action_plan", True) and len(search_results) > shard_size:
+            return parser.generate_action_plan_sharded(
+                self.action_plan_chain, search_results, user_prompt,
+                shard_size=shard_size,
+                max_concurrency=self.config.get("action_plan_max_concurrency", 4),
+                on_action=on_action,
+                **input_options
+            )
+        if on_action and self.config.get("stream", False):
+            return parser.generate_action_plan_streaming(
+                self.action_plan_chain, search_results, user_prompt, on_action, **input_options
+            )
+        raw_action_plan = parser.generate_action_plan(
+            self.action_plan_chain, search_results, user_prompt, **input_options
+        )
+        return self._deliver(parser.cleanup_action_plan(raw_action_plan), on_action)
+
+    def _refresh_vault(self):
+        """Reopens the vault if the management UI changed it since it was loaded."""
+        current = vault_version()
+        if current != self._vault_version:
+            print("Vault changed on disk, reopening it.")
+            previous = self.vectorstore
+            # Only the vault files are reopened (their vectors are memory-mapped); the
+            # embedding model and its query cache stay loaded.
+            reloaded = parser.initialize_vectorstore(
+                self.config, embeddings=previous.embedding_function if previous is not None else None
+            )
+            if reloaded is not None:
+                if previous is not None:
+                    previous.join_background()
+                    previous.close()
+                self.vectorstore = reloaded
+            self._vault_version = current
+
+    @staticmethod
+    def _deliver(plan: list, on_action) -> list:
+        if on_action:
+            for action in plan:
+                on_action(action)
+        return plan
@@ -0,0 +1,156 @@
+import re
+import time
+
+from .htmlFields import extract_fields, field_handle, field_to_html
+
+# --- Heuristic Field Classifier ---
+# Many fields say exactly what they want through autocomplete, type, name or id.
+# Those are resolved here locally, and only the rest go to the analysis LLM.
+
+# HTML autocomplete tokens -> (description, search_query)
+AUTOCOMPLETE_RULES = {
+    "name": ("Full name", "full name"),
+    "given-name": ("First name", "first name"),
+    "additional-name": ("Middle name", "middle name"),
+    "family-name": ("Last name", "last name"),
+    "email": ("Email address", "email address"),
+    "tel": ("Phone number", "mobile number"),
+    "tel-national": ("Phone number", "mobile number"),
+    "street-address": ("Street address", "home address"),
+    "address-line1": ("Address line 1", "home address"),
+    "address-line2": ("Address line 2", "home address"),
+    "address-level2": ("City", "city"),
+    "address-level1": ("State", "state"),
+    "postal-code": ("Postal code", "postal code"),
+    "country": ("Country", "country"),
+    "country-name": ("Country", "country"),
+    "bday": ("Date of birth", "date of birth"),
+    "sex": ("Gender", "gender"),
+    "organization": ("Company name", "company name"),
+    "organization-title": ("Job title", "job title"),
+    "cc-name": ("Name on card", "name on credit card"),
+    "cc-number": ("Card number", "credit card number"),
+    "cc-exp": ("Card expiry date", "credit card expiry date"),
+    "username": ("Username", "username"),
+    "url": ("Website", "website"),
+}
+
+# Input types that on their own say what the field holds.
+TYPE_RULES = {
+    "email": ("Email address", "email address"),
+    "tel": ("Phone number", "mobile number"),
+    "url": ("Website", "website"),
+}
+
+# Normalized name/id -> (description, search_query). Matched against the whole
+# name/id after splitting camelCase and separators, so "userEmail" and "user_email"
+# both become "user email". Identifiers that mean different things on different
+# forms (a bare "name", "pin", "uid") are left to the LLM.
+NAME_RULES = [
+    (r"^(user )?(e ?mail|email address|email id)$", ("Email address", "email address")),
+    (r"^(phone|mobile|mobile number|phone number|mobile no|phone no|contact number|tel|telephone)$", ("Phone number", "mobile number")),
+    (r"^(first name|fname|given name)$", ("First name", "first name")),
+    (r"^(middle name|mname)$", ("Middle name", "middle name")),
+    (r"^(last name|lname|surname|family name)$", ("Last name", "last name")),
+    (r"^(full name|your name|applicant name)$", ("Full name", "full name")),
+    (r"^(dob|date of birth|birth date|birthdate|birthday)$", ("Date of birth", "date of birth")),
+    (r"^(postal code|postcode|zip|zip code|zipcode|pincode|pin code)$", ("Postal code", "postal code")),
+    (r"^(city|town)$", ("City", "city")),
+    (r"^(state|province|region)$", ("State", "state")),
+    (r"^(country)$", ("Country", "country")),
+    (r"^(address|street address|address line ?1|address1|addr)$", ("Street address", "home address")),
+    (r"^(pan|pan number|pan no|pan card|pan card number)$", ("PAN card number", "PAN card number")),
+    (r"^(aadhaar|aadhar|aadhaar number|aadhar number|aadhaar no|aadhar no)$", ("Aadhaar number", "aadhar number")),
+    (r"^(passport|passport number|passport no)$", ("Passport number", "passport number")),
+    (r"^(ifsc|ifsc code)$", ("IFSC code", "IFSC code")),
+    (r"^(account number|account no|acc no|bank account|bank account number)$", ("Bank account number", "bank account number")),
+    (r"^(upi|upi id|vpa)$", ("UPI ID", "UPI ID")),
+]
+_COMPILED_NAME_RULES = [(re.compile(pattern), result) for pattern, result in NAME_RULES]
+
+# Controls that never take user data.
+IGNORED_TYPES = {"submit", "button", "reset", "image", "file"}
+
+# Contact-style queries that the LLM would tailor when the user asks for a profile.
+PROFILE_SENSITIVE_QUERIES = {"email address", "mobile number", "home address"}
+PROFILE_KEYWORDS = {
+    "work": "work", "office": "work", "company": "work", "business": "work",
+    "personal": "personal", "home": "personal", "secondary": "secondary", "alternate": "alternate",
+}
+
+
+def _normalize_identifier(text: str) -> str:
+    text = re.sub(r"([a-z])([A-Z])", r"\1 \2", text or "")
+    text = re.sub(r"[\[\]_\-.:]+", " ", text)
+    return " ".join(text.lower().split())
+
+
+def _profile_from_prompt(user_prompt: str):
+    for word in re.findall(r"[a-z]+", (user_prompt or "").lower()):
+        if word in PROFILE_KEYWORDS:
+            return PROFILE_KEYWORDS[word]
+    return None
+
+
+def classify_field(field: dict):
+    """Returns (description, search_query) if the field is unambiguous, else None."""
+    attrs = field["attrs"]
+
+    for token in attrs.get("autocomplete", "").lower().split():
+        if token in AUTOCOMPLETE_RULES:
+            return AUTOCOMPLETE_RULES[token]
+
+    for attr in ("name", "id"):
+        identifier = _normalize_identifier(attrs.get(attr, ""))
+        if not identifier:
+            continue
+        for pattern, result in _COMPILED_NAME_RULES:
+            if pattern.match(identifier):
+                return result
+
+    if field["tag"] == "input":
+        return TYPE_RULES.get(attrs.get("type", "").lower())
+    return None
+
+
+def classify_fields(html_fields: list, user_prompt: str = ""):
+    """Splits the scanned snippets into locally resolved plan items and snippets that
+    still need the LLM. A snippet is resolved only if every control in it is.
+
+    Returns (resolved_items, unresolved_snippets, stats).
+    """
+    start = time.perf_counter()
+    profile = _profile_from_prompt(user_prompt)
+    resolved_items, unresolved_snippets = [], []
+    total_fields = resolved_fields = 0
+
+    for section, snippet in enumerate(html_fields):
+        fields = [f for f in extract_fields(snippet) if f["attrs"].get("type", "").lower() not in IGNORED_TYPES]
+        total_fields += len(fields)
+        results = [classify_field(f) for f in fields]
+        resolved_fields += sum(1 for r in results if r)
+
+        if not fields or not all(results):
+            unresolved_snippets.append(snippet)
+            continue
+
+        for field, (description, search_query) in zip(fields, results):
+            if profile and search_query in PROFILE_SENSITIVE_QUERIES:
+                search_query = f"{profile} {search_query}"
+            resolved_items.append({
+                "handle": field_handle(field),
+                "original_html": snippet if len(fields) == 1 else field_to_html(field),
+                "description": description,
+                "search_query": search_query,
+                "section": section,
+            })
+
+    stats = {
+        "fields": total_fields,
+        "resolved_fields": resolved_fields,
+        "snippets": len(html_fields),
+        "snippets_sent_to_llm": len(unresolved_snippets),
+        "coverage": resolved_fields / total_fields if total_fields else 0.0,
+        "milliseconds": (time.perf_counter() - start) * 1000,
+    }
+    return resolved_items, unresolved_snippets, stats
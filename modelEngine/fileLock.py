@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+    import fcntl
+
+# --- Cross-Process File Lock ---
+# The engine (main.py) and the management UI (dbManagement) open the same vault from
+# separate processes. Every write, recovery and swap runs under an exclusive lock on
+# <folder>.lock, so one process never replays or deletes what another is writing.
+# The OS releases the lock when the holding process dies, so a crash never leaves the
+# vault locked.
+
+POLL_SECONDS = 0.05
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class FileLock:
+    """Exclusive lock on a file, held across processes. Re-entrant within a process:
+    every VaultStore of the same folder shares one instance (see `for_path`), and
+    nested acquisitions by the holding thread only lock the file once."""
+
+    def __init__(self, path: str, timeout: float | None = None):
+        self.path = path
+        self.timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    @classmethod
+    def for_path(cls, path: str, timeout: float | None = None) -> "FileLock":
+        # Locks held through two descriptors of one file would block each other, even
+        # inside one process, so the process keeps a single lock per path.
+        key = os.path.normcase(os.path.abspath(path))
+        with _registry_lock:
+            lock = _registry.get(key)
+            if lock is None:
+                lock = _registry[key] = cls(path, timeout)
+            return lock
+
+    def acquire(self):
+        if not self._thread_lock.acquire(timeout=-1 if self.timeout is None else self.timeout):
+            raise TimeoutError(f"Timed out waiting for {self.path}.")
+        try:
+            if self._depth == 0:
+                self._file = self._lock_file()
+            self._depth += 1
+        except BaseException:
+            self._thread_lock.release()
+            raise
+
+    def release(self):
+        self._depth -= 1
+        if self._depth == 0:
+            file, self._file = self._file, None
+            try:
+                if msvcrt:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+            finally:
+                file.close()
+        self._thread_lock.release()
+
+    def _lock_file(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        file = open(self.path, "a+b")
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        while True:
+            try:
+                if msvcrt:
+                    file.seek(0)
+                    msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return file
+            except OSError:
+                if deadline is not None and time.monotonic() >= deadline:
+                    file.close()
+                    raise TimeoutError(f"{self.path} is held by another process.")
+                time.sleep(POLL_SECONDS)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
@@ -0,0 +1,100 @@
+from html import escape
+from html.parser import HTMLParser
+
+# --- HTML Field Extraction ---
+# The extension sends HTML snippets (a field's container, or its parent element).
+# These helpers pull the form controls back out of a snippet so the engine can work
+# with their attributes without asking the LLM.
+
+FIELD_TAGS = ("input", "select", "textarea")
+# The scanner tags every control with a short handle ("f17"); prompts and action plans
+# refer to fields by it instead of by a CSS selector.
+HANDLE_ATTR = "data-securefill-handle"
+
+
+class _FieldCollector(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.fields = []
+        self._current_select = None
+        self._current_option = None
+        self._current_label = None
+        self.labels_by_id = {}
+
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: (value if value is not None else "") for name, value in attrs}
+        if tag == "label":
+            self._current_label = {"for": attrs.get("for"), "text": "", "fields": []}
+        elif tag in FIELD_TAGS:
+            if tag == "input" and attrs.get("type", "").lower() == "hidden":
+                return
+            field = {"tag": tag, "attrs": attrs, "options": [], "label": ""}
+            self.fields.append(field)
+            if self._current_label is not None:
+                self._current_label["fields"].append(field)
+            if tag == "select":
+                self._current_select = field
+        elif tag == "option" and self._current_select is not None:
+            self._current_option = {"value": attrs.get("value"), "text": ""}
+            self._current_select["options"].append(self._current_option)
+
+    def handle_endtag(self, tag):
+        if tag == "label" and self._current_label is not None:
+            text = " ".join(self._current_label["text"].split())
+            for field in self._current_label["fields"]:
+                field["label"] = text
+            if self._current_label["for"]:
+                self.labels_by_id[self._current_label["for"]] = text
+            self._current_label = None
+        elif tag == "select":
+            self._current_select = None
+        elif tag == "option":
+            self._current_option = None
+
+    def handle_data(self, data):
+        if self._current_option is not None:
+            self._current_option["text"] += data
+        elif self._current_label is not None:
+            self._current_label["text"] += data
+
+
+def extract_fields(snippet: str) -> list:
+    """Returns [{"tag", "attrs", "options", "label"}] for every visible form control in the snippet."""
+    collector = _FieldCollector()
+    try:
+        collector.feed(snippet or "")
+        collector.close()
+    except Exception:
+        return []
+    for field in collector.fields:
+        if not field["label"]:
+            field["label"] = collector.labels_by_id.get(field["attrs"].get("id"), "")
+        for option in field["options"]:
+            option["text"] = " ".join(option["text"].split())
+            if option["value"] is None:
+                option["value"] = option["text"]
+    return collector.fields
+
+
+def field_handle(field: dict) -> str | None:
+    return field["attrs"].get(HANDLE_ATTR) or None
+
+
+def field_handles(html_fields: list) -> dict:
+    """{handle: (field HTML, snippet index)} for every tagged control in the snippets."""
+    handles = {}
+    for section, snippet in enumerate(html_fields):
+        for field in extract_fields(snippet):
+            handle = field_handle(field)
+            if handle:
+                handles[handle] = (field_to_html(field), section)
+    return handles
+
+
+def field_to_html(field: dict) -> str:
+    """Rebuilds compact HTML for a single extracted field (with its options, for selects)."""
+    attrs = "".join(f' {name}="{escape(value)}"' if value != "" else f" {name}" for name, value in field["attrs"].items())
+    if field["tag"] != "select":
+        return f"<{field['tag']}{attrs}>"
+    options = "".join(f'<option value="{escape(o["value"])}">{escape(o["text"])}</option>' for o in field["options"])
+    return f"<select{attrs}>{options}</select>"
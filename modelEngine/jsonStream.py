@@ -0,0 +1,74 @@
+import json
+
+# --- Incremental JSON Array Parsing ---
+# The action-plan LLM returns a JSON array of objects. When the response is streamed,
+# each object can be used as soon as its closing brace arrives instead of waiting
+# for the whole array.
+
+class IncrementalJSONArrayParser:
+    """Feed it text chunks; it returns the top-level array elements completed so far.
+
+    Text before the opening '[' (preamble, ```json fences) is ignored, as is anything
+    after the closing ']'. Elements that fail to parse are skipped.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._array_started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start = None
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
+
+    def feed(self, text: str) -> list:
+        completed = []
+        self._buffer += text
+        while self._pos < len(self._buffer) and not self._finished:
+            char = self._buffer[self._pos]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif not self._array_started:
+                if char == "[":
+                    self._array_started = True
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 0:
+                    self._element_start = self._pos
+                self._depth += 1
+            elif char in "}]":
+                if self._depth == 0 and char == "]":
+                    self._finished = True
+                else:
+                    self._depth -= 1
+                    if self._depth == 0 and self._element_start is not None:
+                        element_text = self._buffer[self._element_start:self._pos + 1]
+                        self._element_start = None
+                        try:
+                            completed.append(json.loads(element_text))
+                        except json.JSONDecodeError:
+                            pass
+
+            self._pos += 1
+
+        # Drop text that can no longer be part of an element to keep memory bounded.
+        if self._element_start is None and not self._in_string:
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        elif self._element_start is not None and self._element_start > 0:
+            self._buffer = self._buffer[self._element_start:]
+            self._pos -= self._element_start
+            self._element_start = 0
+        return completed
@@ -0,0 +1,138 @@
+import heapq
+import math
+import re
+from collections import Counter
+
+# --- Lexical (BM25) Index ---
+# Dense retrieval over short records ("PAN Number | Value: ABCDE1234F") often ranks a
+# neighbour above the record whose words actually match. A BM25 inverted index is
+# kept in the vault's SQLite file next to the vectors and updated with every insert,
+# update and delete, and the two rankings are fused per query.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS terms (
+    term TEXT NOT NULL,
+    id TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS terms_by_id ON terms (id);
+CREATE TABLE IF NOT EXISTS doc_lengths (id TEXT PRIMARY KEY, length INTEGER NOT NULL);
+"""
+
+# Words every record or query carries; they only add noise to the scores.
+STOPWORDS = {
+    "a", "an", "and", "the", "of", "to", "for", "in", "on", "is", "my", "your", "user",
+    "field", "value", "description", "this",
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Retrieval modes accepted per query.
+MODES = ("vector", "bm25", "rrf", "weighted")
+RRF_K = 60
+
+
+def tokenize(text: str) -> list:
+    return [t for t in re.findall(r"[a-z0-9]+", (text or "").lower()) if t not in STOPWORDS]
+
+
+def index_documents(db, records):
+    """Adds or replaces the postings of (id, text) records. Call inside a transaction."""
+    records = list(records)
+    remove_documents(db, [doc_id for doc_id, _ in records])
+    postings, lengths = [], []
+    for doc_id, text in records:
+        counts = Counter(tokenize(text))
+        postings.extend((term, doc_id, tf) for term, tf in counts.items())
+        lengths.append((doc_id, sum(counts.values())))
+    db.executemany("INSERT INTO terms (term, id, tf) VALUES (?, ?, ?)", postings)
+    db.executemany("INSERT INTO doc_lengths (id, length) VALUES (?, ?)", lengths)
+    _adjust_totals(db, len(lengths), sum(length for _, length in lengths))
+
+
+def remove_documents(db, doc_ids: list):
+    """Drops the postings of these records. Call inside a transaction."""
+    removed_docs = removed_length = 0
+    for doc_id in doc_ids:
+        found = db.execute("SELECT length FROM doc_lengths WHERE id = ?", (doc_id,)).fetchone()
+        if found is None:
+            continue
+        db.execute("DELETE FROM terms WHERE id = ?", (doc_id,))
+        db.execute("DELETE FROM doc_lengths WHERE id = ?", (doc_id,))
+        removed_docs += 1
+        removed_length += found[0]
+    if removed_docs:
+        _adjust_totals(db, -removed_docs, -removed_length)
+
+
+def _adjust_totals(db, docs: int, length: int):
+    # Collection size and total length are kept as running totals so a query never
+    # has to scan doc_lengths.
+    current = _totals(db)
+    db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                   [("bm25_docs", str(current[0] + docs)), ("bm25_length", str(current[1] + length))])
+
+
+def _totals(db) -> tuple:
+    meta = dict(db.execute("SELECT key, value FROM meta WHERE key IN ('bm25_docs', 'bm25_length')"))
+    return int(meta.get("bm25_docs", 0)), int(meta.get("bm25_length", 0))
+
+
+def bm25_search(db, query: str, k: int = 10, allowed: set | None = None) -> list:
+    """Returns up to k (id, score) pairs, best first. With `allowed`, only those IDs
+    are scored."""
+    docs, total_length = _totals(db)
+    terms = set(tokenize(query))
+    if not docs or not terms:
+        return []
+    average_length = total_length / docs
+    scores = Counter()
+    for term in terms:
+        postings = db.execute(
+            "SELECT t.id, t.tf, d.length FROM terms t JOIN doc_lengths d ON d.id = t.id WHERE t.term = ?", (term,)
+        ).fetchall()
+        if not postings:
+            continue
+        idf = math.log(1 + (docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for doc_id, tf, length in postings:
+            if allowed is not None and doc_id not in allowed:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / average_length)
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+    return heapq.nlargest(k, scores.items(), key=lambda pair: pair[1])
+
+
+# --- Score fusion ---
+def reciprocal_rank_fusion(rankings: list) -> list:
+    """Fuses ranked ID lists; returns IDs by summed 1 / (RRF_K + rank), best first."""
+    fused = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            fused[doc_id] += 1.0 / (RRF_K + rank + 1)
+    return [doc_id for doc_id, _ in fused.most_common()]
+
+
+def weighted_fusion(vector_hits: list, lexical_hits: list, alpha: float = 0.5) -> list:
+    """Fuses (id, L2 distance) and (id, BM25 score) lists after min-max normalizing each
+    to 0..1 (1 = best). `alpha` weighs the vector side. Returns IDs best first."""
+    def normalized(hits, lower_is_better):
+        if not hits:
+            return {}
+        values = [score for _, score in hits]
+        low, high = min(values), max(values)
+        if high == low:
+            return {doc_id: 1.0 for doc_id, _ in hits}
+        span = high - low
+        return {
+            doc_id: (high - score) / span if lower_is_better else (score - low) / span
+            for doc_id, score in hits
+        }
+
+    vector_scores = normalized(vector_hits, lower_is_better=True)
+    lexical_scores = normalized(lexical_hits, lower_is_better=False)
+    fused = Counter()
+    for doc_id in dict.fromkeys([*vector_scores, *lexical_scores]):
+        fused[doc_id] = alpha * vector_scores.get(doc_id, 0.0) + (1 - alpha) * lexical_scores.get(doc_id, 0.0)
+    return [doc_id for doc_id, _ in fused.most_common()]
@@ -0,0 +1,95 @@
+import re
+
+import numpy as np
+
+from .attributeIndex import normalize_attribute
+from .fieldClassifier import PROFILE_KEYWORDS
+
+# --- Metadata Filters ---
+# Records carry a category ("contact", "address") and a label ("work", "personal").
+# When the user asks for their work details, searching the whole vault leaves the
+# choice to the LLM and fills its context with the personal variants too. A filter
+# restricts a search to records with the given values before any distance is computed.
+#
+# The vault keeps one boolean row mask per category and per label value. The masks are
+# built from the attribute index on the first filtered search, extended by later writes
+# and dropped when compaction renumbers the rows. Within a field the values are OR-ed,
+# across fields AND-ed, and the result is AND-ed with the alive flags.
+#
+# Filters come from a plan item's own "filters" ({"label": "work"}) or from label words
+# in the user's prompt. They are a preference: a lookup or search that finds nothing
+# under the filter falls back to the whole vault, so "use my work info" still fills a
+# name that only has a "primary" record.
+
+FILTER_FIELDS = ("category", "label")
+
+
+def freeze_filters(filters) -> tuple | None:
+    """Normalizes {field: value or [values]} into a hashable, sorted form, or None when
+    it filters nothing. Fields other than category and label are ignored."""
+    if not filters:
+        return None
+    frozen = []
+    for field in FILTER_FIELDS:
+        values = filters.get(field)
+        if values is None:
+            continue
+        values = [values] if isinstance(values, str) else values
+        values = tuple(sorted({normalize_attribute(value) for value in values} - {""}))
+        if values:
+            frozen.append((field, values))
+    return tuple(frozen) or None
+
+
+def filters_from_prompt(user_prompt: str, labels: list) -> dict | None:
+    """A label filter for the vault labels the prompt names, directly ("work") or
+    through a profile keyword ("office" -> "work")."""
+    labels = set(labels)
+    named = []
+    for word in re.findall(r"[a-z]+", (user_prompt or "").lower()):
+        for label in (word, PROFILE_KEYWORDS.get(word)):
+            if label in labels and label not in named:
+                named.append(label)
+    return {"label": named} if named else None
+
+
+class RowBitmaps:
+    """One boolean mask over vault rows per (field, value)."""
+
+    def __init__(self, rows: int):
+        self.rows = rows
+        self._masks = {}
+
+    def set(self, entries, rows: int | None = None):
+        """Marks (row, category, label) entries, growing every mask to `rows` first."""
+        if rows is not None and rows > self.rows:
+            self.rows = rows
+            for key, mask in self._masks.items():
+                if len(mask) < rows:
+                    # Grow geometrically so a run of single-record writes stays cheap.
+                    grown = np.zeros(max(rows, 2 * len(mask)), dtype=bool)
+                    grown[:len(mask)] = mask
+                    self._masks[key] = grown
+        for row, *values in entries:
+            for field, value in zip(FILTER_FIELDS, values):
+                if not value:
+                    continue
+                mask = self._masks.get((field, value))
+                if mask is None:
+                    mask = self._masks[(field, value)] = np.zeros(self.rows, dtype=bool)
+                mask[row] = True
+
+    def values(self, field: str) -> list:
+        return sorted(value for mask_field, value in self._masks if mask_field == field)
+
+    def mask(self, frozen_filters: tuple) -> np.ndarray:
+        """Rows that match every field of the filters, on any of the field's values."""
+        result = np.ones(self.rows, dtype=bool)
+        for field, values in frozen_filters:
+            matching = np.zeros(self.rows, dtype=bool)
+            for value in values:
+                mask = self._masks.get((field, value))
+                if mask is not None:
+                    matching |= mask[:self.rows]
+            result &= matching
+        return result
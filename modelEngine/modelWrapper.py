@@ -1,33 +1,92 @@
-import requests
-from typing import List, Any
+import json
+import uuid
+from typing import List, Any, Iterator
 
-from pydantic import Field
+from pydantic import Field, PrivateAttr
 from langchain_core.language_models.chat_models import BaseChatModel
-from langchain_core.messages import HumanMessage, AIMessage, BaseMessage
-from langchain_core.outputs import ChatResult, ChatGeneration
-from langchain_core.callbacks.manager import CallbackManagerForLLMRun
+from langchain_core.messages import HumanMessage, AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatResult, ChatGeneration, ChatGenerationChunk
+from langchain_core.callbacks.manager import CallbackManagerForLLMRun, AsyncCallbackManagerForLLMRun
+
+from .transport import ModelServerTransport
 
 class CustomHTTPChatModel(BaseChatModel):
     api_key: str = Field(...)
     base_url: str = Field(...)
     workspace_slug: str = Field(...)
+    stream_timeout: float = Field(60)
+    session_id: str = Field(default_factory=lambda: f"securefill-{uuid.uuid4()}")
+    connect_timeout: float = Field(5)
+    read_timeout: float = Field(120)
+    max_retries: int = Field(3)
+    pool_size: int = Field(10)
 
-    def _call_api(self, message: str) -> str:
-        url = f"{self.base_url}/workspace/{self.workspace_slug}/chat"
-        headers = {
+    _transport: ModelServerTransport | None = PrivateAttr(default=None)
+
+    @property
+    def transport(self) -> ModelServerTransport:
+        if self._transport is None:
+            self._transport = ModelServerTransport(
+                pool_size=self.pool_size,
+                connect_timeout=self.connect_timeout,
+                read_timeout=self.read_timeout,
+                max_retries=self.max_retries
+            )
+        return self._transport
+
+    def latency_stats(self) -> dict:
+        """Latency histograms of the model server endpoints, keyed by endpoint."""
+        return self.transport.latency_stats()
+
+    def close(self):
+        """Closes the pooled connections; the next call opens a new transport."""
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def _headers(self) -> dict:
+        return {
             "accept": "application/json",
             "Content-Type": "application/json",
             "Authorization": "Bearer " + self.api_key
         }
-        payload = {
+
+    def _payload(self, message: str) -> dict:
+        return {
             "message": message,
             "mode": "chat",
-            "sessionId": "example-session-id",
+            "sessionId": self.session_id,
             "attachments": []
         }
-        resp = requests.post(url, headers=headers, json=payload)
-        resp.raise_for_status()
-        return resp.json().get("textResponse", "")
+
+    def _chat_url(self, endpoint: str) -> str:
+        return f"{self.base_url}/workspace/{self.workspace_slug}/{endpoint}"
+
+    def _call_api(self, message: str) -> str:
+        data = self.transport.post_json(self._chat_url("chat"), "chat", self._headers(), self._payload(message))
+        return data.get("textResponse", "")
+
+    async def _acall_api(self, message: str) -> str:
+        data = await self.transport.apost_json(self._chat_url("chat"), "chat", self._headers(), self._payload(message))
+        return data.get("textResponse", "")
+
+    def _stream_api(self, message: str) -> Iterator[str]:
+        """Yields text chunks from the server's server-sent-events chat endpoint."""
+        headers = {**self._headers(), "accept": "text/event-stream"}
+        resp = self.transport.open_stream(
+            self._chat_url("stream-chat"), "stream-chat", headers, self._payload(message), self.stream_timeout
+        )
+        with resp:
+            for line in resp.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):].strip())
+                if event.get("error"):
+                    raise RuntimeError(f"Model server stream error: {event['error']}")
+                if event.get("textResponse"):
+                    yield event["textResponse"]
+                if event.get("close"):
+                    break
 
     def _generate(
         self,
@@ -44,6 +103,35 @@ class CustomHTTPChatModel(BaseChatModel):
         )
         return ChatResult(generations=[generation])
 
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> ChatResult:
+        user_text = messages[-1].content
+        response_text = await self._acall_api(user_text)
+        generation = ChatGeneration(
+            message=AIMessage(content=response_text),
+            text=response_text
+        )
+        return ChatResult(generations=[generation])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: List[str] | None = None,
+        run_manager: CallbackManagerForLLMRun | None = None,
+        **kwargs: Any
+    ) -> Iterator[ChatGenerationChunk]:
+        user_text = messages[-1].content
+        for text in self._stream_api(user_text):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=text))
+            if run_manager:
+                run_manager.on_llm_new_token(text, chunk=chunk)
+            yield chunk
+
     @property
     def _llm_type(self) -> str:
         return "custom-http-chat"
@@ -5,12 +5,20 @@ import re
 
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 # Corrected import: Removed the leading dot. This assumes modelWrapper.py is in the same directory.
 from .modelWrapper import CustomHTTPChatModel
+from .embeddingCache import CachedEmbeddings
+from .fieldClassifier import classify_fields
+from .htmlFields import field_handles
+from .jsonStream import IncrementalJSONArrayParser
+from . import promptEncoding
+from .adaptiveRetrieval import select_documents
+from .metadataFilter import filters_from_prompt
+from .contextBuilder import build_context
+from .vaultStore import VaultNeedsRecovery, VaultStore
 
-# --- Configuration & Setup (No changes here) ---
+# --- Configuration & Setup ---
 
 def load_config():
     """Loads the API configuration from config.yaml."""
@@ -27,20 +35,54 @@ def initialize_llm(config):
     return CustomHTTPChatModel(
         api_key=config.get("api_key"),
         base_url=config.get("model_server_base_url"),
-        workspace_slug=config.get("workspace_slug")
+        workspace_slug=config.get("workspace_slug"),
+        stream_timeout=config.get("stream_timeout", 60),
+        connect_timeout=config.get("connect_timeout", 5),
+        read_timeout=config.get("read_timeout", 120),
+        max_retries=config.get("max_retries", 3),
+        pool_size=config.get("http_pool_size", 10),
+        **({"session_id": config["session_id"]} if config.get("session_id") else {})
     )
 
-def initialize_vectorstore():
-    """Initializes the FAISS vector store from a local directory."""
+def initialize_embeddings(config=None):
+    """Initializes the embedding model, behind the query-embedding cache."""
+    config = config or {}
+    model_name = config.get("embedding_model", "all-MiniLM-L6-v2")
+    return CachedEmbeddings(
+        HuggingFaceEmbeddings(model_name=model_name),
+        model_name=model_name,
+        max_entries=config.get("embedding_cache_size", 2048),
+        disk_path=config.get("embedding_cache_path")
+    )
+
+def initialize_vectorstore(config=None, embeddings=None, read_only: bool = True):
+    """Opens the vault from a local directory, read-only unless asked otherwise: the
+    engine only searches it, while the management UI writes to it from its own process.
+    Pass `embeddings` to reuse an already loaded model and its cache."""
+    config = config or {}
+
+    def open_vault(writable: bool):
+        return VaultStore("./DataStore/faiss_index", embedding_fn,
+                          hybrid_alpha=config.get("hybrid_alpha", 0.5),
+                          index_type=config.get("vault_index_type", "auto"),
+                          vector_storage=config.get("vault_vector_storage", "float32"),
+                          read_only=not writable)
+
     try:
-        embedding_fn = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-        return FAISS.load_local(
-            folder_path="./DataStore/faiss_index",
-            embeddings=embedding_fn,
-            allow_dangerous_deserialization=True
-        )
+        embedding_fn = embeddings or initialize_embeddings(config)
+        try:
+            vault = open_vault(not read_only)
+        except VaultNeedsRecovery as e:
+            # A writable open finishes an interrupted write (or migrates a LangChain
+            # folder) under the vault lock; then the vault is opened read-only again.
+            print(f"{e} Recovering it first.")
+            open_vault(True).close()
+            vault = open_vault(False)
+        if not vault.loaded:
+            raise FileNotFoundError("./DataStore/faiss_index does not exist yet.")
+        return vault
     except Exception as e:
-        print(f"Error loading FAISS index: {e}")
+        print(f"Error loading the vault: {e}")
         return None
 
 # --- Core LLM Chains (PROMPT HAS BEEN IMPROVED) ---
@@ -48,7 +90,7 @@ analysis_prompt_template = """
 You are an expert form analysis engine. Your task is to analyze a list of HTML input fields and a user's instructions to create a structured JSON plan for a vector database search.
 User's Instructions: "{user_prompt}"
 List of HTML Input Fields: {html_fields}
-Your goal is to return a single JSON array of objects. Each object must represent one HTML field and contain: "original_html", "description", and "search_query".
+Your goal is to return a single JSON array of objects. Each object must represent one HTML field and contain: "handle" (the field's "handle" or data-securefill-handle value, e.g. "f17"), "description", and "search_query".
 - If the user provides specific instructions (e.g., "use my work info"), tailor the "search_query" accordingly (e.g., "work email address").
 - If instructions are generic, create a generic "search_query" (e.g., "email address").
 Return ONLY the JSON array.
@@ -66,19 +108,19 @@ User's Original Request:
 Context Documents (information found from a database search):
 {context}
 
-Analyzed Form Fields (with their original HTML):
+Analyzed Form Fields (each described by its tag, attributes, label and options):
 {fields}
 
 ---
 Your task is to generate a JSON array of action objects. Each object must have three keys:
-1. "selector": A unique and reliable CSS selector. **You MUST prioritize 'id' over 'name'.** For example, if a tag has both id="user-email" and name="email", you MUST use "#user-email".
+1. "handle": The field's handle exactly as given (e.g. "f17"). Never write a CSS selector.
 2. "action_type": The type of action. Must be one of: "FILL_TEXT", "SELECT_DROPDOWN", "CHECK_BOX", "SELECT_RADIO".
 3. "value": The value to fill or select. For checkboxes, this must be a boolean (true or false).
 
 **CRITICAL EXAMPLE FOR DROPDOWNS:**
-If a field is `<select id="country_select" name="country"><option value="IN">India</option></select>`, the correct action is:
-`{{"selector": "#country_select", "action_type": "SELECT_DROPDOWN", "value": "IN"}}`
-Notice the selector targets the `<select>` tag itself, NOT the option.
+If a field is `{{"handle":"f4","tag":"select","name":"country","options":["IN=India"]}}`, the correct action is:
+`{{"handle": "f4", "action_type": "SELECT_DROPDOWN", "value": "IN"}}`
+Notice the value is the option's value, not its text.
 
 If no relevant value is found in the context for a field, DO NOT include it in the final array.
 Return ONLY the JSON array and nothing else.
@@ -93,15 +135,35 @@ def extract_json_from_response(text: str):
         return match.group(0)
     return None
 
-# --- Main Application Logic Functions (No changes needed in the functions themselves) ---
+# --- Main Application Logic Functions ---
+
+def analyze_form_and_create_search_plan(chain, html_fields: list, user_prompt: str, use_heuristics: bool = True, field_token_budget: int | None = 3000):
+    """Analyzes the form and user prompt in one call to generate a search plan.
 
-def analyze_form_and_create_search_plan(chain, html_fields: list, user_prompt: str):
-    """Analyzes the form and user prompt in one call to generate a search plan."""
+    Fields the heuristic classifier can resolve locally are not sent to the LLM; if it
+    resolves all of them, the LLM call is skipped entirely. With a `field_token_budget`
+    the fields are sent in compact form (see promptEncoding), otherwise as raw HTML.
+    """
     print("\n--- 1. Analyzing Form & Creating Search Plan ---")
+    resolved_items, fields_for_llm = [], html_fields
+    if use_heuristics:
+        resolved_items, fields_for_llm, stats = classify_fields(html_fields, user_prompt)
+        print(f"⚡ Heuristics resolved {stats['resolved_fields']}/{stats['fields']} field(s) "
+              f"({stats['coverage']:.0%}) in {stats['milliseconds']:.2f} ms; "
+              f"{stats['snippets_sent_to_llm']}/{stats['snippets']} snippet(s) left for the LLM.")
+        if not fields_for_llm:
+            print(f"✓ Analysis complete without the LLM. Generated plan for {len(resolved_items)} fields.")
+            return resolved_items
+
     prompt_for_llm = user_prompt if user_prompt else "No specific instructions provided. Find the most relevant information."
+    if field_token_budget:
+        encoded_fields, stats = promptEncoding.encode_snippets(fields_for_llm, field_token_budget)
+        promptEncoding.report("Analysis prompt fields", stats)
+    else:
+        encoded_fields = json.dumps(fields_for_llm, indent=2)
     
     response_text = chain.invoke({
-        "html_fields": json.dumps(html_fields, indent=2),
+        "html_fields": encoded_fields,
         "user_prompt": prompt_for_llm
     })
     
@@ -109,55 +171,146 @@ def analyze_form_and_create_search_plan(chain, html_fields: list, user_prompt: s
     
     if not json_string:
         print(f"⚠️ Could not find any JSON in the LLM response. Raw Response:\n{response_text}")
-        return []
+        return resolved_items
 
     try:
-        analysis_plan = json.loads(json_string)
-        print(f"✓ Analysis complete. Generated plan for {len(analysis_plan)} fields.")
-        return analysis_plan
+        llm_items = json.loads(json_string)
     except json.JSONDecodeError:
         print(f"⚠️ Failed to parse extracted JSON. Raw Response:\n{response_text}")
-        return []
+        return resolved_items
+    if not isinstance(llm_items, list):
+        print(f"⚠️ Expected a JSON array of fields, got {type(llm_items).__name__}. Raw Response:\n{response_text}")
+        return resolved_items
+    analysis_plan = resolved_items + attach_fields(llm_items, html_fields)
+    print(f"✓ Analysis complete. Generated plan for {len(analysis_plan)} fields.")
+    return analysis_plan
+
+def attach_fields(items: list, html_fields: list) -> list:
+    """Gives LLM plan items that name a field by handle its HTML and snippet index, so
+    the LLM never has to echo the field back. Items naming no scanned field are dropped:
+    nothing on the page could be filled with them."""
+    handles = field_handles(html_fields)
+    attached = []
+    for item in items:
+        if isinstance(item, dict) and item.get('handle') in handles:
+            item['original_html'], item['section'] = handles[item['handle']]
+            attached.append(item)
+    if len(attached) < len(items):
+        print(f"⚠️ Dropped {len(items) - len(attached)} analysis item(s) naming no scanned field.")
+    return attached
+
+def search_vector_db(vectorstore, analysis_plan: list, top_k: int = 3, exact_lookup: bool = True, mode: str = "rrf",
+                     adaptive: dict | None = None, user_prompt: str = "", metadata_filters: bool = True):
+    """Searches the vault using the queries from the analysis plan.
+
+    Queries that name a vault attribute (or an alias of one) are answered from the
+    attribute index; only the rest are embedded and searched. `mode` picks the
+    retrieval for those ("vector", "bm25", "rrf" or "weighted"); a plan item can
+    override it with its own "search_mode".
 
-def search_vector_db(vectorstore, analysis_plan: list, top_k: int = 3):
-    """Searches the vector DB using the queries from the analysis plan."""
+    With `adaptive` options (see adaptiveRetrieval.py) up to their `max_k` candidates
+    are fetched per query and trimmed to the ones the distances justify; otherwise
+    every query gets `top_k` documents.
+
+    With `metadata_filters`, a plan item's "filters" ({"label": "work"}), or else the
+    vault labels named in `user_prompt`, restrict its lookup and search (see
+    metadataFilter.py). A filtered search that finds nothing within the adaptive score
+    threshold is run again over the whole vault.
+    """
     print("\n--- 2. Searching Vector Database ---")
+    items_with_query = [item for item in analysis_plan if item.get('search_query') and vectorstore]
     for item in analysis_plan:
-        query = item.get('search_query')
-        if query and vectorstore:
-            results = vectorstore.similarity_search(query, k=top_k)
-            item['matched_documents'] = [{"content": doc.page_content} for doc in results]
-            print(f"🔍 For query '{query}', found {len(item['matched_documents'])} document(s).")
+        item['matched_documents'] = []
+
+    queries = [item['search_query'] for item in items_with_query]
+    prompt_filters = filters_from_prompt(user_prompt, vectorstore.metadata_values("label")) \
+        if metadata_filters and vectorstore and user_prompt else None
+    item_filters = [(item.get('filters') or prompt_filters) if metadata_filters else None for item in items_with_query]
+    exact_results = vectorstore.lookup_attributes_batch(queries, k=top_k, filters=item_filters) \
+        if exact_lookup and vectorstore else [None] * len(queries)
+    fuzzy = [(item, filters) for item, filters, exact in zip(items_with_query, item_filters, exact_results) if exact is None]
+    fuzzy_items = [item for item, _ in fuzzy]
+    fuzzy_filters = [filters for _, filters in fuzzy]
+    fuzzy_queries = [item['search_query'] for item in fuzzy_items]
+    fuzzy_modes = [item.get('search_mode', mode) for item in fuzzy_items]
+    fetch_k = adaptive["max_k"] if adaptive else top_k
+    # Embed every remaining query in one call and probe the index once for all of them.
+    fuzzy_results = vectorstore.search_with_ids_batch(
+        fuzzy_queries, k=fetch_k, modes=fuzzy_modes, filters=fuzzy_filters
+    ) if fuzzy_queries else []
+    # A filter that leaves nothing close enough is a wrong guess, not an empty answer.
+    threshold = adaptive.get("score_threshold") if adaptive else None
+    retry = [n for n, (results, filters) in enumerate(zip(fuzzy_results, fuzzy_filters))
+             if filters and not any(threshold is None or score <= threshold for _, _, score in results)]
+    if retry:
+        retried = vectorstore.search_with_ids_batch(
+            [fuzzy_queries[n] for n in retry], k=fetch_k, modes=[fuzzy_modes[n] for n in retry]
+        )
+        for n, results in zip(retry, retried):
+            fuzzy_results[n] = results
+    filtered = sum(1 for filters in item_filters if filters)
+    fetched = kept = 0
+    if adaptive:
+        fetched = sum(len(results) for results in fuzzy_results)
+        fuzzy_results = [select_documents(results, vectorstore.vectors_for, **adaptive) for results in fuzzy_results]
+        kept = sum(len(results) for results in fuzzy_results)
+    fuzzy_by_item = {id(item): results for item, results in zip(fuzzy_items, fuzzy_results)}
+
+    for item, exact in zip(items_with_query, exact_results):
+        if exact is not None:
+            # Exact matches carry no distance; the context builder ranks them first.
+            item['matched_documents'] = [{"content": doc.page_content, "score": None} for _, doc in exact]
+            print(f"🎯 For query '{item['search_query']}', found {len(exact)} exact attribute match(es).")
         else:
-            item['matched_documents'] = []
+            results = fuzzy_by_item[id(item)]
+            item['matched_documents'] = [{"content": doc.page_content, "score": score} for _, doc, score in results]
+            print(f"🔍 For query '{item['search_query']}', found {len(item['matched_documents'])} document(s).")
+    if queries:
+        print(f"🎯 {len(queries) - len(fuzzy_queries)} of {len(queries)} queries answered without vector search.")
+    if filtered:
+        print(f"🏷️ Metadata filters applied to {filtered} of {len(queries)} queries; "
+              f"{len(retry)} search(es) fell back to the whole vault.")
+    if adaptive and fetched:
+        print(f"✂️ Adaptive top-k kept {kept} of {fetched} retrieved document(s).")
+
+    embedding_fn = getattr(vectorstore, "embedding_function", None)
+    if isinstance(embedding_fn, CachedEmbeddings):
+        stats = embedding_fn.stats()
+        print(f"📦 Embedding cache: {stats['hits_memory'] + stats['hits_disk']} hit(s), {stats['misses']} miss(es), "
+              f"~{stats['estimated_seconds_saved']:.2f}s saved so far.")
     return analysis_plan
 
-def generate_action_plan(chain, search_results: list, user_prompt: str):
-    """Generates the final JSON Action Plan for the browser extension."""
-    print("\n--- 3. Generating Final Action Plan ---")
-    context = ""
+def build_action_plan_inputs(search_results: list, user_prompt: str, field_token_budget: int | None = 3000, context_token_budget: int | None = 1500):
+    """Builds the action-plan prompt variables, or None if the search found no context."""
     fields_to_process = []
     
     for item in search_results:
         fields_to_process.append({
+            "handle": item.get('handle'),
             "original_html": item.get('original_html'),
             "description": item.get('description')
         })
-        for doc in item.get('matched_documents', []):
-            context += f"- {doc['content']}\n"
 
+    context, context_stats = build_context(search_results, context_token_budget)
     if not context.strip():
-        print("⚠️ No context found from DB search. Cannot generate a plan.")
-        return []
+        return None
+    print(f"📚 Context: {context_stats['matches']} match(es) → {context_stats['unique_documents']} unique, "
+          f"{context_stats['included_documents']} included (~{context_stats['tokens']} tokens).")
 
     prompt_for_llm = user_prompt if user_prompt else "No specific instructions provided. Fill with the most relevant information."
-
-    response_text = chain.invoke({
+    if field_token_budget:
+        fields, stats = promptEncoding.encode_plan_fields(search_results, field_token_budget)
+        promptEncoding.report("Action plan prompt fields", stats)
+    else:
+        fields = json.dumps(fields_to_process, indent=2)
+    return {
         "context": context,
-        "fields": json.dumps(fields_to_process, indent=2),
+        "fields": fields,
         "user_prompt": prompt_for_llm
-    })
+    }
 
+def parse_action_plan_response(response_text: str):
+    """Extracts the JSON action array from an LLM response, or [] if there is none."""
     json_string = extract_json_from_response(response_text)
 
     if not json_string:
@@ -165,9 +318,133 @@ def generate_action_plan(chain, search_results: list, user_prompt: str):
         return []
 
     try:
-        action_plan = json.loads(json_string)
-        print(f"✓ Action Plan generated with {len(action_plan)} steps.")
-        return action_plan
+        return json.loads(json_string)
     except json.JSONDecodeError:
         print(f"⚠️ Failed to parse extracted JSON from action plan. Raw Response:\n{response_text}")
         return []
+
+def generate_action_plan(chain, search_results: list, user_prompt: str, **input_options):
+    """Generates the final JSON Action Plan for the browser extension.
+    `input_options` are passed on to build_action_plan_inputs (token budgets)."""
+    print("\n--- 3. Generating Final Action Plan ---")
+    inputs = build_action_plan_inputs(search_results, user_prompt, **input_options)
+    if inputs is None:
+        print("⚠️ No context found from DB search. Cannot generate a plan.")
+        return []
+
+    response_text = chain.invoke(inputs)
+    action_plan = parse_action_plan_response(response_text)
+    if action_plan:
+        print(f"✓ Action Plan generated with {len(action_plan)} steps.")
+    return action_plan
+
+def shard_search_results(search_results: list, shard_size: int):
+    """Splits the analysed fields into shards of at most `shard_size` fields.
+
+    Fields from the same form section (the same scanned snippet) are kept together
+    where possible, so the LLM still sees related fields side by side.
+    """
+    sections, current, current_key = [], [], object()
+    for item in search_results:
+        key = item.get('section', id(item))
+        if current and key != current_key:
+            sections.append(current)
+            current = []
+        current.append(item)
+        current_key = key
+    if current:
+        sections.append(current)
+
+    shards, shard = [], []
+    for section in sections:
+        while section:
+            if len(shard) + len(section) <= shard_size:
+                shard.extend(section)
+                section = []
+            elif shard:
+                shards.append(shard)
+                shard = []
+            else:
+                shards.append(section[:shard_size])
+                section = section[shard_size:]
+    if shard:
+        shards.append(shard)
+    return shards
+
+def generate_action_plan_sharded(chain, search_results: list, user_prompt: str, shard_size: int = 8, max_concurrency: int = 4, on_action=None, **input_options):
+    """Generates the action plan as concurrent LLM calls over shards of the form.
+
+    Each shard only carries its own fields and matched documents, so wall-clock time
+    follows the largest shard instead of the whole form. Actions are deduplicated as
+    their shards finish, and the returned plan holds exactly the accepted ones (in
+    shard order), so it matches what `on_action` was handed. A failed shard is skipped.
+    """
+    shards = shard_search_results(search_results, shard_size)
+    shard_inputs = [(i, build_action_plan_inputs(shard, user_prompt, **input_options)) for i, shard in enumerate(shards)]
+    shard_inputs = [(i, inputs) for i, inputs in shard_inputs if inputs is not None]
+    print(f"\n--- 3. Generating Final Action Plan ({len(shard_inputs)} shard(s), up to {max_concurrency} at once) ---")
+    if not shard_inputs:
+        print("⚠️ No context found from DB search. Cannot generate a plan.")
+        return []
+
+    start = time.time()
+    accepted, seen_handles = [], set()
+    for position, response_text in chain.batch_as_completed(
+        [inputs for _, inputs in shard_inputs], config={"max_concurrency": max_concurrency}, return_exceptions=True
+    ):
+        if isinstance(response_text, Exception):
+            print(f"⚠️ Shard {position + 1}/{len(shard_inputs)} failed, skipping it: {response_text}")
+            continue
+        partial_plan = parse_action_plan_response(response_text) if isinstance(response_text, str) else []
+        print(f"✓ Shard {position + 1}/{len(shard_inputs)} done after {time.time() - start:.2f}s.")
+        for action in partial_plan:
+            if accept_action(action, seen_handles):
+                accepted.append((position, action))
+                if on_action:
+                    on_action(action)
+
+    # Sorting is stable, so each shard's actions keep their order.
+    action_plan = [action for _, action in sorted(accepted, key=lambda pair: pair[0])]
+    print(f"✓ Action Plan generated with {len(action_plan)} steps in {time.time() - start:.2f}s.")
+    return action_plan
+
+def generate_action_plan_streaming(chain, search_results: list, user_prompt: str, on_action, **input_options):
+    """Streams the action plan and hands each valid action to `on_action` as soon as
+    it is complete, so the first fields fill while the model is still generating.
+    Returns the cleaned plan."""
+    print("\n--- 3. Generating Final Action Plan (streaming) ---")
+    inputs = build_action_plan_inputs(search_results, user_prompt, **input_options)
+    if inputs is None:
+        print("⚠️ No context found from DB search. Cannot generate a plan.")
+        return []
+
+    json_parser = IncrementalJSONArrayParser()
+    cleaned_plan, seen_handles = [], set()
+    start = time.time()
+    for chunk in chain.stream(inputs):
+        for action in json_parser.feed(chunk):
+            if not accept_action(action, seen_handles):
+                continue
+            if not cleaned_plan:
+                print(f"⚡ First action ready after {time.time() - start:.2f}s.")
+            cleaned_plan.append(action)
+            on_action(action)
+        if json_parser.finished:
+            break
+
+    print(f"✓ Action Plan streamed with {len(cleaned_plan)} steps in {time.time() - start:.2f}s.")
+    return cleaned_plan
+
+def accept_action(action, seen_handles: set) -> bool:
+    """Checks one action for the required keys, duplicates and bad values."""
+    if not (isinstance(action, dict) and all(k in action for k in ["handle", "action_type", "value"])): return False
+    if not isinstance(action["handle"], str) or action["handle"] in seen_handles: return False
+    if action["action_type"] == "FILL_TEXT" and isinstance(action["value"], bool): return False
+    seen_handles.add(action["handle"])
+    return True
+
+def cleanup_action_plan(plan: list):
+    """Removes duplicates and bad values from the AI's plan."""
+    if not isinstance(plan, list): return []
+    seen_handles = set()
+    return [action for action in plan if accept_action(action, seen_handles)]
@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .htmlFields import HANDLE_ATTR, extract_fields
+
+# --- Form Plan Cache ---
+# Filling the same form twice costs two full LLM round-trips each time. This cache
+# remembers the analysis plan and the final action plan for a form, keyed by the
+# form's structure and the user's prompt, and replays them on the next visit.
+
+# Attributes that identify a control. Values, styles and classes change between
+# visits without changing what the form asks for, so they stay out of the key. So
+# does the handle: the scanner numbers fields per page load, so the same form gets
+# different handles on every visit. A cached plan stores the handles it was made
+# with, and a replay maps them onto the current ones by field position.
+STRUCTURAL_ATTRS = ("type", "id", "name", "autocomplete", "placeholder", "aria-label", "for", "multiple")
+# A hit only refreshes the entry's last_used time, in memory. It is written out with
+# the next put or eviction, on flush(), or after this many seconds, whichever is first,
+# so hits stay off the disk. The timer is not a daemon, so a pending write still
+# happens when the process exits.
+SAVE_DELAY_SECONDS = 2.0
+
+
+def _snippet_fields(snippet) -> list:
+    return extract_fields(snippet) if isinstance(snippet, str) else []
+
+
+def form_fingerprint(html_fields: list) -> str:
+    """Hashes the structure of the scanned fields, ignoring whitespace, values and styling.
+    Snippets without parseable controls are hashed by their whitespace-normalized text,
+    so they never all collapse into the same empty structure."""
+    structure = []
+    for snippet in html_fields:
+        fields = _snippet_fields(snippet)
+        if not fields:
+            text = " ".join(snippet.split()) if isinstance(snippet, str) else json.dumps(snippet, sort_keys=True, default=str)
+            structure.append(["raw", text])
+        for field in fields:
+            attrs = {name: field["attrs"][name] for name in STRUCTURAL_ATTRS if name in field["attrs"]}
+            options = [option["value"] for option in field["options"]]
+            structure.append([field["tag"], sorted(attrs.items()), options])
+    return hashlib.sha256(json.dumps(structure).encode("utf-8")).hexdigest()
+
+
+def form_handles(html_fields: list) -> list:
+    """The handle of every field `form_fingerprint` hashes, in the same order (None for
+    untagged fields), so equal fingerprints line the handles of two scans up."""
+    return [field["attrs"].get(HANDLE_ATTR) for snippet in html_fields for field in _snippet_fields(snippet)]
+
+
+def remap_handles(plan: list, cached_handles: list, current_handles: list) -> list:
+    """Rewrites a cached plan's handles to the fields at the same positions today.
+    Items whose handle has no counterpart are dropped."""
+    mapping = {old: new for old, new in zip(cached_handles, current_handles) if old and new}
+    remapped = []
+    for item in plan:
+        if isinstance(item, dict) and item.get("handle") in mapping:
+            remapped.append({**item, "handle": mapping[item["handle"]]})
+    return remapped
+
+
+def normalize_prompt(user_prompt: str) -> str:
+    return " ".join((user_prompt or "").lower().split())
+
+
+def vault_version(folder_path: str = "./DataStore/faiss_index") -> str:
+    """Changes whenever a file of the vault (in any of its generations) is rewritten.
+
+    The write-ahead log is left out: it only exists while a write is in progress, and
+    the write changes the vault files once it is done.
+    """
+    parts = []
+    for root, dirs, files in os.walk(folder_path):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue  # an old generation being deleted
+            parts.append(f"{os.path.relpath(path, folder_path)}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class PlanCache:
+    """Persistent, TTL- and size-bounded cache of analysis and action plans per form."""
+
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_entries: int = 200):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+        self._save_timer = None
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        """Writes the cache out. The caller holds the lock."""
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+            self._save_timer = None
+        # Write to a temp file and rename so a crash never leaves a half-written cache.
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(self._entries, file)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def make_key(html_fields: list, user_prompt: str) -> str:
+        return hashlib.sha256(f"{form_fingerprint(html_fields)}\0{normalize_prompt(user_prompt)}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str, current_vault_version: str):
+        """Returns the cached entry, or None if it is missing, expired or from an older vault."""
+        with self._lock:
+            entry = self._entries.get(key)
+            expired = entry is not None and (
+                time.time() - entry["created"] > self.ttl_seconds
+                or entry["vault_version"] != current_vault_version
+            )
+            if entry is None or expired:
+                if expired:
+                    del self._entries[key]
+                    self._save()
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            # Persisted later, so eviction after a restart still knows which forms are in use.
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(SAVE_DELAY_SECONDS, self.flush)
+                self._save_timer.start()
+            self.hits += 1
+            return entry
+
+    def put(self, key: str, current_vault_version: str, analysis_plan: list, action_plan: list, handles: list):
+        """Stores the plans along with the scan's `form_handles`, for `remap_handles`."""
+        with self._lock:
+            now = time.time()
+            self._entries[key] = {
+                "created": now,
+                "last_used": now,
+                "vault_version": current_vault_version,
+                "analysis_plan": analysis_plan,
+                "action_plan": action_plan,
+                "handles": handles,
+            }
+            # Evict the least recently used forms once the cache is full.
+            while len(self._entries) > self.max_entries:
+                oldest = min(self._entries, key=lambda k: self._entries[k]["last_used"])
+                del self._entries[oldest]
+            self._save()
+
+    def flush(self):
+        """Writes out last_used times that only changed in memory."""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
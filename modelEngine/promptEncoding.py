@@ -0,0 +1,148 @@
+import json
+import re
+
+from .htmlFields import extract_fields, field_handle
+
+# --- Compact Prompt Encoding ---
+# Raw snippets carry whitespace, styles, classes and every <option> of long selects.
+# The LLM only needs what identifies a field and what it can be filled with, so fields
+# are reduced to a small canonical object and serialized without whitespace.
+
+# Attributes kept in the prompt, most important first. Later ones are dropped first
+# when a prompt is over budget.
+KEPT_ATTRS = ("id", "name", "type", "autocomplete", "value", "placeholder", "aria-label", "title")
+
+# Successively tighter encodings tried until the prompt fits the token budget.
+BUDGET_LEVELS = [
+    {"max_options": 20, "attrs": KEPT_ATTRS, "label_chars": 80},
+    {"max_options": 8, "attrs": KEPT_ATTRS[:6], "label_chars": 60},
+    {"max_options": 3, "attrs": KEPT_ATTRS[:5], "label_chars": 40},
+    {"max_options": 0, "attrs": KEPT_ATTRS[:4], "label_chars": 24},
+]
+# The action plan has to name the exact option value to select, so its prompt starts
+# with every option, and tighter levels still keep the options that appear in the
+# field's retrieved documents (see encode_plan_fields).
+PLAN_BUDGET_LEVELS = [{**BUDGET_LEVELS[0], "max_options": None}] + BUDGET_LEVELS[1:]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and markup)."""
+    return len(text) // 4 + 1
+
+
+def dumps_compact(value) -> str:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+
+def encode_field(field: dict, max_options: int | None = 20, attrs: tuple = KEPT_ATTRS, label_chars: int = 80,
+                 keep_option=None) -> dict:
+    """Minimal canonical form of one extracted field. Its handle is never dropped: it is
+    how the LLM refers to the field. `max_options=None` shows every option, and options
+    `keep_option(option)` accepts are shown past `max_options`."""
+    encoded = {"handle": field_handle(field)} if field_handle(field) else {}
+    encoded["tag"] = field["tag"]
+    for name in attrs:
+        value = field["attrs"].get(name)
+        if value:
+            # Only radios and checkboxes need their value to be told apart.
+            if name == "value" and field["attrs"].get("type", "").lower() not in ("radio", "checkbox"):
+                continue
+            encoded[name] = value
+    if field.get("label"):
+        encoded["label"] = field["label"][:label_chars]
+
+    options = field.get("options") or []
+    if options:
+        # Show the first few options so the model sees the value format, and summarize the rest.
+        shown = [o for i, o in enumerate(options)
+                 if max_options is None or i < max_options or (keep_option and keep_option(o))]
+        encoded["options"] = [o["value"] if o["value"] == o["text"] else f"{o['value']}={o['text']}" for o in shown]
+        if len(options) > len(shown):
+            encoded["options"].append(f"...+{len(options) - len(shown)} more")
+    return encoded
+
+
+def encode_html(html, **level):
+    """Compact encoding of a snippet's fields (a dict, or a list for several fields).
+
+    Text without form controls is returned unchanged, as are fields that are already
+    encoded (an analysis item without a known handle keeps the form the LLM echoed).
+    """
+    if not isinstance(html, str) or not html:
+        return html
+    fields = extract_fields(html)
+    if not fields:
+        return html
+    encoded = [encode_field(field, **level) for field in fields]
+    return encoded[0] if len(encoded) == 1 else encoded
+
+
+def encode_within_budget(encode, token_budget: int, levels: list = BUDGET_LEVELS):
+    """Calls `encode(level)` with each budget level until the result fits, and returns
+    (text, level_index). The tightest level is used if nothing fits."""
+    for i, level in enumerate(levels):
+        text = encode(level)
+        if estimate_tokens(text) <= token_budget:
+            return text, i
+    return text, len(levels) - 1
+
+
+def encode_snippets(html_fields: list, token_budget: int = 3000):
+    """Encodes the scanned snippets for the analysis prompt. Returns (text, stats)."""
+    original = json.dumps(html_fields, indent=2)
+    text, level = encode_within_budget(
+        lambda lvl: dumps_compact([encode_html(snippet, **lvl) for snippet in html_fields]),
+        token_budget
+    )
+    return text, _stats(original, text, level, token_budget)
+
+
+def context_option_matcher(item: dict):
+    """Accepts the options whose value or text appears as a word in the item's matched
+    documents, or None when there are none."""
+    context = " ".join(str(doc.get("content", "")) for doc in item.get("matched_documents") or []).lower()
+    if not context:
+        return None
+
+    def matches(option):
+        return any(len(text) > 1 and re.search(rf"(?<!\w){re.escape(text.lower())}(?!\w)", context)
+                   for text in (option["value"], option["text"]) if text)
+    return matches
+
+
+def encode_plan_fields(items: list, token_budget: int = 3000):
+    """Encodes analysed fields for the action-plan prompt. Returns (text, stats).
+    Options are only elided when the budget demands it, and never the ones the
+    field's context names."""
+    original = json.dumps(
+        [{"original_html": item.get("original_html"), "description": item.get("description")} for item in items],
+        indent=2
+    )
+    matchers = [context_option_matcher(item) for item in items]
+    text, level = encode_within_budget(
+        lambda lvl: dumps_compact([
+            {"field": encode_html(item.get("original_html"), keep_option=matcher, **lvl),
+             "description": item.get("description")}
+            for item, matcher in zip(items, matchers)
+        ]),
+        token_budget, PLAN_BUDGET_LEVELS
+    )
+    return text, _stats(original, text, level, token_budget)
+
+
+def _stats(original: str, encoded: str, level: int, token_budget: int) -> dict:
+    original_tokens, encoded_tokens = estimate_tokens(original), estimate_tokens(encoded)
+    return {
+        "original_tokens": original_tokens,
+        "encoded_tokens": encoded_tokens,
+        "saved_tokens": original_tokens - encoded_tokens,
+        "saved_ratio": 1 - encoded_tokens / original_tokens if original_tokens else 0.0,
+        "budget_level": level,
+        "over_budget": encoded_tokens > token_budget,
+    }
+
+
+def report(label: str, stats: dict):
+    print(f"🗜️ {label}: {stats['original_tokens']} → {stats['encoded_tokens']} tokens "
+          f"(-{stats['saved_ratio']:.0%}, level {stats['budget_level']})"
+          + (" ⚠️ still over budget" if stats["over_budget"] else ""))
@@ -0,0 +1,205 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+
+import numpy as np
+
+from .fileLock import FileLock
+from .vaultStore import COPY_BATCH, LOCK_TIMEOUT, RECORDS_FILE, new_generation_path, publish, vault_data_path, write_vault
+
+# --- Vault Re-embedding ---
+# Moves a vault to another embedding model. Texts are embedded in parallel batches,
+# one worker process per CPU core. Every finished batch is saved under
+# <folder>.reembed, so an interrupted run picks up where it stopped. When all batches
+# are done, the new vault is written as a new generation and published atomically.
+#
+#   python -m modelEngine.reembed --model all-MiniLM-L12-v2 [--workers 4] [--batch-size 256]
+#
+# Records added or edited while the job runs are embedded again at the end, so the
+# swapped-in vault matches the live one. That last copy runs under the vault lock, so
+# no write can slip in between the copy and the swap. Afterwards set embedding_model in config.yaml
+# to the new model, otherwise the vault will not open.
+
+_worker_embeddings = None
+
+
+def _init_worker(model_name: str, normalize: bool):
+    global _worker_embeddings
+    try:
+        import torch
+        # One thread per process; the parallelism comes from the processes.
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    _worker_embeddings = _load_embeddings(model_name, normalize)
+
+
+def _load_embeddings(model_name: str, normalize: bool):
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=model_name, encode_kwargs={"normalize_embeddings": normalize})
+
+
+def _embed_batch(batch_no: int, texts: list):
+    return batch_no, np.asarray(_worker_embeddings.embed_documents(texts), dtype=np.float32)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ReembedJob:
+    def __init__(self, folder_path: str, model_name: str, normalize: bool = False,
+                 batch_size: int = 256, workers: int | None = None):
+        self.folder_path = os.path.normpath(folder_path)
+        self.staging_path = self.folder_path + ".reembed"
+        self.plan_path = os.path.join(self.staging_path, "plan.json")
+        self.model_name = model_name
+        self.normalize = normalize
+        self.batch_size = batch_size
+        self.workers = workers or os.cpu_count() or 1
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(vault_data_path(self.folder_path), RECORDS_FILE))
+
+    def _batch_path(self, batch_no: int) -> str:
+        return os.path.join(self.staging_path, f"batch-{batch_no:06d}.npz")
+
+    def _load_plan(self) -> dict:
+        """Returns the plan of an earlier run for the same model, or a fresh one."""
+        settings = {"model": self.model_name, "normalize": self.normalize, "batch_size": self.batch_size}
+        try:
+            with open(self.plan_path, "r", encoding="utf-8") as file:
+                plan = json.load(file)
+            if all(plan.get(key) == value for key, value in settings.items()):
+                print(f"Resuming re-embed job from {self.staging_path}.")
+                return plan
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        os.makedirs(self.staging_path)
+        with closing(self._connect()) as db:
+            ids = [doc_id for (doc_id,) in db.execute("SELECT id FROM records ORDER BY seq")]
+        plan = {**settings, "ids": ids}
+        with open(self.plan_path + ".tmp", "w", encoding="utf-8") as file:
+            json.dump(plan, file)
+        os.replace(self.plan_path + ".tmp", self.plan_path)
+        return plan
+
+    def run(self):
+        if os.path.exists(self.folder_path + ".wal"):
+            raise RuntimeError("The vault has unreplayed changes; open it once (e.g. start the UI) and retry.")
+        plan = self._load_plan()
+        ids = plan["ids"]
+        batches = [ids[start:start + self.batch_size] for start in range(0, len(ids), self.batch_size)]
+        pending = [n for n in range(len(batches)) if not os.path.exists(self._batch_path(n))]
+        print(f"{len(batches) - len(pending)} of {len(batches)} batch(es) already embedded, "
+              f"{len(pending)} to go on {self.workers} worker(s).")
+
+        if pending:
+            with closing(self._connect()) as db, ProcessPoolExecutor(
+                max_workers=self.workers, initializer=_init_worker, initargs=(self.model_name, self.normalize)
+            ) as pool:
+                texts_by_batch = {}
+                futures = []
+                for batch_no in pending:
+                    texts = self._texts(db, batches[batch_no])
+                    texts_by_batch[batch_no] = texts
+                    futures.append(pool.submit(_embed_batch, batch_no, [text for _, text in texts]))
+                for done, future in enumerate(as_completed(futures), 1):
+                    batch_no, vectors = future.result()
+                    texts = texts_by_batch.pop(batch_no)
+                    self._save_batch(batch_no, texts, vectors)
+                    print(f"  batch {batch_no + 1}/{len(batches)} done ({done}/{len(pending)} this run)")
+
+        self._finish(batches)
+
+    @staticmethod
+    def _texts(db, ids: list) -> list:
+        found = dict(db.execute(f"SELECT id, text FROM records WHERE id IN ({','.join('?' * len(ids))})", ids))
+        return [(doc_id, found[doc_id]) for doc_id in ids if doc_id in found]
+
+    def _save_batch(self, batch_no: int, texts: list, vectors: np.ndarray):
+        # np.savez adds ".npz" to names without it, so the temp name keeps the suffix.
+        tmp_path = self._batch_path(batch_no) + ".tmp.npz"
+        np.savez(tmp_path, ids=np.array([doc_id for doc_id, _ in texts]),
+                 hashes=np.array([_text_hash(text) for _, text in texts]), vectors=vectors)
+        os.replace(tmp_path, self._batch_path(batch_no))
+
+    def _finish(self, batches: list):
+        """Writes the new vault from the staged vectors and swaps it in."""
+        locator = {doc_id: n for n, batch in enumerate(batches) for doc_id in batch}
+        cache = {}
+        fallback = None
+        dim = None
+
+        def staged_vector(doc_id: str, text: str):
+            batch_no = locator.get(doc_id)
+            if batch_no is None:
+                return None
+            if batch_no not in cache:
+                cache.clear()  # records are read in plan order, so one batch at a time is enough
+                with np.load(self._batch_path(batch_no)) as data:
+                    cache[batch_no] = {i: (h, v) for i, h, v in zip(data["ids"], data["hashes"], data["vectors"])}
+            entry = cache[batch_no].get(doc_id)
+            return entry[1] if entry is not None and entry[0] == _text_hash(text) else None
+
+        def records():
+            nonlocal fallback, dim
+            with closing(self._connect()) as db:
+                cursor = db.execute("SELECT id, text, metadata FROM records ORDER BY seq")
+                while True:
+                    chunk = cursor.fetchmany(COPY_BATCH)
+                    if not chunk:
+                        return
+                    vectors = [staged_vector(doc_id, text) for doc_id, text, _ in chunk]
+                    # Records added or edited since their batch was embedded.
+                    stale = [n for n, vector in enumerate(vectors) if vector is None]
+                    if stale:
+                        fallback = fallback or _load_embeddings(self.model_name, self.normalize)
+                        for n, vector in zip(stale, fallback.embed_documents([chunk[n][1] for n in stale])):
+                            vectors[n] = np.asarray(vector, dtype=np.float32)
+                    dim = dim or len(vectors[0])
+                    yield [(doc_id, text, metadata, vector) for (doc_id, text, metadata), vector in zip(chunk, vectors)]
+
+        manifest = {"embedding_model": self.model_name, "normalize": "1" if self.normalize else "0"}
+        with FileLock.for_path(self.folder_path + ".lock", LOCK_TIMEOUT):
+            if os.path.exists(self.folder_path + ".wal"):
+                raise RuntimeError("A vault write was interrupted; open the vault once (e.g. start the UI) and retry.")
+            with closing(self._connect()) as db:
+                aliases = db.execute("SELECT alias, key FROM aliases").fetchall()
+            # Pull the first batch so its vectors fix the dimension before write_vault is called.
+            batches_iter = records()
+            first = next(batches_iter, [])
+            generation = new_generation_path(self.folder_path)
+            written = write_vault(generation, dim or 0, _chain(first, batches_iter), manifest, aliases)
+            publish(self.folder_path, generation)
+        shutil.rmtree(self.staging_path, ignore_errors=True)
+        print(f"Re-embedded {written} record(s) with {self.model_name} and swapped the new vault in.")
+        print(f"Set embedding_model: \"{self.model_name}\" in config.yaml before starting SecureFill.")
+
+
+def _chain(first: list, rest):
+    if first:
+        yield first
+    yield from rest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed the SecureFill vault with another embedding model.")
+    parser.add_argument("--model", required=True, help="sentence-transformers model name, e.g. all-MiniLM-L12-v2")
+    parser.add_argument("--vault", default="./DataStore/faiss_index", help="vault folder")
+    parser.add_argument("--normalize", action="store_true", help="L2-normalize the new vectors")
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU cores)")
+    args = parser.parse_args()
+    ReembedJob(args.vault, args.model, normalize=args.normalize,
+               batch_size=args.batch_size, workers=args.workers).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from .planCache import normalize_prompt
+
+# --- Incremental Scans ---
+# A wizard-style form shows a few fields per step, and every scan used to send and
+# analyse the whole page again. The extension now identifies each scanned control by
+# a fingerprint of its handle and field HTML (see background.js) and only sends the
+# HTML of controls the orchestrator does not hold yet; the rest arrive as bare
+# fingerprints with their handle.
+#
+# A ScanSession keeps, for one user prompt against one vault version:
+#   html      fingerprint -> (handle, field HTML), for every field received (LRU-bounded)
+#   results   handle -> (fingerprint, the search results of that field)
+# so a later step runs analysis and search for its new or changed fields only, and a
+# repeat fill of an unchanged page reuses the stored results without either. Results
+# are attributed to fields by the "handle" of each plan item; a field whose HTML
+# changed gets a new fingerprint, so its stored results no longer count. Fields whose
+# plan came from the plan cache have no results and count as new. A new prompt, a
+# changed vault or SESSION_IDLE_SECONDS without a scan starts the session over.
+
+SESSION_IDLE_SECONDS = 15 * 60
+MAX_SNIPPETS = 2000
+
+
+class ScanSession:
+    """Fields and search results already seen by the orchestrator. Thread-safe."""
+
+    def __init__(self, max_snippets: int = MAX_SNIPPETS, idle_seconds: float = SESSION_IDLE_SECONDS):
+        self.max_snippets = max_snippets
+        self.idle_seconds = idle_seconds
+        self.html = OrderedDict()
+        self.results = {}
+        self._key = None
+        self._last_used = 0.0
+        self._lock = threading.Lock()
+
+    def _expire(self):
+        if self._last_used and time.monotonic() - self._last_used > self.idle_seconds:
+            self.html.clear()
+            self.results = {}
+            self._key = None
+        self._last_used = time.monotonic()
+
+    def known(self) -> list:
+        """Fingerprints whose HTML the next scan may leave out."""
+        with self._lock:
+            self._expire()
+            return list(self.html)
+
+    def apply_scan(self, fields: list) -> list:
+        """Takes the host's [{"fp", "handle", "html"?}] and returns [(fp, handle, html)]
+        in page order. A fingerprint that arrives without HTML and is not held any more
+        is dropped."""
+        scanned = []
+        with self._lock:
+            for field in fields:
+                fp = field.get("fp")
+                if "html" in field:
+                    self.html[fp] = (field.get("handle"), field["html"])
+                if fp in self.html:
+                    self.html.move_to_end(fp)
+                    scanned.append((fp, *self.html[fp]))
+            while len(self.html) > self.max_snippets:
+                fp, (handle, _) = self.html.popitem(last=False)
+                if self.results.get(handle, (None,))[0] == fp:
+                    del self.results[handle]
+        return scanned
+
+    def begin(self, user_prompt: str, vault_version: str) -> set:
+        """Starts a fill; drops the stored results if the prompt or the vault changed.
+        Returns the fingerprints that have stored results."""
+        key = (normalize_prompt(user_prompt), vault_version)
+        with self._lock:
+            self._expire()
+            if key != self._key:
+                self.results = {}
+                self._key = key
+            return {fp for fp, _ in self.results.values()}
+
+    def record(self, scanned: list, search_results: list):
+        """Stores the results of one fill over the [(fp, handle, html)] fields `scanned`,
+        each under the field its "handle" names. Items for other handles are dropped."""
+        by_handle = {handle: (fp, []) for fp, handle, _ in scanned}
+        for item in search_results:
+            if item.get("handle") in by_handle:
+                by_handle[item["handle"]][1].append(item)
+        with self._lock:
+            self.results.update(by_handle)
+
+    def results_for(self, scanned: list) -> list | None:
+        """The stored results of exactly these [(fp, handle, html)] fields, in their
+        order, or None if any of them has none for its current fingerprint."""
+        with self._lock:
+            stored = [self.results.get(handle) for _, handle, _ in scanned]
+        if any(entry is None or entry[0] != fp for entry, (fp, _, _) in zip(stored, scanned)):
+            return None
+        return [item for _, items in stored for item in items]
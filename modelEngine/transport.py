@@ -0,0 +1,219 @@
+import asyncio
+import bisect
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+# --- Model Server Transport ---
+# One pooled keep-alive session per model client, with timeouts, jittered retries on
+# transient failures, an async client for concurrent calls, and latency histograms.
+#
+# A chat request is not idempotent: a request that timed out while the server was
+# generating may still finish there. Only failures that happen before the server
+# accepts the request (no connection, or 503 Service Unavailable) are retried.
+
+RETRY_STATUS_CODES = {503}
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open.
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120]
+
+
+class LatencyHistogram:
+    """Thread-safe fixed-bucket latency histogram with approximate percentiles."""
+
+    def __init__(self, buckets: list = LATENCY_BUCKETS):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0
+        self.sum_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.total += 1
+            self.sum_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def percentile(self, p: float) -> float:
+        """Returns the upper bound of the bucket holding the p-th percentile."""
+        with self._lock:
+            if not self.total:
+                return 0.0
+            target, running = p / 100 * self.total, 0
+            for i, count in enumerate(self.counts):
+                running += count
+                if running >= target:
+                    return self.buckets[i] if i < len(self.buckets) else self.max_seconds
+            return self.max_seconds
+
+    def snapshot(self) -> dict:
+        labels = [f"<={b}s" for b in self.buckets] + [f">{self.buckets[-1]}s"]
+        return {
+            "count": self.total,
+            "mean_seconds": self.sum_seconds / self.total if self.total else 0.0,
+            "p50_seconds": self.percentile(50),
+            "p90_seconds": self.percentile(90),
+            "p99_seconds": self.percentile(99),
+            "max_seconds": self.max_seconds,
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+def never_sent(error: Exception) -> bool:
+    """True if the request failed before reaching the server, so retrying it cannot
+    run it twice."""
+    if isinstance(error, (requests.ConnectTimeout, httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        # requests wraps urllib3's MaxRetryError, whose reason tells a refused or
+        # unresolvable connection apart from one dropped after the request went out.
+        reason = getattr(error.args[0], "reason", None) if error.args else None
+        return isinstance(reason, NewConnectionError)
+    return False
+
+
+class ModelServerTransport:
+    """Pooled sync and async HTTP client for the model server."""
+
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5, read_timeout: float = 120,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.pool_size = pool_size
+        self.latency = {}
+        self._latency_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._async_client = None
+        self._async_loop = None
+        self._async_lock = threading.Lock()
+
+    # --- Helpers ---
+    def _backoff(self, attempt: int) -> float:
+        # "Full jitter": spreads retries from concurrent callers apart.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _retry_delay(self, attempt: int, reason, what: str = "request") -> float:
+        delay = self._backoff(attempt)
+        print(f"⚠️ Model server {what} failed ({reason}); retrying in {delay:.2f}s.")
+        return delay
+
+    def _observe(self, endpoint: str, seconds: float):
+        # Pooled threads observe concurrently; the dict only changes under the lock.
+        with self._latency_lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = LatencyHistogram()
+        histogram.observe(seconds)
+
+    def latency_stats(self) -> dict:
+        with self._latency_lock:
+            histograms = dict(self.latency)
+        return {endpoint: histogram.snapshot() for endpoint, histogram in histograms.items()}
+
+    # --- Sync ---
+    def post_json(self, url: str, endpoint: str, headers: dict, payload: dict) -> dict:
+        """POSTs JSON, retrying with jittered backoff only while the server has not
+        accepted the request."""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(url, headers=headers, json=payload,
+                                         timeout=(self.connect_timeout, self.read_timeout))
+            except requests.RequestException as e:
+                if not never_sent(e) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt, e))
+                continue
+            if resp.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                time.sleep(self._retry_delay(attempt, f"{resp.status_code} from model server"))
+                continue
+            resp.raise_for_status()
+            self._observe(endpoint, time.perf_counter() - start)
+            return resp.json()
+
+    def open_stream(self, url: str, endpoint: str, headers: dict, payload: dict, read_timeout: float):
+        """Opens a streaming POST. Only a connection that never reached the server is
+        retried; once the request is sent a failure is raised."""
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = self.session.post(url, headers=headers, json=payload, stream=True,
+                                         timeout=(self.connect_timeout, read_timeout))
+            except requests.RequestException as e:
+                if not never_sent(e) or attempt >= self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(attempt, e, "stream"))
+                continue
+            if resp.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                resp.close()
+                time.sleep(self._retry_delay(attempt, f"{resp.status_code} from model server", "stream"))
+                continue
+            resp.raise_for_status()
+            # Time to first byte is what matters for a stream.
+            self._observe(endpoint, time.perf_counter() - start)
+            return resp
+
+    # --- Async ---
+    async def _get_async_client(self) -> httpx.AsyncClient:
+        # httpx clients are tied to the event loop they were created on. The client of
+        # an earlier loop is closed on that loop if it still runs, else here.
+        loop = asyncio.get_running_loop()
+        with self._async_lock:
+            if self._async_client is not None and self._async_loop is loop:
+                return self._async_client
+            stale, stale_loop = self._async_client, self._async_loop
+            self._async_client = client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+                timeout=httpx.Timeout(self.read_timeout, connect=self.connect_timeout),
+            )
+            self._async_loop = loop
+        if stale is not None:
+            if stale_loop.is_running():
+                asyncio.run_coroutine_threadsafe(stale.aclose(), stale_loop)
+            else:
+                try:
+                    await stale.aclose()
+                except Exception:
+                    pass  # its connections went down with their loop
+        return client
+
+    async def apost_json(self, url: str, endpoint: str, headers: dict, payload: dict) -> dict:
+        client = await self._get_async_client()
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                resp = await client.post(url, headers=headers, json=payload)
+            except httpx.TransportError as e:
+                if not never_sent(e) or attempt >= self.max_retries:
+                    raise
+                await asyncio.sleep(self._retry_delay(attempt, e, "async request"))
+                continue
+            if resp.status_code in RETRY_STATUS_CODES and attempt < self.max_retries:
+                await asyncio.sleep(self._retry_delay(attempt, f"{resp.status_code} from model server", "async request"))
+                continue
+            resp.raise_for_status()
+            self._observe(endpoint, time.perf_counter() - start)
+            return resp.json()
+
+    def close(self):
+        self.session.close()
+
+    async def aclose(self):
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
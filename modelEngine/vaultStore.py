@@ -0,0 +1,1012 @@
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .attributeIndex import attribute_entry, builtin_aliases, normalize_attribute
+from .lexicalIndex import SCHEMA as LEXICAL_SCHEMA
+from .lexicalIndex import MODES, bm25_search, index_documents, reciprocal_rank_fusion, remove_documents, weighted_fusion
+from .annIndex import AnnIndex, build_index, choose_index_type, effective_storage, needs_rebuild
+from .fileLock import FileLock
+from .metadataFilter import FILTER_FIELDS, RowBitmaps, freeze_filters
+from .vectorSearch import flat_search, subset_search
+
+# --- Vault Storage ---
+# The vault is a folder with three files, none of which is read in full on startup:
+# - vectors.f32: the embeddings as raw float32 rows, memory-mapped.
+# - alive.u8: one byte per row, cleared once the row is deleted or superseded.
+# - records.sqlite: ID, row, text and metadata of every live record, plus the vector
+#   dimension and row count. Text is only fetched for the rows a search returns.
+#   It also holds the exact attribute index (see attributeIndex.py) and its aliases,
+#   and the BM25 inverted index (see lexicalIndex.py).
+# Category and label filters on searches are served from row bitmaps kept in memory
+# (see metadataFilter.py).
+# Opening a vault takes the same time for ten records as for a million, and nothing
+# is unpickled.
+#
+# - Inserts are embedded in batches and written in one transaction.
+# - Updates write the new vector to a fresh row and point the record at it; deletes
+#   drop the record and clear its row's flag. Neither rewrites the vault. Dead rows are
+#   removed by a background compaction once there are enough of them.
+# - Large vaults also carry an ANN index file (see annIndex.py), rebuilt in the
+#   background when the record count calls for another index type or enough rows
+#   were added since the last build.
+#
+# Crash safety:
+# - Every change is appended to a write-ahead log (<folder>.wal) before it is applied,
+#   and the log is cleared once the change is on disk. A leftover log is replayed on
+#   the next start; adds that already made it are skipped by ID, updates and deletes
+#   are idempotent.
+# - Compaction writes the new vault to a fresh generation folder inside the vault
+#   (gen-<n>) and publishes it by replacing the small CURRENT file that names it. No
+#   folder another process has mapped is renamed, which Windows would refuse; older
+#   generations are deleted once no process holds them open any more.
+#
+# Several processes: the engine and the management UI open the same vault. Writes,
+# recovery and publishing run under a lock on <folder>.lock (see fileLock.py), and a
+# writer first catches up on what other processes wrote. The engine opens the vault
+# read-only: it waits for a running write to finish, and never recovers, replays or
+# deletes anything.
+#
+# The vault records which embedding model wrote it (name, dimension, normalization) and
+# refuses to open with a different one; `python -m modelEngine.reembed` migrates it.
+#
+# A folder still in the LangChain format (index.faiss + index.pkl) is migrated once on
+# first open. The original is kept next to it as <folder>.langchain.
+
+VECTORS_FILE = "vectors.f32"
+ALIVE_FILE = "alive.u8"
+RECORDS_FILE = "records.sqlite"
+CURRENT_FILE = "CURRENT"
+GENERATION_PREFIX = "gen-"
+LANGCHAIN_FILES = ("index.faiss", "index.pkl")
+# How long opening or writing waits for another process's write.
+LOCK_TIMEOUT = 120
+COPY_BATCH = 4096
+# Compaction waits for this share of dead rows in large vaults (or compact_threshold).
+COMPACT_RATIO = 0.1
+# Candidates fetched from each side per result when rankings are fused.
+HYBRID_CANDIDATES = 4
+# Filters that keep at most this many rows are answered by scanning just those rows.
+FILTER_SCAN_ROWS = 20_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS records (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    row INTEGER NOT NULL UNIQUE,
+    text TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS attributes (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    label TEXT NOT NULL,
+    category TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attributes_by_key ON attributes (key);
+CREATE TABLE IF NOT EXISTS aliases (alias TEXT PRIMARY KEY, key TEXT NOT NULL);
+"""
+
+
+class EmbeddingModelMismatch(ValueError):
+    """The vault was written by a different embedding model than the configured one."""
+
+
+class VaultNeedsRecovery(RuntimeError):
+    """A read-only open found work only a writer may do: a crashed write to replay, a
+    LangChain folder to migrate, or an index an older version never built."""
+
+
+def embeddings_manifest(embeddings) -> dict:
+    """The manifest entries that identify an embedding model (the dimension is stored
+    separately, from the first vector written)."""
+    inner = getattr(embeddings, "embeddings", embeddings)  # unwrap CachedEmbeddings
+    encode_kwargs = getattr(inner, "encode_kwargs", None) or {}
+    return {
+        "embedding_model": getattr(embeddings, "model_name", None) or getattr(inner, "model_name", "unknown"),
+        "normalize": "1" if encode_kwargs.get("normalize_embeddings") else "0",
+    }
+
+
+# --- Generations ---
+def vault_data_path(folder_path: str) -> str:
+    """The folder holding the vault's files: the generation CURRENT names, or the vault
+    folder itself for vaults that were never compacted since generations exist."""
+    try:
+        with open(os.path.join(folder_path, CURRENT_FILE), "r", encoding="utf-8") as file:
+            return os.path.join(folder_path, file.read().strip())
+    except FileNotFoundError:
+        return folder_path
+
+
+def new_generation_path(folder_path: str) -> str:
+    numbers = [int(name[len(GENERATION_PREFIX):]) for name in os.listdir(folder_path)
+               if name.startswith(GENERATION_PREFIX) and name[len(GENERATION_PREFIX):].isdigit()] \
+        if os.path.isdir(folder_path) else []
+    return os.path.join(folder_path, f"{GENERATION_PREFIX}{max(numbers, default=0) + 1}")
+
+
+def publish(folder_path: str, generation_path: str):
+    """Makes the complete vault in `generation_path` the current one. The caller holds
+    the vault lock."""
+    current = os.path.join(folder_path, CURRENT_FILE)
+    with open(current + ".tmp", "w", encoding="utf-8") as file:
+        file.write(os.path.basename(generation_path))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(current + ".tmp", current)
+    remove_stale(folder_path)
+
+
+def remove_stale(folder_path: str):
+    """Deletes generations that are not current, and the files of the single-folder
+    layout once a generation is. Files another process still has open (Windows keeps
+    those from being deleted) are left for a later call."""
+    if not os.path.isdir(folder_path):
+        return
+    has_current = os.path.exists(os.path.join(folder_path, CURRENT_FILE))
+    current = os.path.basename(vault_data_path(folder_path)) if has_current else None
+    for name in os.listdir(folder_path):
+        path = os.path.join(folder_path, name)
+        if name.startswith(GENERATION_PREFIX) and os.path.isdir(path):
+            if name != current:
+                shutil.rmtree(path, ignore_errors=True)
+        elif has_current and (name.startswith((RECORDS_FILE, "ann-")) or
+                              name in (VECTORS_FILE, ALIVE_FILE, CURRENT_FILE + ".tmp")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def _index_attributes(db, records):
+    """Writes attribute index entries for (id, text, metadata_json) records."""
+    db.executemany(
+        "INSERT OR REPLACE INTO attributes (id, key, label, category) VALUES (?, ?, ?, ?)",
+        [(doc_id, *attribute_entry(text, json.loads(metadata))) for doc_id, text, metadata in records]
+    )
+
+
+def write_vault(folder_path: str, dim: int, batches, manifest: dict, aliases: list = ()) -> int:
+    """Writes a complete vault folder from batches of (id, text, metadata_json, vector)
+    and returns the number of records. Used by compaction, re-embedding and the
+    LangChain migration."""
+    shutil.rmtree(folder_path, ignore_errors=True)
+    os.makedirs(folder_path)
+    db = sqlite3.connect(os.path.join(folder_path, RECORDS_FILE))
+    db.executescript(SCHEMA + LEXICAL_SCHEMA)
+    rows = 0
+    with open(os.path.join(folder_path, VECTORS_FILE), "wb") as vectors_file, \
+            open(os.path.join(folder_path, ALIVE_FILE), "wb") as alive_file:
+        for batch in batches:
+            if not batch:
+                continue
+            vectors_file.write(np.asarray([vector for *_, vector in batch], dtype=np.float32).tobytes())
+            alive_file.write(b"\x01" * len(batch))
+            db.executemany(
+                "INSERT INTO records (id, row, text, metadata) VALUES (?, ?, ?, ?)",
+                [(doc_id, rows + offset, text, metadata) for offset, (doc_id, text, metadata, _) in enumerate(batch)]
+            )
+            _index_attributes(db, [(doc_id, text, metadata) for doc_id, text, metadata, _ in batch])
+            index_documents(db, [(doc_id, text) for doc_id, text, _, _ in batch])
+            rows += len(batch)
+        for file in (vectors_file, alive_file):
+            file.flush()
+            os.fsync(file.fileno())
+    db.executemany("INSERT OR REPLACE INTO aliases (alias, key) VALUES (?, ?)", builtin_aliases() + list(aliases))
+    db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                   [("dim", str(dim)), ("rows", str(rows)), ("dead_rows", "0"), ("attribute_index", "1"),
+                    ("lexical_index", "1"),
+                    *((key, str(value)) for key, value in manifest.items())])
+    db.commit()
+    db.close()
+    return rows
+
+
+class VaultStore:
+    def __init__(self, folder_path: str, embeddings, batch_size: int = 64, compact_threshold: int = 32,
+                 hybrid_alpha: float = 0.5, index_type: str = "auto", vector_storage: str = "float32",
+                 read_only: bool = False, lock_timeout: float | None = LOCK_TIMEOUT):
+        """With `read_only`, the vault is only searched: nothing on disk is changed, and
+        a vault that needs recovery raises VaultNeedsRecovery instead."""
+        self.folder_path = os.path.normpath(folder_path)
+        self.wal_path = self.folder_path + ".wal"
+        self.legacy_path = self.folder_path + ".langchain"
+        self.read_only = read_only
+        self.lock = FileLock.for_path(self.folder_path + ".lock", lock_timeout)
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.compact_threshold = compact_threshold
+        self.hybrid_alpha = hybrid_alpha
+        self.index_type = index_type
+        self.vector_storage = vector_storage
+        self.dim = None
+        self.rows = 0
+        self.dead_rows = 0
+        self._db = None
+        self._vectors = None
+        self._alive = None
+        self._lock = threading.RLock()
+        self._compaction_thread = None
+        self._ann = None
+        self._index_thread = None
+        self._bitmaps = None
+        # Bumped whenever rows are renumbered, so an index built before that is discarded.
+        self._generation = 0
+        self._ann_file = None
+
+        with self.lock:
+            if read_only:
+                # Under the lock a log can only be left over from a crashed writer.
+                if os.path.exists(self.wal_path) or self._needs_migration():
+                    raise VaultNeedsRecovery(f"{self.folder_path} has to be recovered by a writable open first.")
+            else:
+                self._recover_publish()
+                if self._needs_migration():
+                    self._migrate_langchain()
+            self._locate()
+            if os.path.exists(self.records_path):
+                self._open()
+            if not read_only:
+                self._replay_wal()
+
+    @property
+    def embedding_function(self):
+        return self.embeddings
+
+    @property
+    def loaded(self) -> bool:
+        """False until the first record has been written."""
+        return self._db is not None
+
+    # --- Opening ---
+    def _locate(self):
+        self.data_path = vault_data_path(self.folder_path)
+        self.records_path = os.path.join(self.data_path, RECORDS_FILE)
+        self.vectors_path = os.path.join(self.data_path, VECTORS_FILE)
+        self.alive_path = os.path.join(self.data_path, ALIVE_FILE)
+
+    def _needs_migration(self) -> bool:
+        return os.path.exists(os.path.join(self.folder_path, "index.pkl")) and \
+            not os.path.exists(os.path.join(vault_data_path(self.folder_path), RECORDS_FILE))
+
+    def _open(self):
+        if self.read_only:
+            uri = pathlib.Path(os.path.abspath(self.records_path)).as_uri() + "?mode=ro"
+            self._db = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            self._db = sqlite3.connect(self.records_path, check_same_thread=False)
+            self._db.executescript(SCHEMA + LEXICAL_SCHEMA)
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        self.dim = int(meta["dim"]) if "dim" in meta else None
+        self.rows = int(meta.get("rows", 0))
+        self.dead_rows = int(meta.get("dead_rows", 0))
+        self._bitmaps = None
+        self._check_manifest(meta)
+        if self.read_only:
+            if "attribute_index" not in meta or "lexical_index" not in meta:
+                self.close()
+                raise VaultNeedsRecovery(f"{self.folder_path} was written by an older version and needs indexing.")
+            self._map_files()
+            self._load_ann(meta)
+            return
+        with self._db:
+            self._db.executemany("INSERT OR IGNORE INTO aliases (alias, key) VALUES (?, ?)", builtin_aliases())
+            if "attribute_index" not in meta:
+                # Vaults written before the attribute index existed are indexed once.
+                _index_attributes(self._db, self._db.execute("SELECT id, text, metadata FROM records").fetchall())
+                self._set_meta(attribute_index=1)
+            if "lexical_index" not in meta:
+                index_documents(self._db, self._db.execute("SELECT id, text FROM records").fetchall())
+                self._set_meta(lexical_index=1)
+        self._map_files()
+        self._load_ann(meta)
+
+    def _check_manifest(self, meta: dict):
+        expected = embeddings_manifest(self.embeddings)
+        stored = {key: meta[key] for key in expected if key in meta}
+        if not stored:
+            # New vaults, and vaults written before the manifest existed, take the
+            # configured model as long as its vectors have the stored dimension.
+            if self.dim is not None and self._model_dim() != self.dim:
+                raise EmbeddingModelMismatch(
+                    f"The vault holds {self.dim}-dimensional vectors but {expected['embedding_model']} "
+                    f"produces {self._model_dim()}. Re-embed it with: python -m modelEngine.reembed --model <name>"
+                )
+            if not self.read_only:
+                with self._db:
+                    self._set_meta(**expected)
+            return
+        if stored != expected:
+            raise EmbeddingModelMismatch(
+                f"The vault was embedded with {stored} but the configured model is {expected}. Set "
+                f"embedding_model back in config.yaml, or re-embed the vault with: "
+                f"python -m modelEngine.reembed --model {expected['embedding_model']}"
+            )
+
+    def _model_dim(self) -> int:
+        return len(self.embeddings.embed_query("dimension check"))
+
+    def manifest(self) -> dict:
+        """Which model wrote the vault, its vector dimension and whether vectors are normalized."""
+        with self._lock:
+            if self._db is None:
+                return {}
+            meta = dict(self._db.execute(
+                "SELECT key, value FROM meta WHERE key IN ('embedding_model', 'normalize', 'dim')"
+            ))
+            return {
+                "embedding_model": meta.get("embedding_model"),
+                "dimension": int(meta["dim"]) if "dim" in meta else None,
+                "normalize": meta.get("normalize") == "1",
+            }
+
+    def _map_files(self):
+        # Rows past the committed count belong to a change that never finished; they
+        # are ignored here and overwritten by the next insert.
+        self._vectors = self._alive = None
+        if self.rows and self.dim:
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+            self._alive = np.memmap(self.alive_path, dtype=np.uint8, mode="r", shape=(self.rows,))
+
+    def _load_ann(self, meta: dict):
+        ann_file, ann_rows = meta.get("ann_file"), int(meta.get("ann_rows", 0))
+        if not self.read_only:
+            # Index files left behind by an interrupted rebuild are never referenced.
+            for name in os.listdir(self.data_path):
+                if name.startswith("ann-") and name != ann_file:
+                    try:
+                        os.remove(os.path.join(self.data_path, name))
+                    except OSError:
+                        pass  # still mapped by another process (Windows)
+        self._ann, self._ann_file = None, ann_file
+        if ann_file and 0 < ann_rows <= self.rows and os.path.exists(os.path.join(self.data_path, ann_file)):
+            self._ann = AnnIndex.load(os.path.join(self.data_path, ann_file), meta["ann_type"], ann_rows,
+                                      meta.get("ann_storage", "float32"))
+
+    def join_background(self, timeout: float | None = None):
+        """Waits for a running compaction, then for an index rebuild (which compaction may
+        start), to finish."""
+        for name in ("_compaction_thread", "_index_thread"):
+            thread = getattr(self, name)
+            if thread is not None and thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def close(self):
+        with self._lock:
+            self._ann = None
+            self._vectors = self._alive = None
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    # --- Writing ---
+    @contextmanager
+    def _writing(self):
+        """Holds the vault lock and this store's lock, with the store caught up on what
+        other processes wrote since it last looked."""
+        if self.read_only:
+            raise PermissionError(f"{self.folder_path} was opened read-only.")
+        with self.lock, self._lock:
+            self._catch_up()
+            # A log found under the lock was left by a writer that crashed.
+            if os.path.exists(self.wal_path):
+                self._replay_wal()
+            yield
+
+    def _catch_up(self):
+        """Picks up what other processes wrote since this store last looked."""
+        if vault_data_path(self.folder_path) != self.data_path or \
+                (self._db is None and os.path.exists(os.path.join(self.data_path, RECORDS_FILE))):
+            # Another process compacted (or created) the vault: its rows are numbered anew.
+            self.close()
+            self._generation += 1
+            self._locate()
+            if os.path.exists(self.records_path):
+                self._open()
+            return
+        if self._db is None:
+            return
+        meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        if int(meta.get("rows", 0)) != self.rows or int(meta.get("dead_rows", 0)) != self.dead_rows:
+            self.dim = int(meta["dim"]) if "dim" in meta else self.dim
+            self.rows, self.dead_rows = int(meta.get("rows", 0)), int(meta.get("dead_rows", 0))
+            self._bitmaps = None
+            self._map_files()
+        if meta.get("ann_file") != self._ann_file:
+            self._load_ann(meta)
+
+    def _set_meta(self, **values):
+        self._db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, str(value)) for key, value in values.items()])
+
+    @staticmethod
+    def _write_at(path: str, offset: int, data: bytes):
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as file:
+            file.seek(offset)
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+
+    def _set_alive(self, rows: list, flag: int):
+        for row in rows:
+            self._write_at(self.alive_path, row, bytes([flag]))
+
+    def _write_rows(self, vectors: np.ndarray) -> int:
+        """Writes vectors after the last committed row and returns the first new row."""
+        first_row = self.rows
+        self._write_at(self.vectors_path, first_row * self.dim * 4, vectors.astype(np.float32).tobytes())
+        self._write_at(self.alive_path, first_row, b"\x01" * len(vectors))
+        return first_row
+
+    # --- Bulk ingest ---
+    def add_texts(self, texts: list, metadatas: list | None = None, ids: list | None = None) -> list:
+        """Embeds `texts` in batches and writes them to the vault in one transaction."""
+        if not texts:
+            return []
+        ids = ids or [str(uuid.uuid4()) for _ in texts]
+        metadatas = metadatas or [{} for _ in texts]
+        with self._writing():
+            self._append_wal({"op": "add", "texts": texts, "metadatas": metadatas, "ids": ids})
+            self._apply_add(texts, metadatas, ids)
+            self._clear_wal()
+        self._after_write()
+        return ids
+
+    def _apply_add(self, texts: list, metadatas: list, ids: list):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embeddings.embed_documents(texts[start:start + self.batch_size]))
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self._db is None:
+            os.makedirs(self.data_path, exist_ok=True)
+            self._open()
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+        elif vectors.shape[1] != self.dim:
+            raise EmbeddingModelMismatch(f"Got {vectors.shape[1]}-dimensional vectors for a {self.dim}-dimensional vault.")
+
+        first_row = self._write_rows(vectors)
+        with self._db:
+            self._db.executemany(
+                "INSERT INTO records (id, row, text, metadata) VALUES (?, ?, ?, ?)",
+                [(_id, first_row + offset, text, json.dumps(metadata))
+                 for offset, (text, metadata, _id) in enumerate(zip(texts, metadatas, ids))]
+            )
+            _index_attributes(self._db, [(_id, text, json.dumps(metadata))
+                                         for text, metadata, _id in zip(texts, metadatas, ids)])
+            index_documents(self._db, list(zip(ids, texts)))
+            self._set_meta(dim=self.dim, rows=first_row + len(texts))
+        self.rows = first_row + len(texts)
+        self._map_files()
+        self._mark_rows(first_row, texts, metadatas)
+
+    # --- ID-addressed access ---
+    def _row_of(self, doc_id: str):
+        if self._db is None:
+            return None
+        found = self._db.execute("SELECT row FROM records WHERE id = ?", (doc_id,)).fetchone()
+        return found[0] if found else None
+
+    def get(self, doc_id: str):
+        """Returns the live Document with this ID, or None."""
+        with self._lock:
+            if self._db is None:
+                return None
+            found = self._db.execute("SELECT text, metadata FROM records WHERE id = ?", (doc_id,)).fetchone()
+            return Document(page_content=found[0], metadata=json.loads(found[1])) if found else None
+
+    def update(self, doc_id: str, text: str, metadata: dict | None = None) -> bool:
+        """Re-embeds one record and points it at a new vector row."""
+        with self._writing():
+            if self._row_of(doc_id) is None:
+                return False
+            vector = self.embeddings.embed_documents([text])[0]
+            self._append_wal({"op": "update", "id": doc_id, "text": text, "metadata": metadata or {}, "vector": vector})
+            self._apply_update(doc_id, text, metadata or {}, vector)
+            self._clear_wal()
+        self._after_write()
+        return True
+
+    def _apply_update(self, doc_id: str, text: str, metadata: dict, vector: list):
+        old_row = self._row_of(doc_id)
+        new_row = self._write_rows(np.asarray([vector], dtype=np.float32))
+        # Hide the old vector first: a crash before the commit leaves the record unsearchable
+        # until the log is replayed, never searchable twice.
+        self._set_alive([old_row], 0)
+        with self._db:
+            self._db.execute("UPDATE records SET row = ?, text = ?, metadata = ? WHERE id = ?",
+                             (new_row, text, json.dumps(metadata), doc_id))
+            _index_attributes(self._db, [(doc_id, text, json.dumps(metadata))])
+            index_documents(self._db, [(doc_id, text)])
+            self._set_meta(rows=new_row + 1, dead_rows=self.dead_rows + 1)
+        self.rows = new_row + 1
+        self.dead_rows += 1
+        self._map_files()
+        self._mark_rows(new_row, [text], [metadata])
+
+    def delete(self, doc_ids: list) -> int:
+        """Deletes records. They disappear from searches immediately; their vectors are
+        removed by a background compaction."""
+        with self._writing():
+            live_ids = [i for i in doc_ids if self._row_of(i) is not None]
+            if not live_ids:
+                return 0
+            self._append_wal({"op": "delete", "ids": live_ids})
+            self._apply_delete(live_ids)
+            self._clear_wal()
+        self._after_write()
+        return len(live_ids)
+
+    def _after_write(self):
+        with self._lock:
+            needs_compaction = self.dead_rows >= max(self.compact_threshold, int(self.rows * COMPACT_RATIO))
+            needs_index = not needs_compaction and needs_rebuild(
+                self._ann, self.rows - self.dead_rows, self.rows, self.index_type, self.vector_storage
+            )
+        if needs_compaction:
+            self.compact_in_background()
+        elif needs_index:
+            self.rebuild_index_in_background()
+
+    def _apply_delete(self, doc_ids: list):
+        rows = [row for row in (self._row_of(i) for i in doc_ids) if row is not None]
+        if not rows:
+            return
+        self._set_alive(rows, 0)
+        with self._db:
+            self._db.executemany("DELETE FROM records WHERE id = ?", [(i,) for i in doc_ids])
+            self._db.executemany("DELETE FROM attributes WHERE id = ?", [(i,) for i in doc_ids])
+            remove_documents(self._db, doc_ids)
+            self._set_meta(dead_rows=self.dead_rows + len(rows))
+        self.dead_rows += len(rows)
+
+    def count(self) -> int:
+        with self._lock:
+            if self._db is None:
+                return 0
+            return self._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def list_documents(self, offset: int = 0, limit: int | None = None) -> list:
+        """Returns [(id, Document)] for live records in insertion order, one page at a time."""
+        with self._lock:
+            if self._db is None:
+                return []
+            found = self._db.execute(
+                "SELECT id, text, metadata FROM records ORDER BY seq LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset)
+            )
+            return [(i, Document(page_content=text, metadata=json.loads(metadata))) for i, text, metadata in found]
+
+    def _records_by_row(self, rows: set) -> dict:
+        records, rows = {}, list(rows)
+        # Stay under SQLite's bound-parameter limit.
+        for start in range(0, len(rows), 500):
+            chunk = rows[start:start + 500]
+            found = self._db.execute(
+                f"SELECT row, id, text, metadata FROM records WHERE row IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for row, doc_id, text, metadata in found:
+                records[row] = (doc_id, Document(page_content=text, metadata=json.loads(metadata)))
+        return records
+
+    def _records_by_id(self, doc_ids: set) -> dict:
+        records, doc_ids = {}, list(doc_ids)
+        for start in range(0, len(doc_ids), 500):
+            chunk = doc_ids[start:start + 500]
+            found = self._db.execute(
+                f"SELECT id, row, text, metadata FROM records WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            )
+            for doc_id, row, text, metadata in found:
+                records[doc_id] = (row, Document(page_content=text, metadata=json.loads(metadata)))
+        return records
+
+    def vectors_for(self, doc_ids: list) -> dict:
+        """Returns {doc_id: vector} read from the mapped vector file."""
+        with self._lock:
+            if self._vectors is None:
+                return {}
+            rows = self._records_by_id(set(doc_ids))
+            return {doc_id: np.array(self._vectors[row]) for doc_id, (row, _) in rows.items()}
+
+    # --- Exact attribute lookups ---
+    def add_alias(self, alias: str, attribute: str):
+        """Makes `alias` resolve to the same records as `attribute`."""
+        with self._writing():
+            if self._db is None:
+                return
+            key = self._canonical(normalize_attribute(attribute))
+            with self._db:
+                self._db.execute("INSERT OR REPLACE INTO aliases (alias, key) VALUES (?, ?)",
+                                 (normalize_attribute(alias), key))
+
+    def _canonical(self, key: str) -> str:
+        found = self._db.execute("SELECT key FROM aliases WHERE alias = ?", (key,)).fetchone()
+        return found[0] if found else key
+
+    def _ids_for_attribute(self, key: str, label: str | None = None) -> list:
+        canonical = self._canonical(key)
+        keys = [canonical] + [a for (a,) in self._db.execute("SELECT alias FROM aliases WHERE key = ?", (canonical,))]
+        keys = list(dict.fromkeys(keys))
+        sql = (f"SELECT a.id FROM attributes a JOIN records r ON r.id = a.id "
+               f"WHERE a.key IN ({','.join('?' * len(keys))})")
+        params = keys
+        if label is not None:
+            sql += " AND a.label = ?"
+            params = keys + [label]
+        return [doc_id for (doc_id,) in self._db.execute(sql + " ORDER BY r.seq", params)]
+
+    def lookup_attribute(self, query: str, k: int = 3, filters: dict | None = None):
+        """Returns [(doc_id, Document)] for records whose attribute is `query` or one of its
+        aliases, or None when no attribute matches and the query needs vector search.
+
+        A leading label ("work email address") only matches records with that label.
+        `filters` ({"label": "work"}) narrows the matches when any of them pass it.
+        """
+        with self._lock:
+            if self._db is None:
+                return None
+            key = normalize_attribute(query)
+            doc_ids = self._ids_for_attribute(key)
+            if not doc_ids and " " in key:
+                label, rest = key.split(" ", 1)
+                doc_ids = self._ids_for_attribute(rest, label=label)
+            if not doc_ids:
+                return None
+            frozen = freeze_filters(filters)
+            if frozen:
+                condition, params = self._filter_condition(frozen)
+                passing = {doc_id for (doc_id,) in self._db.execute(
+                    f"SELECT a.id FROM attributes a WHERE a.id IN ({','.join('?' * len(doc_ids))}) AND {condition}",
+                    doc_ids + params
+                )}
+                doc_ids = [doc_id for doc_id in doc_ids if doc_id in passing] or doc_ids
+            return [(doc_id, self.get(doc_id)) for doc_id in doc_ids[:k]]
+
+    def lookup_attributes_batch(self, queries: list, k: int = 3, filters=None) -> list:
+        return [self.lookup_attribute(query, k, query_filters)
+                for query, query_filters in zip(queries, self._per_query(filters, len(queries)))]
+
+    # --- Metadata filters ---
+    @staticmethod
+    def _per_query(filters, count: int) -> list:
+        if filters is None or isinstance(filters, dict):
+            return [filters] * count
+        return list(filters)
+
+    @staticmethod
+    def _filter_condition(frozen_filters: tuple) -> tuple:
+        """SQL condition on the attributes table (as `a`) and its parameters."""
+        clauses, params = [], []
+        for field, values in frozen_filters:
+            clauses.append(f"a.{field} IN ({','.join('?' * len(values))})")
+            params.extend(values)
+        return " AND ".join(clauses), params
+
+    def _ids_matching(self, frozen_filters: tuple) -> set:
+        condition, params = self._filter_condition(frozen_filters)
+        return {doc_id for (doc_id,) in self._db.execute(f"SELECT a.id FROM attributes a WHERE {condition}", params)}
+
+    def _mark_rows(self, first_row: int, texts: list, metadatas: list):
+        # Bitmaps are built on the first filtered search; until then there is nothing to extend.
+        if self._bitmaps is None:
+            return
+        entries = []
+        for offset, (text, metadata) in enumerate(zip(texts, metadatas)):
+            _, label, category = attribute_entry(text, metadata)
+            entries.append((first_row + offset, category, label))
+        self._bitmaps.set(entries, self.rows)
+
+    def _filter_mask(self, frozen_filters: tuple) -> np.ndarray:
+        """Live rows that pass the filters."""
+        if self._bitmaps is None:
+            self._bitmaps = RowBitmaps(self.rows)
+            self._bitmaps.set(self._db.execute(
+                "SELECT r.row, a.category, a.label FROM attributes a JOIN records r ON r.id = a.id"
+            ))
+        return self._bitmaps.mask(frozen_filters) & (np.asarray(self._alive) != 0)
+
+    def metadata_values(self, field: str) -> list:
+        """The distinct "category" or "label" values of live records."""
+        with self._lock:
+            if self._db is None or field not in FILTER_FIELDS:
+                return []
+            return [value for (value,) in self._db.execute(
+                f"SELECT DISTINCT {field} FROM attributes WHERE {field} != '' ORDER BY {field}"
+            )]
+
+    # --- Search ---
+    def search_with_ids_batch(self, queries: list, k: int = 3, modes=None, filters=None) -> list:
+        """One list of (doc_id, Document, score) per query, skipping deleted records.
+
+        `modes` is one retrieval mode for every query or a list with one per query:
+        "vector" (the default), "bm25", or the fused "rrf" and "weighted". Whatever
+        decides the order, the score is the record's squared L2 distance to the query.
+        `filters` is likewise one {"category"/"label": values} dict or a list of them;
+        a query with a filter only considers the records that pass it.
+        All queries share one embedding call and one pass over the vectors per filter;
+        record text is only read for the records that are returned.
+        """
+        if not queries:
+            return []
+        if modes is None or isinstance(modes, str):
+            modes = [modes or "vector"] * len(queries)
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise ValueError(f"Unknown retrieval mode(s): {sorted(unknown)}")
+        filters = [freeze_filters(query_filters) for query_filters in self._per_query(filters, len(queries))]
+
+        with self._lock:
+            if self._vectors is None:
+                return [[] for _ in queries]
+            triples = list(dict.fromkeys(zip(queries, modes, filters)))
+            unique_queries = list(dict.fromkeys(queries))
+            query_vectors = np.asarray(self._embed_queries(unique_queries), dtype=np.float32)
+            query_vector = dict(zip(unique_queries, query_vectors))
+            # Fusion needs a deeper candidate list from each side than it returns.
+            fetch_k = k if all(mode == "vector" for _, mode, _ in triples) else k * HYBRID_CANDIDATES
+
+            documents, row_of, vector_hits = {}, {}, {}
+            for frozen in dict.fromkeys(filters):
+                group = list(dict.fromkeys(query for query, f in zip(queries, filters) if f == frozen))
+                mask = self._filter_mask(frozen) if frozen else None
+                scores, rows = self._nearest(np.stack([query_vector[query] for query in group]), fetch_k, mask)
+                records = self._records_by_row({int(row) for row in rows.flat if row >= 0})
+                for q, query in enumerate(group):
+                    hits = vector_hits[(query, frozen)] = []
+                    for row, score in zip(rows[q], scores[q]):
+                        if int(row) in records:
+                            doc_id, doc = records[int(row)]
+                            documents[doc_id], row_of[doc_id] = doc, int(row)
+                            hits.append((doc_id, float(score)))
+
+            allowed, ranked_by_triple = {}, {}
+            for query, mode, frozen in triples:
+                hits = vector_hits[(query, frozen)]
+                if mode == "vector":
+                    ranked = [doc_id for doc_id, _ in hits]
+                else:
+                    if frozen and frozen not in allowed:
+                        allowed[frozen] = self._ids_matching(frozen)
+                    lexical_hits = bm25_search(self._db, query, fetch_k, allowed.get(frozen))
+                    if mode == "bm25":
+                        ranked = [doc_id for doc_id, _ in lexical_hits]
+                    elif mode == "rrf":
+                        ranked = reciprocal_rank_fusion([[i for i, _ in hits], [i for i, _ in lexical_hits]])
+                    else:
+                        ranked = weighted_fusion(hits, lexical_hits, self.hybrid_alpha)
+                ranked_by_triple[(query, mode, frozen)] = ranked[:k]
+
+            # Records found only by BM25 are fetched by ID, and their distance is computed
+            # from the mapped vector so every result carries the same kind of score.
+            missing = {i for ranked in ranked_by_triple.values() for i in ranked if i not in documents}
+            for doc_id, (row, doc) in self._records_by_id(missing).items():
+                documents[doc_id], row_of[doc_id] = doc, row
+            distances = {(query, frozen, doc_id): score
+                         for (query, frozen), hits in vector_hits.items() for doc_id, score in hits}
+
+            results_by_triple = {}
+            for (query, mode, frozen), ranked in ranked_by_triple.items():
+                results = []
+                for doc_id in ranked:
+                    if doc_id not in documents:
+                        continue
+                    score = distances.get((query, frozen, doc_id))
+                    if score is None:
+                        difference = np.asarray(self._vectors[row_of[doc_id]]) - query_vector[query]
+                        score = float(difference @ difference)
+                    results.append((doc_id, documents[doc_id], score))
+                results_by_triple[(query, mode, frozen)] = results
+        return [results_by_triple[triple] for triple in zip(queries, modes, filters)]
+
+    def _embed_queries(self, queries: list) -> list:
+        """Query vectors, through the query cache when the embeddings have one."""
+        embed_queries = getattr(self.embeddings, "embed_queries", None)
+        return embed_queries(queries) if embed_queries else self.embeddings.embed_documents(queries)
+
+    def _nearest(self, query_vectors: np.ndarray, k: int, mask: np.ndarray | None = None):
+        if mask is None:
+            if self._ann is not None:
+                return self._ann.search(query_vectors, k, self._vectors, self._alive)
+            return flat_search(self._vectors, self._alive, query_vectors, k)
+        rows = np.flatnonzero(mask)
+        if len(rows) <= FILTER_SCAN_ROWS:
+            return subset_search(self._vectors, rows, query_vectors, k)
+        if self._ann is not None:
+            return self._ann.search(query_vectors, k, self._vectors, mask, restrict=True)
+        return flat_search(self._vectors, mask, query_vectors, k)
+
+    def similarity_search_with_score_batch(self, queries: list, k: int = 3, modes=None, filters=None) -> list:
+        """One list of (Document, score) per query, skipping deleted records."""
+        return [[(doc, score) for _, doc, score in results]
+                for results in self.search_with_ids_batch(queries, k, modes, filters)]
+
+    def similarity_search_with_score(self, query: str, k: int = 3, mode: str = "vector") -> list:
+        return self.similarity_search_with_score_batch([query], k=k, modes=mode)[0]
+
+    # --- Compaction ---
+    def compact(self):
+        """Rewrites the vault without dead rows into a new generation and publishes it."""
+        with self._writing():
+            if not self.dead_rows or self._db is None:
+                return
+            removed = self.dead_rows
+
+            def batches():
+                cursor = self._db.execute("SELECT id, row, text, metadata FROM records ORDER BY seq")
+                while True:
+                    chunk = cursor.fetchmany(COPY_BATCH)
+                    if not chunk:
+                        return
+                    vectors = self._vectors[[row for _, row, _, _ in chunk]]
+                    yield [(i, text, metadata, vector) for (i, _, text, metadata), vector in zip(chunk, vectors)]
+
+            aliases = self._db.execute("SELECT alias, key FROM aliases").fetchall()
+            generation = new_generation_path(self.folder_path)
+            write_vault(generation, self.dim, batches(), embeddings_manifest(self.embeddings), aliases)
+            # Closed first, so this process's handles never keep the old generation around.
+            self.close()
+            publish(self.folder_path, generation)
+            self._generation += 1
+            self._locate()
+            self._open()
+            print(f"Compacted {removed} dead row(s) out of the vault.")
+        # Rows were renumbered, so any ANN index has to be built again.
+        if needs_rebuild(self._ann, self.rows - self.dead_rows, self.rows, self.index_type, self.vector_storage):
+            self.rebuild_index_in_background()
+
+    def compact_in_background(self):
+        with self._lock:
+            if self._compaction_thread and self._compaction_thread.is_alive():
+                return
+            self._compaction_thread = threading.Thread(target=self.compact, daemon=True)
+            self._compaction_thread.start()
+
+    # --- ANN index ---
+    def index_info(self) -> dict:
+        with self._lock:
+            ann = self._ann
+            return {"type": ann.index_type if ann else "flat", "storage": ann.storage if ann else "float32",
+                    "index_bytes": ann.memory_bytes() if ann else 0, "indexed_rows": ann.rows if ann else 0,
+                    "rows": self.rows, "dead_rows": self.dead_rows}
+
+    def rebuild_index(self, index_type: str | None = None) -> str:
+        """Builds the ANN index for the current rows and returns its type. With "auto"
+        (the default) the type is chosen by record count. A "flat" type with float32
+        storage drops the index, as the vector file is then searched directly.
+        Searches keep using the previous index while the new one is built."""
+        if self.read_only:
+            raise PermissionError(f"{self.folder_path} was opened read-only.")
+        with self._lock:
+            if self._vectors is None:
+                return "flat"
+            configured = index_type or self.index_type
+            wanted = choose_index_type(self.rows - self.dead_rows) if configured == "auto" else configured
+            vectors, rows, generation = self._vectors, self.rows, self._generation
+            storage = effective_storage(wanted, self.vector_storage, rows)
+
+        ann = None
+        if wanted != "flat" or storage != "float32":
+            ann = AnnIndex(build_index(vectors, wanted, storage), wanted, rows, storage)
+
+        with self._writing():
+            if self._db is None or generation != self._generation:
+                # Compaction renumbered the rows meanwhile; it schedules its own rebuild.
+                return wanted
+            ann_file = ""
+            if ann is not None:
+                ann_file = f"ann-{wanted}-{storage}-{rows}.faiss"
+                ann.save(os.path.join(self.data_path, ann_file))
+            with self._db:
+                self._set_meta(ann_file=ann_file, ann_type=wanted, ann_storage=storage, ann_rows=rows if ann else 0)
+            self._load_ann(dict(self._db.execute("SELECT key, value FROM meta")))
+        print(f"Built a '{wanted}' ({storage}) index over {rows} vault row(s).")
+        return wanted
+
+    def rebuild_index_in_background(self):
+        with self._lock:
+            if self._index_thread and self._index_thread.is_alive():
+                return
+            self._index_thread = threading.Thread(target=self.rebuild_index, daemon=True)
+            self._index_thread.start()
+
+    # --- One-shot migration ---
+    def _migrate_langchain(self):
+        """Converts a LangChain FAISS folder (pickled docstore) into the vault format.
+        This is the only place the pickle is still loaded."""
+        import faiss
+        from langchain_community.vectorstores import FAISS
+
+        print(f"Migrating {self.folder_path} from the LangChain FAISS format...")
+        legacy = FAISS.load_local(self.folder_path, self.embeddings, allow_dangerous_deserialization=True)
+        index = legacy.index
+        if index.d != self._model_dim():
+            raise EmbeddingModelMismatch(
+                f"{self.folder_path} holds {index.d}-dimensional vectors, which the configured model "
+                f"does not produce. Configure the model that built it before migrating."
+            )
+
+        def batches():
+            for start in range(0, index.ntotal, COPY_BATCH):
+                count = min(COPY_BATCH, index.ntotal - start)
+                vectors = index.reconstruct_n(start, count)
+                if getattr(legacy, "_normalize_L2", False):
+                    faiss.normalize_L2(vectors)
+                batch = []
+                for offset, vector in enumerate(vectors):
+                    doc_id = legacy.index_to_docstore_id[start + offset]
+                    doc = legacy.docstore.search(doc_id)
+                    batch.append((doc_id, doc.page_content, json.dumps(doc.metadata), vector))
+                yield batch
+
+        generation = new_generation_path(self.folder_path)
+        migrated = write_vault(generation, index.d, batches(), embeddings_manifest(self.embeddings))
+        shutil.rmtree(self.legacy_path, ignore_errors=True)
+        publish(self.folder_path, generation)
+        self._move_langchain_files()
+        print(f"Migrated {migrated} record(s); the original index is kept at {self.legacy_path}.")
+
+    def _move_langchain_files(self):
+        """Moves the migrated LangChain files out of the vault folder."""
+        for name in LANGCHAIN_FILES:
+            path = os.path.join(self.folder_path, name)
+            if os.path.exists(path):
+                os.makedirs(self.legacy_path, exist_ok=True)
+                os.replace(path, os.path.join(self.legacy_path, name))
+
+    # --- Write-ahead log ---
+    def _append_wal(self, entry: dict):
+        with open(self.wal_path, "a", encoding="utf-8") as wal:
+            wal.write(json.dumps(entry) + "\n")
+            wal.flush()
+            os.fsync(wal.fileno())
+
+    def _clear_wal(self):
+        if os.path.exists(self.wal_path):
+            os.remove(self.wal_path)
+
+    def _replay_wal(self):
+        if not os.path.exists(self.wal_path):
+            return
+        replayed = 0
+        with self._lock, open(self.wal_path, "r", encoding="utf-8") as wal:
+            for line in wal:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line means that change never started applying.
+                    break
+                op = entry.get("op", "add")
+                if op == "add":
+                    new = [(t, m, i) for t, m, i in zip(entry["texts"], entry["metadatas"], entry["ids"])
+                           if self._row_of(i) is None]
+                    if new:
+                        texts, metadatas, ids = (list(column) for column in zip(*new))
+                        self._apply_add(texts, metadatas, ids)
+                elif op == "update" and self._row_of(entry["id"]) is not None:
+                    self._apply_update(entry["id"], entry["text"], entry["metadata"], entry["vector"])
+                elif op == "delete" and self._db is not None:
+                    self._apply_delete(entry["ids"])
+                replayed += 1
+        self._clear_wal()
+        if replayed:
+            print(f"Replayed {replayed} change(s) from the vault write-ahead log.")
+
+    # --- Crash recovery ---
+    def _recover_publish(self):
+        """Finishes a migration or compaction interrupted by a crash. The caller holds
+        the vault lock."""
+        # A migration that published its generation but did not move the originals yet.
+        if os.path.exists(os.path.join(self.folder_path, CURRENT_FILE)):
+            self._move_langchain_files()
+        # Generations written but never published.
+        remove_stale(self.folder_path)
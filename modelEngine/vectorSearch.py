@@ -0,0 +1,80 @@
+import numpy as np
+
+# --- Exact Vector Search ---
+# Helpers for searching the vault's memory-mapped vectors without an ANN index, and
+# for merging and re-scoring candidates an ANN index returns. Every query of a form
+# is searched in one matrix product (see VaultStore.search_with_ids_batch).
+
+def flat_search(vectors, alive, queries: np.ndarray, k: int, chunk_rows: int = 65536):
+    """Exact top-k by squared L2 distance, the score FAISS IndexFlatL2 returns.
+
+    `vectors` may be a memory-mapped (rows, dim) matrix; it is read one chunk at a time,
+    so the whole file never has to be resident. Rows whose `alive` flag is 0 are
+    skipped. Returns (scores, rows) padded with inf / -1 when fewer than k rows match.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    best_scores = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    if k <= 0 or len(queries) == 0:
+        return best_scores, best_rows
+
+    query_norms = np.einsum("ij,ij->i", queries, queries)[:, None]
+    for start in range(0, len(vectors), chunk_rows):
+        block = np.asarray(vectors[start:start + chunk_rows], dtype=np.float32)
+        scores = query_norms - 2.0 * (queries @ block.T) + np.einsum("ij,ij->i", block, block)[None, :]
+        np.maximum(scores, 0.0, out=scores)
+        scores[:, np.asarray(alive[start:start + len(block)]) == 0] = np.inf
+
+        # Merge this chunk's candidates with the best k so far.
+        all_scores = np.concatenate([best_scores, scores], axis=1)
+        all_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, start + len(block)), scores.shape)], axis=1)
+        top = np.argpartition(all_scores, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(all_scores, top, axis=1)
+        best_rows = np.take_along_axis(all_rows, top, axis=1)
+
+    order = np.argsort(best_scores, axis=1, kind="stable")
+    best_scores = np.take_along_axis(best_scores, order, axis=1)
+    best_rows = np.take_along_axis(best_rows, order, axis=1)
+    best_rows[np.isinf(best_scores)] = -1
+    return best_scores, best_rows
+
+def merge_top_k(scores_a, rows_a, scores_b, rows_b, k: int):
+    """Merges two per-query candidate sets into one top-k sorted by score, padded with
+    inf / -1 like FAISS. The second set may be None."""
+    if scores_b is not None:
+        scores_a = np.concatenate([scores_a, scores_b], axis=1)
+        rows_a = np.concatenate([rows_a, rows_b], axis=1)
+    if scores_a.shape[1] < k:
+        padding = k - scores_a.shape[1]
+        scores_a = np.pad(scores_a, ((0, 0), (0, padding)), constant_values=np.inf)
+        rows_a = np.pad(rows_a, ((0, 0), (0, padding)), constant_values=-1)
+    order = np.argsort(scores_a, axis=1, kind="stable")[:, :k]
+    scores = np.take_along_axis(scores_a, order, axis=1)
+    rows = np.take_along_axis(rows_a, order, axis=1)
+    rows[np.isinf(scores)] = -1
+    return scores, rows
+
+def rerank_exact(scores, rows, queries: np.ndarray, vectors):
+    """Replaces approximate scores with exact squared L2 distances, reading only the
+    candidate rows from the (memory-mapped) float32 vectors. Rows of -1 keep inf."""
+    scores = np.array(scores, dtype=np.float32)
+    for q in range(len(queries)):
+        keep = rows[q] >= 0
+        if keep.any():
+            difference = np.asarray(vectors[rows[q][keep]]) - queries[q]
+            scores[q][keep] = np.einsum("ij,ij->i", difference, difference)
+    return scores
+
+def subset_search(vectors, rows: np.ndarray, queries: np.ndarray, k: int, chunk_rows: int = 65536):
+    """Exact top-k over only the given rows, e.g. the records a metadata filter keeps.
+    Returns (scores, rows) like flat_search, with rows numbered as in `vectors`."""
+    queries = np.asarray(queries, dtype=np.float32)
+    best_scores = np.full((len(queries), k), np.inf, dtype=np.float32)
+    best_rows = np.full((len(queries), k), -1, dtype=np.int64)
+    for start in range(0, len(rows), chunk_rows):
+        chunk = np.asarray(rows[start:start + chunk_rows], dtype=np.int64)
+        block = np.asarray(vectors[chunk], dtype=np.float32)
+        scores, positions = flat_search(block, np.ones(len(chunk), dtype=np.uint8), queries, k)
+        found = np.where(positions >= 0, chunk[np.maximum(positions, 0)], -1)
+        best_scores, best_rows = merge_top_k(best_scores, best_rows, scores, found, k)
+    return best_scores, best_rows
@@ -0,0 +1,60 @@
+'''
+Measures recall@k against exact search and p50/p99 single-query latency for each
+vault index type (flat, hnsw, ivf, ivfpq) on synthetic MiniLM-sized vectors.
+
+Run from the project root (the 1M run needs about 2 GB of free disk and RAM):
+    python tests/annIndexBenchmark.py
+    python tests/annIndexBenchmark.py 1000 100000
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelEngine.annIndex import AnnIndex, INDEX_TYPES, build_index, choose_index_type
+from modelEngine.vectorSearch import flat_search
+from benchmarkData import synthetic_vectors
+
+DIM = 384
+K = 10
+QUERIES = 200
+sizes = [int(arg) for arg in sys.argv[1:]] or [1_000, 100_000, 1_000_000]
+
+
+folder = tempfile.mkdtemp(prefix="securefill-ann-")
+try:
+    rng = np.random.default_rng(0)
+    for rows in sizes:
+        vectors = synthetic_vectors(os.path.join(folder, f"vectors-{rows}.f32"), rows, rng, DIM)
+        alive = np.ones(rows, dtype=np.uint8)
+        queries = np.asarray(vectors[rng.choice(rows, QUERIES, replace=False)])
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+        _, truth = flat_search(vectors, alive, queries, K)
+        print(f"\n{rows:,} records (auto choice: {choose_index_type(rows)})")
+
+        for index_type in INDEX_TYPES:
+            start = time.perf_counter()
+            ann = AnnIndex(build_index(vectors, index_type), index_type, rows) if index_type != "flat" else None
+            build_seconds = time.perf_counter() - start
+
+            latencies, found = [], []
+            for query in queries:
+                start = time.perf_counter()
+                if ann is None:
+                    _, result = flat_search(vectors, alive, query[None, :], K)
+                else:
+                    _, result = ann.search(query[None, :], K, vectors, alive)
+                latencies.append((time.perf_counter() - start) * 1000)
+                found.append(result[0])
+            recall = np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])
+            print(f"  {index_type:<6} | build {build_seconds:7.1f} s | recall@{K} {recall:.3f} "
+                  f"| p50 {np.percentile(latencies, 50):7.2f} ms | p99 {np.percentile(latencies, 99):7.2f} ms")
+        del vectors
+finally:
+    shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,69 @@
+'''
+Compares searching the vault once per field with the batched
+VaultStore.search_with_ids_batch path used by search_vector_db, for growing numbers
+of form fields.
+
+Run from the project root:
+    python tests/batchSearchBenchmark.py
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_huggingface import HuggingFaceEmbeddings
+from modelEngine.vaultStore import VaultStore
+
+texts = [
+    "Field: Full Name | Value: John Doe | Description: Legal name of the user.",
+    "Field: Email Address | Value: john.doe@example.com | Description: Personal email address.",
+    "Field: Work Email | Value: john.doe@company.com | Description: Work email address.",
+    "Field: Mobile Number | Value: +91-9876543210 | Description: Primary contact number.",
+    "Field: Date of Birth | Value: 1990-01-01 | Description: Date of birth of the user.",
+    "Field: Home Address | Value: 123 Main Street, Springfield | Description: Permanent residential address.",
+    "Field: Postal Code | Value: 123456 | Description: PIN code of the home address.",
+    "Field: PAN Number | Value: ABCDE1234F | Description: Income tax PAN card number.",
+    "Field: Aadhar Number | Value: 1234-5678-9012 | Description: UIDAI identification number.",
+    "Field: Passport Number | Value: A1234567 | Description: Indian passport number.",
+    "Field: Bank Account | Value: 1234567890 | Description: Canara Bank savings account.",
+    "Field: IFSC Code | Value: CNRB0001234 | Description: IFSC of the Canara Bank branch.",
+]
+
+field_queries = [
+    "full name", "email address", "work email", "mobile number", "date of birth",
+    "home address", "postal code", "pan card number", "aadhar number", "passport number",
+    "bank account number", "ifsc code", "city", "state", "country", "father's name",
+    "occupation", "annual income", "nominee name", "alternate phone number",
+]
+
+embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+folder = tempfile.mkdtemp(prefix="securefill-batch-")
+db = VaultStore(os.path.join(folder, "vault"), embeddings)
+try:
+    db.add_texts(texts)
+    db.search_with_ids_batch(["warm up"], k=1)
+
+    for field_count in [5, 15, 30, 60]:
+        queries = [field_queries[i % len(field_queries)] + ("" if i < len(field_queries) else f" {i}") for i in range(field_count)]
+
+        start = time.time()
+        loop_results = [db.search_with_ids_batch([q], k=3)[0] for q in queries]
+        loop_time = time.time() - start
+
+        start = time.time()
+        batch_results = db.search_with_ids_batch(queries, k=3)
+        batch_time = time.time() - start
+
+        identical = all(
+            [doc_id for doc_id, _, _ in a] == [doc_id for doc_id, _, _ in b]
+            for a, b in zip(loop_results, batch_results)
+        )
+        print(f"{field_count:>3} fields | loop {loop_time * 1000:8.1f} ms | batch {batch_time * 1000:8.1f} ms "
+              f"| speedup {loop_time / batch_time:5.1f}x | identical: {identical}")
+finally:
+    db.close()
+    shutil.rmtree(folder, ignore_errors=True)
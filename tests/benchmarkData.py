@@ -0,0 +1,17 @@
+'''
+Synthetic data shared by the vault benchmarks in this folder.
+'''
+
+import numpy as np
+
+
+def synthetic_vectors(path, rows, rng, dim=384):
+    """Unit vectors around a few thousand centres, written in chunks to a memory map."""
+    centres = rng.standard_normal((max(16, rows // 200), dim)).astype(np.float32)
+    vectors = np.memmap(path, dtype=np.float32, mode="w+", shape=(rows, dim))
+    for start in range(0, rows, 65536):
+        count = min(65536, rows - start)
+        chunk = centres[rng.integers(0, len(centres), count)] + 0.35 * rng.standard_normal((count, dim)).astype(np.float32)
+        vectors[start:start + count] = chunk / np.linalg.norm(chunk, axis=1, keepdims=True)
+    vectors.flush()
+    return np.memmap(path, dtype=np.float32, mode="r", shape=(rows, dim))
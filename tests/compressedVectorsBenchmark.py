@@ -0,0 +1,65 @@
+'''
+Measures what compressed vector storage (vault_vector_storage: float16 or pq) saves in
+index memory, and what it costs in recall@k and p50/p99 latency once candidates are
+re-ranked from the float32 vector file, on synthetic MiniLM-sized vectors.
+
+Run from the project root:
+    python tests/compressedVectorsBenchmark.py
+    python tests/compressedVectorsBenchmark.py 20000 300000
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modelEngine.annIndex import AnnIndex, STORAGE_TYPES, build_index, effective_storage
+from modelEngine.vectorSearch import flat_search
+from benchmarkData import synthetic_vectors
+
+DIM = 384
+K = 10
+QUERIES = 200
+sizes = [int(arg) for arg in sys.argv[1:]] or [100_000]
+
+
+folder = tempfile.mkdtemp(prefix="securefill-storage-")
+try:
+    rng = np.random.default_rng(0)
+    for rows in sizes:
+        vectors = synthetic_vectors(os.path.join(folder, f"vectors-{rows}.f32"), rows, rng, DIM)
+        alive = np.ones(rows, dtype=np.uint8)
+        queries = np.asarray(vectors[rng.choice(rows, QUERIES, replace=False)])
+        queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+        _, truth = flat_search(vectors, alive, queries, K)
+        print(f"\n{rows:,} records (float32 vector file: {rows * DIM * 4 / 2**20:.1f} MB)")
+
+        for index_type in ("flat", "hnsw"):
+            for storage in STORAGE_TYPES:
+                storage = effective_storage(index_type, storage, rows)
+                if index_type == "flat" and storage == "float32":
+                    ann, memory = None, rows * DIM * 4
+                else:
+                    ann = AnnIndex(build_index(vectors, index_type, storage), index_type, rows, storage)
+                    memory = ann.memory_bytes()
+
+                latencies, found = [], []
+                for query in queries:
+                    start = time.perf_counter()
+                    if ann is None:
+                        _, result = flat_search(vectors, alive, query[None, :], K)
+                    else:
+                        _, result = ann.search(query[None, :], K, vectors, alive)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    found.append(result[0])
+                recall = np.mean([len(set(f) & set(t)) / K for f, t in zip(found, truth)])
+                print(f"  {index_type:<5} {storage:<7} | index {memory / 2**20:8.1f} MB | recall@{K} {recall:.3f} "
+                      f"| p50 {np.percentile(latencies, 50):7.2f} ms | p99 {np.percentile(latencies, 99):7.2f} ms")
+        del vectors
+finally:
+    shutil.rmtree(folder, ignore_errors=True)
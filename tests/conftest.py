@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The tests import the project the way main.py does, from the project root; host.py
+# imports channel.py as a sibling, so its folder is on the path as well.
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "Extensions", "python_host"))
@@ -0,0 +1,76 @@
+'''
+Compares precision@k of pure vector search with BM25 and the fused retrieval modes
+used by search_vector_db, on a small labelled vault.
+
+Run from the project root:
+    python tests/hybridSearchBenchmark.py
+'''
+
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_huggingface import HuggingFaceEmbeddings
+from modelEngine.vaultStore import VaultStore
+
+records = [
+    ("Full Name", "John Doe", "Legal name of the user."),
+    ("Email Address", "john.doe@example.com", "Personal email address."),
+    ("Work Email", "john.doe@company.com", "Work email address."),
+    ("Mobile Number", "+91-9876543210", "Primary contact number."),
+    ("Office Phone", "+91-8012345678", "Desk phone at the office."),
+    ("Date of Birth", "1990-01-01", "Date of birth of the user."),
+    ("Home Address", "123 Main Street, Springfield", "Permanent residential address."),
+    ("Postal Code", "123456", "PIN code of the home address."),
+    ("PAN Number", "ABCDE1234F", "Income tax PAN card number."),
+    ("Aadhar Number", "1234-5678-9012", "UIDAI identification number."),
+    ("Passport Number", "A1234567", "Indian passport number."),
+    ("Credit Card Number", "4111 1111 1111 1111", "HDFC Bank credit card."),
+    ("Debit Card Number", "5500 0000 0000 0004", "SBI debit card."),
+    ("Bank Account", "1234567890", "Canara Bank savings account."),
+    ("Salary Account", "9876543210", "HDFC Bank salary account."),
+    ("IFSC Code", "CNRB0001234", "IFSC of the Canara Bank branch."),
+]
+
+# Query -> attributes of the records that answer it.
+labelled_queries = {
+    "pan card number": {"PAN Number"},
+    "ABCDE1234F": {"PAN Number"},
+    "canara bank account number": {"Bank Account"},
+    "hdfc salary account": {"Salary Account"},
+    "sbi debit card": {"Debit Card Number"},
+    "hdfc credit card number": {"Credit Card Number"},
+    "work email": {"Work Email"},
+    "office phone number": {"Office Phone"},
+    "pin code": {"Postal Code"},
+    "uidai number": {"Aadhar Number"},
+    "ifsc of canara bank": {"IFSC Code"},
+    "residential address": {"Home Address"},
+}
+
+folder = tempfile.mkdtemp(prefix="securefill-hybrid-")
+try:
+    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
+    vault = VaultStore(os.path.join(folder, "vault"), embeddings)
+    vault.add_texts(
+        [f"Field: {a} | Value: {v} | Description: {d}" for a, v, d in records],
+        metadatas=[{"attribute": a, "value": v, "description": d} for a, v, d in records],
+    )
+    queries = list(labelled_queries)
+
+    for k in [1, 2, 3]:
+        line = [f"k={k}"]
+        for mode in ["vector", "bm25", "rrf", "weighted"]:
+            results = vault.search_with_ids_batch(queries, k=k, modes=mode)
+            precision = sum(
+                sum(doc.metadata["attribute"] in labelled_queries[query] for _, doc, _ in hits) / k
+                for query, hits in zip(queries, results)
+            ) / len(queries)
+            line.append(f"{mode} {precision:.2f}")
+        print(" | ".join(line))
+    vault.close()
+finally:
+    shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,49 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modelEngine.adaptiveRetrieval import elbow_cut, mmr_select, options_from_config, select_documents
+
+
+def hits(*distances):
+    return [(f"d{i}", None, distance) for i, distance in enumerate(distances)]
+
+
+def ids(selected):
+    return [doc_id for doc_id, _, _ in selected]
+
+
+def test_elbow_cut_stops_at_the_first_gap():
+    assert elbow_cut([0.1, 0.15, 0.6, 0.65], 0.2) == 2
+    assert elbow_cut([0.1, 0.2, 0.3], 0.2) == 3
+    assert elbow_cut([0.1, 0.9], None) == 2
+
+
+def test_threshold_and_gap_trim_the_hits():
+    selected = select_documents(hits(0.2, 0.25, 0.8, 1.5), max_k=4, gap=0.2, mmr=False)
+    assert ids(selected) == ["d0", "d1"]
+
+
+def test_min_k_keeps_a_field_with_only_distant_hits():
+    assert ids(select_documents(hits(1.6, 1.7), min_k=1, mmr=False)) == ["d0"]
+    assert select_documents([], min_k=1) == []
+
+
+def test_retrieval_order_is_kept():
+    selected = select_documents([("b", None, 0.3), ("a", None, 0.1), ("c", None, 0.9)], gap=0.5, mmr=False)
+    assert ids(selected) == ["b", "a"]
+
+
+def test_mmr_prefers_a_different_record_over_a_near_duplicate():
+    vectors = {"d0": [1.0, 0.0], "d1": [0.99, 0.01], "d2": [0.0, 1.0]}
+    candidates = hits(0.10, 0.11, 0.30)
+    assert ids(mmr_select(candidates, vectors, 2, mmr_lambda=0.5)) == ["d0", "d2"]
+    lookup = lambda doc_ids: {i: vectors[i] for i in doc_ids}
+    # The gap keeps two documents; MMR swaps the near-duplicate for the third one.
+    assert ids(select_documents(candidates, lookup, gap=0.15, mmr=False)) == ["d0", "d1"]
+    assert ids(select_documents(candidates, lookup, gap=0.15, mmr=True, mmr_lambda=0.5)) == ["d0", "d2"]
+
+
+def test_options_from_config_falls_back_to_defaults():
+    options = options_from_config({"retrieval_max_k": 6, "retrieval_mmr": False})
+    assert options["max_k"] == 6 and options["mmr"] is False and options["min_k"] == 1
@@ -0,0 +1,97 @@
+import json
+import secrets
+import socket
+import zlib
+
+import pytest
+
+import channel
+from channel import (CHUNK_BYTES, FLAG_DEFLATE, FLAG_MORE, HEADER, ChannelError, HostChannel, MessageAssembler, _Waiter,
+                     encode_frames, read_message)
+
+
+def frames_of(message, stream_id=1):
+    return [HEADER.unpack(frame[:HEADER.size]) + (frame[HEADER.size:],) for frame in encode_frames(message, stream_id)]
+
+
+def test_small_message_is_one_plain_frame():
+    [(length, flags, stream_id, body)] = frames_of({"type": "ping"}, 7)
+    assert (length, flags, stream_id) == (len(body), 0, 7)
+    assert json.loads(body) == {"type": "ping"}
+
+
+def test_large_message_is_compressed_and_split():
+    # Random hex only compresses to half, so the body still needs several frames.
+    message = {"type": "response", "id": 1, "payload": secrets.token_hex(2 * CHUNK_BYTES)}
+    frames = frames_of(message)
+    assert len(frames) > 1
+    assert all(flags & FLAG_DEFLATE for _, flags, _, _ in frames)
+    assert [bool(flags & FLAG_MORE) for _, flags, _, _ in frames] == [True] * (len(frames) - 1) + [False]
+    assert all(length <= CHUNK_BYTES for length, _, _, _ in frames)
+
+    assembler = MessageAssembler()
+    results = [assembler.feed(flags, stream_id, body) for _, flags, stream_id, body in frames]
+    assert results[:-1] == [None] * (len(frames) - 1)
+    assert results[-1] == message
+
+
+def test_interleaved_streams_are_reassembled_separately():
+    big = {"payload": secrets.token_hex(2 * CHUNK_BYTES)}
+    big_frames = frames_of(big, stream_id=1)
+    ping = frames_of({"type": "ping"}, stream_id=2)[0]
+    assembler = MessageAssembler()
+    received = []
+    for _, flags, stream_id, body in [big_frames[0], ping, *big_frames[1:]]:
+        message = assembler.feed(flags, stream_id, body)
+        if message is not None:
+            received.append(message)
+    assert received == [{"type": "ping"}, big]
+
+
+def test_read_message_over_a_socket():
+    left, right = socket.socketpair()
+    try:
+        for frame in encode_frames({"type": "request", "id": 3, "payload": "y" * 100_000}, 5):
+            left.sendall(frame)
+        left.close()
+        assembler = MessageAssembler()
+        assert read_message(right, assembler)["id"] == 3
+        assert read_message(right, assembler) is None
+    finally:
+        right.close()
+
+
+def test_oversized_frame_is_rejected():
+    left, right = socket.socketpair()
+    try:
+        left.sendall(HEADER.pack(CHUNK_BYTES + 1, 0, 1))
+        with pytest.raises(ChannelError):
+            read_message(right, MessageAssembler())
+    finally:
+        left.close()
+        right.close()
+
+
+def test_dropping_a_connection_fails_only_its_own_requests():
+    channel = HostChannel()
+    old, old_peer = socket.socketpair()
+    new, new_peer = socket.socketpair()
+    try:
+        channel._sock = old
+        on_old = channel._pending[1] = _Waiter(old)
+        on_new = channel._pending[2] = _Waiter(new)
+        channel._drop(old, "reset by peer")
+        assert on_old.event.is_set() and "reset by peer" in on_old.error
+        assert not on_new.event.is_set() and on_new.error is None
+        assert channel._sock is None
+    finally:
+        for sock in (old_peer, new, new_peer):
+            sock.close()
+
+
+def test_compression_bomb_is_rejected_without_inflating_it(monkeypatch):
+    monkeypatch.setattr(channel, "MAX_MESSAGE_BYTES", 64 * 1024)
+    body = zlib.compress(b"0" * (64 * 1024 * 1024), 9)
+    assert len(body) < CHUNK_BYTES
+    with pytest.raises(ChannelError):
+        MessageAssembler().feed(FLAG_DEFLATE, 1, body)
@@ -0,0 +1,29 @@
+from modelEngine.contextBuilder import build_context, collect_documents
+
+
+def field(*docs):
+    return {"matched_documents": [{"content": content, "score": score} for content, score in docs]}
+
+
+def test_shared_records_appear_once_with_their_best_score():
+    results = [field(("Email: a@b.c", 0.4), ("Phone: 98765", 0.9)),
+               field(("Email: a@b.c", 0.2)),
+               field(("Passport: A123", None))]
+    ranked = collect_documents(results)
+    assert [(doc["content"], doc["score"], doc["fields"]) for doc in ranked] == \
+        [("Passport: A123", None, 1), ("Email: a@b.c", 0.2, 2), ("Phone: 98765", 0.9, 1)]
+
+
+def test_ties_prefer_records_more_fields_share():
+    ranked = collect_documents([field(("A", 0.5)), field(("B", 0.5)), field(("B", 0.5))])
+    assert [doc["content"] for doc in ranked] == ["B", "A"]
+
+
+def test_context_is_cut_at_the_token_budget():
+    results = [field((f"Record {i}: " + "x" * 40, i / 10)) for i in range(10)]
+    context, stats = build_context(results, token_budget=30)
+    assert context.splitlines() == ["- Record 0: " + "x" * 40, "- Record 1: " + "x" * 40]
+    assert stats == {"matches": 10, "unique_documents": 10, "included_documents": 2, "tokens": 28}
+    # The best record is kept even when it alone is over budget.
+    assert build_context(results, token_budget=1)[1]["included_documents"] == 1
+    assert build_context(results, token_budget=None)[1]["included_documents"] == 10
@@ -0,0 +1,87 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("langchain_core")
+
+from modelEngine.embeddingCache import CachedEmbeddings, normalize_text
+
+
+class CountingEmbeddings:
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), float(sum(map(ord, text)))] for text in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_normalize_text_lower_cases_only_for_uncased_models():
+    assert normalize_text("  Email \n Address ") == "Email Address"
+    assert normalize_text("  Email \n Address ", uncased=True) == "email address"
+
+
+def test_hits_and_misses_are_counted():
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "all-MiniLM-L6-v2")
+    cache.embed_query("email address")
+    cache.embed_queries(["email address", "phone", "phone"])
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits_memory"], stats["hits_disk"]) == (2, 1, 0)
+    assert inner.embedded == ["email address", "phone"]
+
+
+def test_the_model_embeds_the_original_text():
+    inner = CountingEmbeddings()
+    uncased = CachedEmbeddings(inner, "sentence-transformers/all-MiniLM-L6-v2")
+    assert uncased.embed_query("Email  Address") == uncased.embed_query("email address")
+    assert inner.embedded == ["Email  Address"]
+
+    inner = CountingEmbeddings()
+    cased = CachedEmbeddings(inner, "some-cased-model")
+    cased.embed_queries(["Email", "email", "email "])
+    assert inner.embedded == ["Email", "email"]
+
+
+def test_documents_bypass_the_cache():
+    inner = CountingEmbeddings()
+    cache = CachedEmbeddings(inner, "all-MiniLM-L6-v2", max_entries=1)
+    cache.embed_query("email")
+    cache.embed_documents(["a record", "another record"])
+    assert cache.stats()["memory_entries"] == 1
+    cache.embed_query("email")
+    assert inner.embedded == ["email", "a record", "another record"]
+    assert cache.stats()["hits_memory"] == 1
+
+
+def test_disk_tier_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "embedding_cache.sqlite")
+    first = CachedEmbeddings(CountingEmbeddings(), "all-MiniLM-L6-v2", disk_path=path)
+    vector = first.embed_query("email")
+    first.close()
+
+    inner = CountingEmbeddings()
+    reopened = CachedEmbeddings(inner, "all-MiniLM-L6-v2", disk_path=path)
+    assert reopened.embed_query("email") == vector
+    assert reopened.stats()["hits_disk"] == 1
+    assert inner.embedded == []
+    reopened.close()
+
+
+def test_disk_tier_is_cleared_when_the_model_changes(tmp_path):
+    path = str(tmp_path / "embedding_cache.sqlite")
+    first = CachedEmbeddings(CountingEmbeddings(), "all-MiniLM-L6-v2", disk_path=path)
+    first.embed_query("email")
+    first.close()
+
+    CachedEmbeddings(CountingEmbeddings(), "all-mpnet-base-v2", disk_path=path).close()
+
+    # Switching back finds the store cleared instead of the old model's vectors.
+    inner = CountingEmbeddings()
+    again = CachedEmbeddings(inner, "all-MiniLM-L6-v2", disk_path=path)
+    again.embed_query("email")
+    assert again.stats()["misses"] == 1
+    assert inner.embedded == ["email"]
+    again.close()
@@ -0,0 +1,103 @@
+import pytest
+
+engine_module = pytest.importorskip("modelEngine.engine")
+
+from modelEngine import parser
+from modelEngine.htmlFields import extract_fields, field_handle
+from modelEngine.planCache import PlanCache
+from modelEngine.scanDelta import ScanSession
+
+
+def field(handle, name, known=()):
+    fp = f"fp-{handle}-{name}"
+    html = f'<label>{name}<input name="{name}" data-securefill-handle="{handle}"></label>'
+    return {"fp": fp, "handle": handle} if fp in known else {"fp": fp, "handle": handle, "html": html}
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    calls = {"analysed": [], "planned": []}
+
+    def analyze(chain, html_fields, user_prompt, **options):
+        calls["analysed"].append([field_handle(f) for snippet in html_fields for f in extract_fields(snippet)])
+        return [{"handle": field_handle(f), "description": f["attrs"]["name"], "search_query": f["attrs"]["name"],
+                 "section": section}
+                for section, snippet in enumerate(html_fields) for f in extract_fields(snippet)]
+
+    def search(vectorstore, analysis_plan, **options):
+        return [dict(item, search_results=[f"my {item['description']}"]) for item in analysis_plan]
+
+    def generate(chain, search_results, user_prompt, **options):
+        calls["planned"].append([item["handle"] for item in search_results])
+        return [{"handle": item["handle"], "action_type": "FILL_TEXT", "value": item["search_results"][0]}
+                for item in search_results]
+
+    monkeypatch.setattr(parser, "analyze_form_and_create_search_plan", analyze)
+    monkeypatch.setattr(parser, "search_vector_db", search)
+    monkeypatch.setattr(parser, "generate_action_plan", generate)
+
+    filler = engine_module.FormFillerEngine()
+    filler.config = {"sharded_action_plan": False}
+    filler._vault_version = "v1"
+    filler._refresh_vault = lambda: None
+    filler._ready.set()
+    filler.calls = calls
+    return filler
+
+
+def test_only_new_fields_are_analysed(engine):
+    session = ScanSession()
+    plan = engine.fill_incremental([field("f1", "email"), field("f2", "phone")], "fill", session)
+    assert [action["handle"] for action in plan] == ["f1", "f2"]
+
+    step_two = [field("f1", "email", session.known()), field("f2", "phone", session.known()), field("f3", "city")]
+    plan = engine.fill_incremental(step_two, "fill", session)
+    assert engine.calls["analysed"] == [["f1", "f2"], ["f3"]]
+    assert plan == [{"handle": "f3", "action_type": "FILL_TEXT", "value": "my city"}]
+
+
+def test_unchanged_page_reuses_the_stored_results(engine):
+    session = ScanSession()
+    scan = [field("f1", "email"), field("f2", "phone")]
+    first = engine.fill_incremental(scan, "fill", session)
+    again = engine.fill_incremental([field("f1", "email", session.known()), field("f2", "phone", session.known())],
+                                    "fill", session)
+    assert again == first
+    assert engine.calls["analysed"] == [["f1", "f2"]]
+    assert engine.calls["planned"] == [["f1", "f2"], ["f1", "f2"]]
+
+    # A new prompt (or vault) drops the stored results, so the page is analysed again.
+    engine.fill_incremental([field("f1", "email", session.known()), field("f2", "phone", session.known())],
+                            "use my work details", session)
+    assert engine.calls["analysed"] == [["f1", "f2"], ["f1", "f2"]]
+
+
+def test_changed_field_is_analysed_again(engine):
+    session = ScanSession()
+    engine.fill_incremental([field("f1", "email"), field("f2", "phone")], "fill", session)
+    plan = engine.fill_incremental([field("f1", "email", session.known()), field("f2", "mobile")], "fill", session)
+    assert engine.calls["analysed"] == [["f1", "f2"], ["f2"]]
+    assert plan == [{"handle": "f2", "action_type": "FILL_TEXT", "value": "my mobile"}]
+
+
+def test_cache_replayed_fields_stay_new(engine, tmp_path):
+    engine.plan_cache = PlanCache(str(tmp_path / "plan_cache.json"))
+    scan = [field("f1", "email")]
+    engine.fill_incremental(scan, "fill", ScanSession())
+
+    # Another session replays the cached plan, which has no search results to store...
+    session = ScanSession()
+    assert engine.fill_incremental(scan, "fill", session) == [{"handle": "f1", "action_type": "FILL_TEXT",
+                                                               "value": "my email"}]
+    assert engine.calls["analysed"] == [["f1"]]
+    assert session.begin("fill", "v1") == set()
+    # ...so its fields are still new on the next scan and replayed again.
+    engine.fill_incremental([field("f1", "email", session.known())], "fill", session)
+    assert engine.calls["analysed"] == [["f1"]]
+    assert engine.calls["planned"] == [["f1"]]
+
+
+def test_fill_waits_for_the_engine(engine):
+    engine._ready.clear()
+    with pytest.raises(Exception, match="not ready"):
+        engine.fill_incremental([field("f1", "email")], "fill", ScanSession())
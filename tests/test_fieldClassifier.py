@@ -0,0 +1,51 @@
+import pytest
+
+from modelEngine.fieldClassifier import classify_field, classify_fields
+from modelEngine.htmlFields import extract_fields
+
+
+def classify(html):
+    return classify_field(extract_fields(html)[0])
+
+
+@pytest.mark.parametrize("html, query", [
+    ('<input autocomplete="given-name" name="x1">', "first name"),
+    ('<input autocomplete="shipping postal-code">', "postal code"),
+    ('<input name="userEmail">', "email address"),
+    ('<input id="mobile_no">', "mobile number"),
+    ('<input name="pin-code">', "postal code"),
+    ('<input name="aadhaarNumber">', "aadhar number"),
+    ('<input type="tel" name="q7">', "mobile number"),
+])
+def test_unambiguous_fields_are_resolved(html, query):
+    assert classify(html)[1] == query
+
+
+@pytest.mark.parametrize("html", [
+    '<input name="name">',
+    '<input name="pin">',
+    '<input name="uid">',
+    '<input name="title">',
+    '<input name="q7">',
+    '<select name="q8"><option>A</option></select>',
+])
+def test_ambiguous_fields_are_left_to_the_llm(html):
+    assert classify(html) is None
+
+
+def test_autocomplete_resolves_an_ambiguous_name():
+    assert classify('<input name="name" autocomplete="name">')[1] == "full name"
+
+
+def test_snippet_is_resolved_only_if_every_field_is():
+    resolved = '<div><input name="email" data-securefill-handle="f1"><input type="submit"></div>'
+    mixed = '<div><input name="email" data-securefill-handle="f2"><input name="q9" data-securefill-handle="f3"></div>'
+    items, unresolved, stats = classify_fields([resolved, mixed])
+    assert [(item["handle"], item["section"], item["search_query"]) for item in items] == [("f1", 0, "email address")]
+    assert unresolved == [mixed]
+    assert (stats["fields"], stats["resolved_fields"], stats["snippets_sent_to_llm"]) == (3, 2, 1)
+
+
+def test_profile_words_in_the_prompt_tailor_contact_queries():
+    items, _, _ = classify_fields(['<input name="email" data-securefill-handle="f1">'], "use my office details")
+    assert items[0]["search_query"] == "work email address"
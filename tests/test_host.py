@@ -0,0 +1,96 @@
+import asyncio
+import base64
+import logging
+import secrets
+import zlib
+
+import pytest
+
+# host.py logs to host_log.log in the working directory unless logging is already set up.
+logging.getLogger().addHandler(logging.NullHandler())
+
+import host  # noqa: E402
+
+
+def test_small_native_message_is_sent_as_is():
+    message = {"command": "scan_page", "request_id": 1}
+    assert host.native_messages(message, 1) == [message]
+
+
+def test_chunked_native_message_round_trip():
+    message = {"command": "execute_action_plan", "plan": [{"handle": f"f{i}", "value": secrets.token_hex(64)}
+                                                          for i in range(10000)]}
+    chunks = host.native_messages(message, 9)
+    assert len(chunks) > 1
+    assert all(len(chunk["chunk"]["data"]) < 1024 * 1024 for chunk in chunks)
+
+    assembler = host.NativeChunkAssembler()
+    results = [assembler.feed(chunk["chunk"]) for chunk in chunks]
+    assert results[:-1] == [None] * (len(chunks) - 1)
+    assert results[-1] == message
+    assert assembler.messages == {}
+
+
+def test_chunks_of_different_messages_interleave():
+    first = host.native_messages({"data": secrets.token_hex(2 * host.NATIVE_CHUNK_BYTES)}, 1)
+    second = host.native_messages({"data": secrets.token_hex(2 * host.NATIVE_CHUNK_BYTES)}, 2)
+    assembler = host.NativeChunkAssembler()
+    done = [assembler.feed(chunk["chunk"]) for pair in zip(first, second) for chunk in pair]
+    done += [assembler.feed(chunk["chunk"]) for chunk in first[len(second):] + second[len(first):]]
+    assert len([message for message in done if message is not None]) == 2
+
+
+def test_oversized_chunked_message_is_dropped(monkeypatch):
+    monkeypatch.setattr(host, "MAX_MESSAGE_BYTES", 1000)
+    chunks = host.native_messages({"data": secrets.token_hex(host.NATIVE_INLINE_BYTES)}, 3)
+    assembler = host.NativeChunkAssembler()
+    with pytest.raises(ValueError):
+        for chunk in chunks:
+            assembler.feed(chunk["chunk"])
+    assert assembler.messages == {}
+
+
+def test_compressed_chunk_is_inflated_only_up_to_the_limit(monkeypatch):
+    monkeypatch.setattr(host, "MAX_MESSAGE_BYTES", 64 * 1024)
+    data = base64.b64encode(zlib.compress(b"0" * (64 * 1024 * 1024), 9)).decode("ascii")
+    assembler = host.NativeChunkAssembler()
+    with pytest.raises(ValueError):
+        assembler.feed({"id": 1, "encoding": "deflate", "data": data, "last": True})
+    assert assembler.messages == {}
+
+
+class FakeSession:
+    def __init__(self):
+        self.responses = []
+
+    def respond(self, request_id, payload=None, error=None):
+        self.responses.append((request_id, payload, error))
+
+
+def test_scan_results_are_matched_by_id_and_unanswered_scans_expire(monkeypatch):
+    monkeypatch.setattr(host, "SCAN_TIMEOUT", 0.05)
+
+    async def scenario():
+        native_host = host.NativeHost()
+        native_host.stdout_queue = asyncio.Queue()
+        session = FakeSession()
+        for request_id in (11, 12, 13):
+            await native_host.handle_request(session, {"id": request_id, "command": "scan", "payload": {"known": []}})
+        native_host.complete_scan(None, [{"fp": "a", "handle": "f1", "html": "<input name='a'>"}])
+        native_host.complete_scan(2, [{"fp": "a", "handle": "f1", "html": "<input name='a'>"}])
+        native_host.complete_scan(3, [], error="No active tab found to scan.")
+        await asyncio.sleep(0.1)
+        return native_host, session
+
+    native_host, session = asyncio.run(scenario())
+    assert [(request_id, error is None) for request_id, _, error in session.responses] == \
+        [(12, True), (13, False), (11, False)]
+    assert session.responses[0][1]["fields"][0]["html"] == "<input name='a'>"
+    assert native_host.pending_scans == {}
+
+
+def test_scan_delta_leaves_out_known_html_and_duplicates():
+    data = [{"fp": "a", "handle": "f1", "html": "<input name='a'>"}, {"fp": "b", "handle": "f2", "html": "<select>"},
+            {"fp": "a", "handle": "f1", "html": "<input name='a'>"}, {"handle": "f3", "html": "<input>"}, "<input>"]
+    assert host.scan_delta(data, {"b"}) == [{"fp": "a", "handle": "f1", "html": "<input name='a'>"},
+                                            {"fp": "b", "handle": "f2"}]
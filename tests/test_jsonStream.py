@@ -0,0 +1,48 @@
+from modelEngine.jsonStream import IncrementalJSONArrayParser
+
+PLAN = ('Here is the plan:\n```json\n[{"handle": "f1", "action_type": "FILL_TEXT", "value": "a \\"quoted\\" ]} value"},\n'
+        ' {"handle": "f2", "action_type": "SELECT_DROPDOWN", "value": "IN", "extra": {"nested": [1, 2]}}]\n```\nDone.')
+
+
+def parse_in_chunks(text, size):
+    parser = IncrementalJSONArrayParser()
+    elements = []
+    for start in range(0, len(text), size):
+        elements.extend(parser.feed(text[start:start + size]))
+    return parser, elements
+
+
+def test_elements_are_the_same_for_any_chunking():
+    expected = [
+        {"handle": "f1", "action_type": "FILL_TEXT", "value": 'a "quoted" ]} value'},
+        {"handle": "f2", "action_type": "SELECT_DROPDOWN", "value": "IN", "extra": {"nested": [1, 2]}},
+    ]
+    for size in (1, 2, 7, len(PLAN)):
+        parser, elements = parse_in_chunks(PLAN, size)
+        assert elements == expected
+        assert parser.finished
+
+
+def test_each_element_is_returned_once_it_closes():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"handle": "f1", "value"') == []
+    assert parser.feed(': 1}, {"handle"') == [{"handle": "f1", "value": 1}]
+    assert not parser.finished
+
+
+def test_text_after_the_array_is_ignored():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('[{"a": 1}] [{"b": 2}]') == [{"a": 1}]
+    assert parser.finished
+    assert parser.feed('{"c": 3}') == []
+
+
+def test_malformed_elements_are_skipped():
+    _, elements = parse_in_chunks('[{"a": 1,}, {"b": 2}]', 3)
+    assert elements == [{"b": 2}]
+
+
+def test_buffer_stays_bounded_between_elements():
+    parser = IncrementalJSONArrayParser()
+    parser.feed("[" + '{"a": 1}, ' * 1000)
+    assert len(parser._buffer) < 16
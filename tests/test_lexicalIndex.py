@@ -0,0 +1,59 @@
+import sqlite3
+
+import pytest
+
+from modelEngine.lexicalIndex import (SCHEMA, bm25_search, index_documents, reciprocal_rank_fusion, remove_documents,
+                                      tokenize, weighted_fusion)
+
+DOCS = [
+    ("pan", "Field: PAN Number | Value: ABCDE1234F"),
+    ("passport", "Field: Passport Number | Value: A1234567"),
+    ("email", "Field: Email Address | Value: john@example.com"),
+    ("work-email", "Field: Work Email | Value: john@company.com"),
+]
+
+
+@pytest.fixture
+def db():
+    connection = sqlite3.connect(":memory:")
+    connection.executescript("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);" + SCHEMA)
+    index_documents(connection, DOCS)
+    return connection
+
+
+def test_tokenize_drops_stopwords_and_punctuation():
+    assert tokenize("Field: My PAN-number | Value: X1") == ["pan", "number", "x1"]
+
+
+def test_bm25_ranks_the_matching_record_first(db):
+    assert bm25_search(db, "pan number", k=1)[0][0] == "pan"
+    assert [doc_id for doc_id, _ in bm25_search(db, "work email")][:2] == ["work-email", "email"]
+    assert bm25_search(db, "the of") == []
+
+
+def test_bm25_respects_allowed_ids(db):
+    assert [doc_id for doc_id, _ in bm25_search(db, "email", allowed={"email"})] == ["email"]
+
+
+def test_reindex_and_remove_keep_totals_consistent(db):
+    index_documents(db, [("pan", "Field: PAN Number | Value: ZZZZZ9999Z")])
+    assert bm25_search(db, "abcde1234f") == []
+    assert bm25_search(db, "zzzzz9999z")[0][0] == "pan"
+    remove_documents(db, ["pan", "passport", "missing"])
+    meta = dict(db.execute("SELECT key, value FROM meta"))
+    assert meta["bm25_docs"] == "2"
+    assert int(meta["bm25_length"]) == sum(length for (length,) in db.execute("SELECT length FROM doc_lengths"))
+    assert bm25_search(db, "number") == []
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]])[0] == "b"
+    assert reciprocal_rank_fusion([["a"], []]) == ["a"]
+
+
+def test_weighted_fusion_normalizes_each_side():
+    vector = [("a", 0.1), ("b", 0.5), ("c", 0.9)]  # distances: lower is better
+    lexical = [("c", 12.0), ("b", 6.0), ("a", 0.0)]  # BM25 scores: higher is better
+    assert weighted_fusion(vector, lexical, alpha=1.0)[0] == "a"
+    assert weighted_fusion(vector, lexical, alpha=0.0)[0] == "c"
+    assert weighted_fusion(vector, [("d", 3.0)], alpha=0.5) == ["a", "d", "b", "c"]
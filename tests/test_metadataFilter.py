@@ -0,0 +1,37 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modelEngine.metadataFilter import RowBitmaps, filters_from_prompt, freeze_filters
+
+
+def test_freeze_filters_normalizes_and_drops_unknown_fields():
+    assert freeze_filters({"label": ["Work", "work", ""], "category": "Contact", "other": "x"}) == \
+        (("category", ("contact",)), ("label", ("work",)))
+    assert freeze_filters({"label": []}) is None
+    assert freeze_filters(None) is None
+
+
+def test_filters_from_prompt_uses_vault_labels_and_profile_words():
+    assert filters_from_prompt("use my office details", ["work", "personal"]) == {"label": ["work"]}
+    assert filters_from_prompt("work or personal", ["work", "personal"]) == {"label": ["work", "personal"]}
+    assert filters_from_prompt("use my office details", ["personal"]) is None
+
+
+def test_masks_or_values_within_a_field_and_and_across_fields():
+    bitmaps = RowBitmaps(4)
+    bitmaps.set([(0, "contact", "work"), (1, "contact", "personal"), (2, "address", "work"), (3, "address", "")])
+    assert bitmaps.values("label") == ["personal", "work"]
+    assert bitmaps.mask((("label", ("work",)),)).tolist() == [True, False, True, False]
+    assert bitmaps.mask((("label", ("personal", "work")),)).tolist() == [True, True, True, False]
+    assert bitmaps.mask((("category", ("contact",)), ("label", ("work",)))).tolist() == [True, False, False, False]
+    assert not bitmaps.mask((("label", ("unknown",)),)).any()
+
+
+def test_masks_grow_with_new_rows():
+    bitmaps = RowBitmaps(2)
+    bitmaps.set([(0, "contact", "work")])
+    bitmaps.set([(4, "contact", "work")], rows=5)
+    assert bitmaps.mask((("label", ("work",)),)).tolist() == [True, False, False, False, True]
+    bitmaps.set([(5, "contact", "")], rows=6)
+    assert len(bitmaps.mask((("category", ("contact",)),))) == 6
@@ -0,0 +1,72 @@
+import json
+import re
+
+import pytest
+
+parser = pytest.importorskip("modelEngine.parser")
+
+
+def test_search_without_a_vault_finds_nothing():
+    plan = parser.search_vector_db(None, [{"handle": "f1", "search_query": "email address"}, {"handle": "f2"}])
+    assert [item["matched_documents"] for item in plan] == [[], []]
+
+
+def plan_item(n, section=None):
+    return {"handle": f"f{n}", "description": f"field {n}", "section": n if section is None else section,
+            "original_html": f'<input name="field{n}" data-securefill-handle="f{n}">',
+            "matched_documents": [{"content": f"Field: field {n} | Value: value {n}", "score": 0.1}]}
+
+
+class ShardChain:
+    """Answers every shard with a fill action per field, finishing the shards in reverse."""
+
+    def __init__(self, failing=(), extra=None):
+        self.failing = failing
+        self.extra = extra or {}
+        self.calls = []
+
+    def batch_as_completed(self, inputs, config=None, return_exceptions=False):
+        self.calls.append((len(inputs), config))
+        for position in reversed(range(len(inputs))):
+            if position in self.failing:
+                yield position, RuntimeError("model server went away")
+                continue
+            handles = sorted(set(re.findall(r"f\d+", inputs[position]["fields"])), key=lambda h: int(h[1:]))
+            actions = [{"handle": h, "action_type": "FILL_TEXT", "value": f"value {h[1:]}"} for h in handles]
+            yield position, json.dumps(actions + self.extra.get(position, []))
+
+
+def test_sharded_plan_keeps_shard_order_and_reports_actions_as_they_finish():
+    chain = ShardChain(extra={0: [{"handle": "f5", "action_type": "FILL_TEXT", "value": "duplicate"}]})
+    delivered = []
+    plan = parser.generate_action_plan_sharded(chain, [plan_item(n) for n in range(1, 7)], "fill", shard_size=2,
+                                               max_concurrency=3, on_action=delivered.append)
+    assert chain.calls == [(3, {"max_concurrency": 3})]
+    assert [action["handle"] for action in delivered] == ["f5", "f6", "f3", "f4", "f1", "f2"]
+    # The last shard finished first, so its f5 wins over the duplicate from the first shard.
+    assert [action["handle"] for action in plan] == ["f1", "f2", "f3", "f4", "f5", "f6"]
+    assert sorted(plan, key=lambda action: action["handle"]) == sorted(delivered, key=lambda action: action["handle"])
+    assert all(action["value"] != "duplicate" for action in plan)
+
+
+def test_failed_shard_is_skipped():
+    plan = parser.generate_action_plan_sharded(ShardChain(failing={1}), [plan_item(n) for n in range(1, 7)], "fill",
+                                               shard_size=2)
+    assert [action["handle"] for action in plan] == ["f1", "f2", "f5", "f6"]
+
+
+def test_fields_of_one_section_share_a_shard():
+    items = [plan_item(1, 0), plan_item(2, 1), plan_item(3, 1), plan_item(4, 2)]
+    shards = parser.shard_search_results(items, 2)
+    assert [[item["handle"] for item in shard] for shard in shards] == [["f1"], ["f2", "f3"], ["f4"]]
+
+
+def test_attach_fields_fills_in_html_and_drops_unknown_handles():
+    snippets = ['<label>Email<input name="email" data-securefill-handle="f1"></label>',
+                '<select name="country" data-securefill-handle="f2"><option value="IN">India</option></select>']
+    items = [{"handle": "f2", "description": "country"}, {"handle": "f9", "description": "made up"},
+             {"description": "no handle"}, "not an item", {"handle": "f1", "description": "email"}]
+    attached = parser.attach_fields(items, snippets)
+    assert [(item["handle"], item["section"]) for item in attached] == [("f2", 1), ("f1", 0)]
+    assert 'data-securefill-handle="f1"' in attached[1]["original_html"]
+    assert '<option value="IN">India</option>' in attached[0]["original_html"]
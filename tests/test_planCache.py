@@ -0,0 +1,63 @@
+import json
+
+from modelEngine.planCache import PlanCache, form_fingerprint, form_handles, remap_handles
+
+FORM = ('<form><label for="e">Email</label><input id="e" name="email" type="email" data-securefill-handle="f1">'
+        '<select name="country" data-securefill-handle="f2"><option value="IN">India</option></select></form>')
+
+
+def test_key_ignores_values_whitespace_and_styling():
+    restyled = FORM.replace('type="email"', 'type="email" class="big" value="a@b.c" style="color:red"')
+    assert PlanCache.make_key([FORM], "Fill it") == PlanCache.make_key(["  " + restyled + "\n"], "  fill   IT ")
+
+
+def test_key_ignores_handles():
+    renumbered = FORM.replace('"f1"', '"fk3-8"').replace('"f2"', '"fk3-9"')
+    assert form_fingerprint([FORM]) == form_fingerprint([renumbered])
+
+
+def test_key_changes_with_structure_and_prompt():
+    assert PlanCache.make_key([FORM], "fill") != PlanCache.make_key([FORM.replace('name="email"', 'name="mail"')], "fill")
+    assert PlanCache.make_key([FORM], "fill") != PlanCache.make_key([FORM.replace("IN", "US")], "fill")
+    assert PlanCache.make_key([FORM], "fill") != PlanCache.make_key([FORM], "use my work email")
+
+
+def test_snippets_without_controls_are_told_apart():
+    assert form_fingerprint(["<p>Terms</p>"]) != form_fingerprint(["<p>Privacy</p>"])
+    assert form_fingerprint(["<p>Terms</p>"]) == form_fingerprint([" <p>Terms</p>\n"])
+    assert form_fingerprint([{"a": 1}]) != form_fingerprint([{"a": 2}])
+
+
+def test_remap_handles_by_position():
+    cached = [{"handle": "f2", "action_type": "SELECT_DROPDOWN", "value": "IN"}, {"handle": "f9", "value": "x"}]
+    renumbered = FORM.replace('"f1"', '"f31"').replace('"f2"', '"f32"')
+    remapped = remap_handles(cached, form_handles([FORM]), form_handles([renumbered]))
+    assert remapped == [{"handle": "f32", "action_type": "SELECT_DROPDOWN", "value": "IN"}]
+
+
+def test_get_expires_on_vault_change_and_persists_last_used(tmp_path):
+    path = str(tmp_path / "plan_cache.json")
+    cache = PlanCache(path)
+    cache.put("k", "v1", [], [{"handle": "f1"}], ["f1"])
+    with open(path, encoding="utf-8") as file:
+        created = json.load(file)["k"]["created"]
+    assert cache.get("k", "v1")["action_plan"] == [{"handle": "f1"}]
+    # A hit changes last_used in memory only, until the cache is flushed.
+    with open(path, encoding="utf-8") as file:
+        assert json.load(file)["k"]["last_used"] == created
+    cache.flush()
+    with open(path, encoding="utf-8") as file:
+        assert json.load(file)["k"]["last_used"] == cache._entries["k"]["last_used"]
+    assert cache.get("k", "v2") is None
+    assert PlanCache(path).get("k", "v1") is None
+    assert cache.stats() == {"entries": 0, "hits": 1, "misses": 1}
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = PlanCache(str(tmp_path / "plan_cache.json"), max_entries=2)
+    cache.put("a", "v", [], [], [])
+    cache.put("b", "v", [], [], [])
+    cache._entries["a"]["last_used"] += 10
+    cache.put("c", "v", [], [], [])
+    assert cache.get("b", "v") is None
+    assert cache.get("a", "v") is not None
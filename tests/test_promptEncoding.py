@@ -0,0 +1,44 @@
+import json
+
+from modelEngine.promptEncoding import encode_html, encode_plan_fields, encode_snippets
+
+COUNTRIES = "".join(f'<option value="C{i}">Country {i}</option>' for i in range(40))
+SELECT = (f'<label>Country<select name="country" class="x" style="width:9em" data-securefill-handle="f2">'
+          f'{COUNTRIES}<option value="IN">India</option></select></label>')
+EMAIL = ('<div class="row"><label for="e">Email address</label>'
+         '<input id="e" name="email" type="email" value="old@x.y" data-securefill-handle="f1"></div>')
+
+
+def test_field_keeps_its_handle_and_drops_styling_and_typed_values():
+    assert encode_html(EMAIL) == {"handle": "f1", "tag": "input", "id": "e", "name": "email", "type": "email",
+                                  "label": "Email address"}
+    assert encode_html("<p>Terms apply</p>") == "<p>Terms apply</p>"
+
+
+def test_generous_budget_keeps_twenty_options():
+    text, stats = encode_snippets([EMAIL, SELECT], token_budget=10_000)
+    email, select = json.loads(text)
+    assert len(select["options"]) == 21 and select["options"][-1] == "...+21 more"
+    assert stats["budget_level"] == 0 and not stats["over_budget"]
+    assert stats["encoded_tokens"] < stats["original_tokens"]
+
+
+def test_tight_budget_drops_options_but_never_handles():
+    text, stats = encode_snippets([EMAIL, SELECT], token_budget=40)
+    email, select = json.loads(text)
+    assert stats["budget_level"] == 3
+    assert select["options"] == ["...+41 more"]
+    assert (email["handle"], select["handle"]) == ("f1", "f2")
+    assert "label" in email and len(email["label"]) <= 24
+
+
+def test_plan_fields_keep_the_options_the_context_names():
+    item = {"original_html": SELECT, "description": "country of residence",
+            "matched_documents": [{"content": "Field: Country | Value: India"}]}
+    text, _ = encode_plan_fields([item], token_budget=10_000)
+    assert len(json.loads(text)[0]["field"]["options"]) == 41
+
+    text, stats = encode_plan_fields([item], token_budget=60)
+    options = json.loads(text)[0]["field"]["options"]
+    assert stats["budget_level"] > 0
+    assert "IN=India" in options and len(options) < 41
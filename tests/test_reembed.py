@@ -0,0 +1,87 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modelEngine import reembed
+from modelEngine.vaultStore import EmbeddingModelMismatch, VaultStore
+from test_vaultStore import HashEmbeddings
+
+RECORDS = [f"Field: record {i} | Value: value {i}" for i in range(5)]
+
+
+class OtherEmbeddings(HashEmbeddings):
+    """A different "model": reversed hash vectors, recording every text it embeds."""
+    model_name = "other-model"
+
+    def __init__(self, embedded, fail_on=None):
+        self.embedded = embedded
+        self.fail_on = fail_on
+
+    def embed_documents(self, texts):
+        if self.fail_on and self.fail_on in texts:
+            raise RuntimeError("worker crashed")
+        self.embedded.extend(texts)
+        return [vector[::-1] for vector in super().embed_documents(texts)]
+
+
+@pytest.fixture
+def vault(tmp_path, monkeypatch):
+    folder = str(tmp_path / "vault")
+    store = VaultStore(folder, HashEmbeddings())
+    ids = store.add_texts(RECORDS)
+    store.close()
+    # Workers run as threads here, so the fake model needs no separate process.
+    monkeypatch.setattr(reembed, "ProcessPoolExecutor", ThreadPoolExecutor)
+    return folder, ids
+
+
+def use_model(monkeypatch, embedded, fail_on=None):
+    monkeypatch.setattr(reembed, "_load_embeddings", lambda model_name, normalize: OtherEmbeddings(embedded, fail_on))
+
+
+def test_reembedded_vault_opens_only_with_the_new_model(vault, monkeypatch):
+    folder, ids = vault
+    embedded = []
+    use_model(monkeypatch, embedded)
+    reembed.ReembedJob(folder, "other-model", batch_size=2, workers=2).run()
+
+    assert sorted(embedded) == sorted(RECORDS)
+    assert not os.path.exists(folder + ".reembed")
+    with pytest.raises(EmbeddingModelMismatch):
+        VaultStore(folder, HashEmbeddings(), read_only=True)
+    store = VaultStore(folder, OtherEmbeddings([]), read_only=True)
+    try:
+        assert store.manifest()["embedding_model"] == "other-model"
+        assert store.search_with_ids_batch([RECORDS[3]], k=1)[0][0][0] == ids[3]
+    finally:
+        store.close()
+
+
+def test_interrupted_job_resumes_and_reembeds_edited_records(vault, monkeypatch):
+    folder, ids = vault
+    embedded = []
+    use_model(monkeypatch, embedded, fail_on=RECORDS[2])
+    with pytest.raises(RuntimeError):
+        reembed.ReembedJob(folder, "other-model", batch_size=2, workers=1).run()
+    assert RECORDS[0] in embedded and os.path.exists(os.path.join(folder + ".reembed", "batch-000000.npz"))
+
+    # An edit after its batch was staged makes the staged vector stale.
+    store = VaultStore(folder, HashEmbeddings())
+    store.update(ids[0], "Field: record 0 | Value: changed")
+    store.close()
+
+    embedded.clear()
+    use_model(monkeypatch, embedded)
+    reembed.ReembedJob(folder, "other-model", batch_size=2, workers=1).run()
+    assert RECORDS[0] not in embedded and RECORDS[1] not in embedded
+    assert "Field: record 0 | Value: changed" in embedded and RECORDS[2] in embedded
+
+    store = VaultStore(folder, OtherEmbeddings([]), read_only=True)
+    try:
+        assert store.get(ids[0]).page_content == "Field: record 0 | Value: changed"
+        assert store.rows == len(RECORDS)
+    finally:
+        store.close()
@@ -0,0 +1,79 @@
+import time
+
+from modelEngine.scanDelta import ScanSession
+
+
+def scan(session, *fields, known=()):
+    return session.apply_scan([{"fp": fp, "handle": handle} if fp in known else {"fp": fp, "handle": handle, "html": html}
+                               for fp, handle, html in fields])
+
+
+def test_known_fields_arrive_without_html():
+    session = ScanSession()
+    assert scan(session, ("a", "f1", "<input name=a>"), ("b", "f2", "<input name=b>")) == \
+        [("a", "f1", "<input name=a>"), ("b", "f2", "<input name=b>")]
+    assert sorted(session.known()) == ["a", "b"]
+    assert scan(session, ("b", "f2", None), ("c", "f3", "<input name=c>"), known={"b"}) == \
+        [("b", "f2", "<input name=b>"), ("c", "f3", "<input name=c>")]
+    # A bare fingerprint the session no longer holds is dropped.
+    assert session.apply_scan([{"fp": "gone", "handle": "f9"}]) == []
+
+
+def test_results_are_stored_per_handle():
+    session = ScanSession()
+    scanned = scan(session, ("a", "f1", "<input name=a>"), ("b", "f2", "<input name=b>"))
+    assert session.begin("fill it", "v1") == set()
+    session.record(scanned, [{"handle": "f1"}, {"handle": "f2", "n": 1}, {"handle": "f2", "n": 2}, {"handle": "f7"}])
+    assert session.begin("Fill  it", "v1") == {"a", "b"}
+    assert session.results_for(scanned[::-1]) == [{"handle": "f2", "n": 1}, {"handle": "f2", "n": 2}, {"handle": "f1"}]
+    assert session.results_for(scanned + scan(session, ("c", "f3", "<input name=c>"))) is None
+
+
+def test_changed_field_html_drops_its_results():
+    session = ScanSession()
+    scanned = scan(session, ("a", "f1", "<input name=a>"))
+    session.begin("fill", "v1")
+    session.record(scanned, [{"handle": "f1"}])
+    changed = scan(session, ("a2", "f1", "<input name=a2>"))
+    assert session.begin("fill", "v1") == {"a"}
+    assert session.results_for(changed) is None
+    session.record(changed, [{"handle": "f1", "new": True}])
+    assert session.begin("fill", "v1") == {"a2"}
+    assert session.results_for(changed) == [{"handle": "f1", "new": True}]
+
+
+def test_fields_without_results_still_count_as_analysed():
+    session = ScanSession()
+    scanned = scan(session, ("a", "f1", "<input type=submit>"))
+    session.begin("fill", "v1")
+    session.record(scanned, [])
+    assert session.results_for(scanned) == []
+
+
+def test_new_prompt_or_vault_drops_results_but_keeps_html():
+    session = ScanSession()
+    scanned = scan(session, ("a", "f1", "<input name=a>"))
+    session.begin("fill", "v1")
+    session.record(scanned, [{"handle": "f1"}])
+    assert session.begin("fill", "v2") == set()
+    assert session.results_for(scanned) is None
+    assert session.known() == ["a"]
+
+
+def test_idle_session_starts_over():
+    session = ScanSession(idle_seconds=0.01)
+    scan(session, ("a", "f1", "<input name=a>"))
+    session.begin("fill", "v1")
+    time.sleep(0.02)
+    assert session.known() == []
+
+
+def test_oldest_fields_are_evicted_with_their_results():
+    session = ScanSession(max_snippets=2)
+    scanned = scan(session, ("a", "f1", "<input name=a>"), ("b", "f2", "<input name=b>"))
+    session.begin("fill", "v1")
+    session.record(scanned, [{"handle": "f1"}, {"handle": "f2"}])
+    scan(session, ("c", "f3", "<input name=c>"))
+    assert sorted(session.known()) == ["b", "c"]
+    assert session.begin("fill", "v1") == {"b"}
+    assert session.results_for(scanned[1:]) == [{"handle": "f2"}]
@@ -0,0 +1,142 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+requests = pytest.importorskip("requests")
+
+from modelEngine.transport import LatencyHistogram, ModelServerTransport, never_sent
+
+
+class ModelServer(ThreadingHTTPServer):
+    """Answers POSTs with {"n": <request number>}, after the queued error statuses."""
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), Handler)
+        self.statuses = []
+        self.requests = 0
+        self.client_ports = set()
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}/chat"
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests += 1
+        self.server.client_ports.add(self.client_address[1])
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = json.dumps({"n": self.server.requests}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ModelServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport():
+    transport = ModelServerTransport(pool_size=2, max_retries=2, backoff_base=0)
+    yield transport
+    transport.close()
+
+
+def test_histogram_percentiles_use_bucket_bounds():
+    histogram = LatencyHistogram([0.1, 1, 10])
+    for seconds in (0.05, 0.05, 0.5, 20):
+        histogram.observe(seconds)
+    assert histogram.percentile(50) == 0.1
+    assert histogram.percentile(75) == 1
+    assert histogram.percentile(100) == 20
+    snapshot = histogram.snapshot()
+    assert snapshot["buckets"] == {"<=0.1s": 2, "<=1s": 1, "<=10s": 0, ">10s": 1}
+    assert snapshot["count"] == 4 and snapshot["max_seconds"] == 20
+
+
+def test_requests_reuse_one_pooled_connection(server, transport):
+    assert [transport.post_json(server.url, "chat", {}, {})["n"] for _ in range(3)] == [1, 2, 3]
+    assert len(server.client_ports) == 1
+    assert transport.latency_stats()["chat"]["count"] == 3
+
+
+def test_unavailable_server_is_retried(server, transport):
+    server.statuses = [503, 503]
+    assert transport.post_json(server.url, "chat", {}, {}) == {"n": 3}
+    # Only the successful attempt is timed.
+    assert transport.latency_stats()["chat"]["count"] == 1
+
+
+def test_retries_give_up_after_max_retries(server, transport):
+    server.statuses = [503, 503, 503]
+    with pytest.raises(requests.HTTPError):
+        transport.post_json(server.url, "chat", {}, {})
+    assert server.requests == 3
+
+
+def test_refused_connection_is_retried_but_a_sent_request_is_not(monkeypatch, transport):
+    attempts = []
+
+    def refuse(*args, **kwargs):
+        attempts.append(1)
+        raise requests.ConnectTimeout("connect timed out")
+
+    monkeypatch.setattr(transport.session, "post", refuse)
+    with pytest.raises(requests.ConnectTimeout):
+        transport.post_json("http://model/chat", "chat", {}, {})
+    assert len(attempts) == 3
+
+    def time_out(*args, **kwargs):
+        attempts.append(1)
+        raise requests.ReadTimeout("read timed out")
+
+    attempts.clear()
+    monkeypatch.setattr(transport.session, "post", time_out)
+    with pytest.raises(requests.ReadTimeout):
+        transport.post_json("http://model/chat", "chat", {}, {})
+    assert len(attempts) == 1
+    assert never_sent(httpx.ConnectError("refused")) and not never_sent(httpx.ReadTimeout("slow"))
+
+
+def test_async_requests_retry_and_share_a_client_per_loop(server, transport):
+    server.statuses = [503]
+
+    async def calls():
+        first = await transport.apost_json(server.url, "chat", {}, {})
+        client = transport._async_client
+        second = await transport.apost_json(server.url, "chat", {}, {})
+        assert transport._async_client is client
+        return [first["n"], second["n"]], client
+
+    results, first_client = asyncio.run(calls())
+    assert results == [2, 3]
+
+    # A new event loop gets a new client; the old one is closed.
+    async def on_a_new_loop():
+        await transport.apost_json(server.url, "chat", {}, {})
+        client = transport._async_client
+        await transport.aclose()
+        return client
+
+    second_client = asyncio.run(on_a_new_loop())
+    assert second_client is not first_client and first_client.is_closed and second_client.is_closed
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from modelEngine.vaultStore import VaultNeedsRecovery, VaultStore, vault_data_path
+
+DIM = 16
+
+
+class HashEmbeddings:
+    """Bag-of-words vectors from token hashes: similar texts land close, no model needed."""
+    model_name = "test-hash-embeddings"
+
+    def embed_documents(self, texts):
+        vectors = []
+        for text in texts:
+            vector = np.zeros(DIM, dtype=np.float32)
+            for token in text.lower().split():
+                vector[hashlib.sha256(token.encode("utf-8")).digest()[0] % DIM] += 1
+            norm = np.linalg.norm(vector)
+            vectors.append((vector / norm if norm else vector).tolist())
+        return vectors
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+RECORDS = ["Field: email address | Value: a@b.c", "Field: mobile number | Value: 98765",
+           "Field: passport number | Value: A1234567"]
+
+
+@pytest.fixture
+def folder(tmp_path):
+    return str(tmp_path / "vault")
+
+
+def open_vault(folder, **options):
+    options.setdefault("compact_threshold", 1000)
+    return VaultStore(folder, HashEmbeddings(), **options)
+
+
+def test_crud_by_id(folder):
+    vault = open_vault(folder)
+    ids = vault.add_texts(RECORDS, metadatas=[{"attribute": "email address"}, {}, {}])
+    assert vault.count() == 3
+    assert vault.get(ids[0]).page_content == RECORDS[0]
+
+    assert vault.update(ids[1], "Field: mobile number | Value: 12345")
+    assert vault.get(ids[1]).page_content.endswith("12345")
+    assert not vault.update("missing", "x")
+
+    assert vault.delete([ids[2], "missing"]) == 1
+    assert vault.get(ids[2]) is None
+    assert [doc_id for doc_id, _ in vault.list_documents()] == ids[:2]
+    found = vault.search_with_ids_batch(["passport number"], k=3)[0]
+    assert ids[2] not in [doc_id for doc_id, _, _ in found]
+    assert vault.lookup_attribute("email")[0][0] == ids[0]
+
+
+def test_changes_survive_reopening(folder):
+    vault = open_vault(folder)
+    ids = vault.add_texts(RECORDS)
+    vault.update(ids[0], "Field: email address | Value: x@y.z")
+    vault.delete([ids[1]])
+    vault.close()
+    reopened = open_vault(folder, read_only=True)
+    assert reopened.count() == 2
+    assert reopened.get(ids[0]).page_content.endswith("x@y.z")
+    assert not os.path.exists(folder + ".wal")
+
+
+def test_wal_left_by_a_crash_is_replayed(folder):
+    vault = open_vault(folder)
+    ids = vault.add_texts(RECORDS[:1])
+    vault.close()
+    with open(folder + ".wal", "w", encoding="utf-8") as wal:
+        wal.write(json.dumps({"op": "add", "texts": RECORDS[1:], "metadatas": [{}, {}], "ids": ["m", "p"]}) + "\n")
+        wal.write(json.dumps({"op": "delete", "ids": ids}) + "\n")
+        wal.write('{"op": "add", "texts": ["torn')
+
+    with pytest.raises(VaultNeedsRecovery):
+        open_vault(folder, read_only=True)
+    recovered = open_vault(folder)
+    assert sorted(doc_id for doc_id, _ in recovered.list_documents()) == ["m", "p"]
+    assert not os.path.exists(folder + ".wal")
+
+
+def test_read_only_vault_refuses_writes(folder):
+    open_vault(folder).add_texts(RECORDS[:1])
+    with pytest.raises(PermissionError):
+        open_vault(folder, read_only=True).add_texts(RECORDS[1:])
+
+
+def test_compaction_drops_dead_rows_and_keeps_records(folder):
+    vault = open_vault(folder)
+    ids = vault.add_texts(RECORDS)
+    vault.update(ids[0], "Field: email address | Value: new@b.c")
+    vault.delete([ids[1]])
+    assert vault.dead_rows == 2
+
+    vault.compact()
+    assert (vault.rows, vault.dead_rows) == (2, 0)
+    assert os.path.basename(vault_data_path(folder)).startswith("gen-")
+    assert vault.get(ids[0]).page_content.endswith("new@b.c")
+    best = vault.search_with_ids_batch(["passport number"], k=1)[0][0]
+    assert best[0] == ids[2]
+
+
+def test_writers_catch_up_on_each_other(folder):
+    first = open_vault(folder)
+    first.add_texts(RECORDS[:2], ids=["e", "m"])
+    second = open_vault(folder)
+    first.delete(["m"])
+    first.compact()
+    # The second writer opened the old generation; it moves to the new one first.
+    second.add_texts(RECORDS[2:], ids=["p"])
+    first.add_texts(["Field: city | Value: Pune"], ids=["c"])
+    reader = open_vault(folder, read_only=True)
+    for vault in (first, second, reader):
+        assert sorted(doc_id for doc_id, _ in vault.list_documents()) == ["c", "e", "p"]
+    assert reader.search_with_ids_batch(["city pune"], k=1)[0][0][0] == "c"